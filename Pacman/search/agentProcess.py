@@ -0,0 +1,282 @@
+# agentProcess.py
+# ---------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Hosts agents in long-lived worker processes.
+
+An AgentProcess stands in for an agent inside a Game.  The agent itself
+lives in a forked worker that survives from game to game, and every call
+the Game makes (registerInitialState, getAction, observationFunction,
+final) becomes one request over a pipe and one reply.  The first request
+of a game carries the whole state; later ones carry only what changed
+since the agent last saw it (see stateDelta), so a move costs a few tens
+of microseconds of IPC.
+
+Anything that interrupts the wait for a reply (in particular the
+TimeoutFunctionException raised by the Game's move timeouts) kills the
+worker outright, so a runaway agent cannot keep running; a fresh worker is
+forked from the original agent for the next game.  The worker reports the
+CPU time of every call, which the Game keeps in totalAgentCpuTimes.
+"""
+
+import random
+import time
+import traceback
+from game import Agent, Configuration, zobristKey, ZOBRIST_FOOD, ZOBRIST_CAPSULE
+
+class AgentProcessError(Exception):
+    """An agent raised an exception in its worker process."""
+    pass
+
+class AgentProcess(Agent):
+    """
+    Runs agent in a worker process.  Call close() when done with it.
+    """
+    def __init__( self, agent ):
+        Agent.__init__(self, getattr(agent, 'index', 0))
+        self.agent = agent
+        self.process = None
+        self.connection = None
+        self.lastSent = None
+        self.cpuTime = 0.0
+        self.gameCpuTime = 0.0
+        # Only offer the optional methods the agent has; Game.run checks
+        # for them with dir()
+        if 'observationFunction' in dir(agent): self.observationFunction = self._observationFunction
+        if 'final' in dir(agent): self.final = self._final
+        if 'rng' in dir(agent): self.rng = agent.rng
+        if 'moveWarningTime' in dir(agent): self.moveWarningTime = agent.moveWarningTime
+
+    def registerInitialState( self, state ):
+        self.lastSent = None
+        self.gameCpuTime = 0.0
+        settings = {'seed': random.getrandbits(64)}
+        if 'rng' in dir(self): settings['rng'] = self.rng
+        if 'moveWarningTime' in dir(self): settings['moveWarningTime'] = self.moveWarningTime
+        self._call('registerInitialState', state, settings)
+
+    def getAction( self, state ):
+        return self._call('getAction', state)
+
+    def _observationFunction( self, state ):
+        return self._call('observationFunction', state)
+
+    def _final( self, state ):
+        self._call('final', state)
+
+    def _call( self, method, state, settings=None ):
+        if self.process == None or not self.process.is_alive():
+            self._start()
+        if self.lastSent == None:
+            message = (method, 'full', state, settings)
+        else:
+            message = (method, 'delta', stateDelta(self.lastSent, state.data), settings)
+        try:
+            self.connection.send(message)
+            status, result, cpuTime = self.connection.recv()
+        except BaseException:
+            # Timed out or interrupted: the worker may still be running
+            self.kill()
+            raise
+        self.lastSent = state.data
+        self.cpuTime += cpuTime
+        self.gameCpuTime += cpuTime
+        if status == 'error':
+            raise AgentProcessError('Agent %d raised in its worker process:\n%s' % (self.index, result))
+        return result
+
+    def _start( self ):
+        import multiprocessing
+        context = multiprocessing.get_context('fork')
+        self.connection, workerConnection = context.Pipe()
+        self.process = context.Process(target=_serveAgent, args=(workerConnection, self.agent))
+        self.process.daemon = True
+        self.process.start()
+        workerConnection.close()
+        self.lastSent = None
+
+    def kill( self ):
+        "Stops the worker at once; the next call starts a fresh one."
+        if self.process != None:
+            self.process.kill()
+            self.process.join()
+            self.connection.close()
+        self.process = None
+        self.lastSent = None
+
+    def close( self ):
+        if self.process != None and self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except (OSError, EOFError):
+                pass
+            self.process.join(1)
+        self.kill()
+
+    def __getstate__( self ):
+        # Copies of the proxy start their own worker
+        state = self.__dict__.copy()
+        state['process'] = state['connection'] = state['lastSent'] = None
+        return state
+
+def _serveAgent( connection, agent ):
+    """
+    The worker's loop: answers requests until told to stop.
+    """
+    state = None
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message == None: return
+        method, kind, payload, settings = message
+        if kind == 'full':
+            state = payload
+        else:
+            state = applyStateDelta(state, payload)
+        start = time.process_time()
+        try:
+            if settings != None:
+                random.seed(settings['seed'])
+                if 'rng' in settings: agent.rng = settings['rng']
+                if 'moveWarningTime' in settings: agent.moveWarningTime = settings['moveWarningTime']
+            if method == 'registerInitialState' and 'registerInitialState' not in dir(agent):
+                result = None
+            else:
+                # The agent gets its own copy, as in Game.run
+                result = getattr(agent, method)(agentCopy(state))
+            status = 'ok'
+        except Exception:
+            result, status = traceback.format_exc(), 'error'
+        connection.send((status, result, time.process_time() - start))
+
+def stateDelta( old, new ):
+    """
+    Describes how GameStateData new differs from old compactly enough to
+    send every move: the agents that changed, the food cells eaten or added,
+    and the handful of scalar fields.
+    """
+    agents = []
+    for index in range(len(new.agentStates)):
+        a, b = old.agentStates[index], new.agentStates[index]
+        if a.configuration != b.configuration or a.scaredTimer != b.scaredTimer or \
+           a.isPacman != b.isPacman or a.numCarrying != b.numCarrying or a.numReturned != b.numReturned:
+            if b.configuration == None: configuration = None
+            else: configuration = (b.configuration.pos, b.configuration.direction)
+            agents.append((index, configuration, b.scaredTimer, b.isPacman, b.numCarrying, b.numReturned))
+    eaten = added = ()
+    if old.food.count() != new.food.count() or old.food.asList() != new.food.asList():
+        oldFood, newFood = set(old.food.asList()), set(new.food.asList())
+        eaten, added = list(oldFood - newFood), list(newFood - oldFood)
+    capsules = None
+    if old.capsules != new.capsules: capsules = new.capsules
+    return (agents, eaten, added, capsules, new.score, new.scoreChange, new._win, new._lose,
+            new._eaten, new._agentMoved, new._foodEaten, new._foodAdded, new._capsuleEaten)
+
+def applyStateDelta( state, delta ):
+    """
+    Returns the GameState that delta (see stateDelta) describes, relative
+    to state.  The successor's hash is derived from state's, as
+    GameStateData.rehash does for a single move.
+    """
+    agents, eaten, added, capsules, score, scoreChange, win, lose, agentsEaten, \
+        agentMoved, foodEaten, foodAdded, capsuleEaten = delta
+    old = state.data
+    hash(old) # Computes old._hash if it has none yet
+    successor = state.__class__(state)
+    data = successor.data
+    for index, configuration, scaredTimer, isPacman, numCarrying, numReturned in agents:
+        agentState = data.agentStates[index]
+        if configuration == None: agentState.configuration = None
+        else: agentState.configuration = Configuration(*configuration)
+        agentState.scaredTimer = scaredTimer
+        agentState.isPacman = isPacman
+        agentState.numCarrying = numCarrying
+        agentState.numReturned = numReturned
+    if eaten or added:
+        data.food = data.food.copy()
+        for x, y in eaten: data.food[x][y] = False
+        for x, y in added: data.food[x][y] = True
+    if capsules != None: data.capsules = capsules[:]
+    data.score, data.scoreChange, data._win, data._lose = score, scoreChange, win, lose
+    data._eaten = agentsEaten
+
+    # rehash covers the score and the agents; the food and capsules that
+    # changed over the moves since state are folded in here
+    data.rehash(old._hash, old._agentKeys, old.score)
+    for x, y in list(eaten) + list(added):
+        data._hash ^= zobristKey(ZOBRIST_FOOD, x, y)
+    if capsules != None:
+        for x, y in set(old.capsules) ^ set(data.capsules):
+            data._hash ^= zobristKey(ZOBRIST_CAPSULE, x, y)
+    data._agentMoved, data._foodEaten, data._foodAdded, data._capsuleEaten = agentMoved, foodEaten, foodAdded, capsuleEaten
+    return successor
+
+def agentCopy( state ):
+    """
+    A copy of state for an agent to keep or edit, which unlike
+    state.__class__(state) keeps the flags of the last move (win, lose,
+    what was eaten and who moved) and the hash.
+    """
+    copy = state.__class__(state)
+    data, old = copy.data, state.data
+    data.scoreChange, data._win, data._lose = old.scoreChange, old._win, old._lose
+    data._agentMoved, data._foodEaten, data._foodAdded, data._capsuleEaten = \
+        old._agentMoved, old._foodEaten, old._foodAdded, old._capsuleEaten
+    data._hash, data._agentKeys = old._hash, old._agentKeys
+    return copy
+
+def measureOverhead( layoutName='mediumClassic', numMoves=2000 ):
+    """
+    Returns the time per move that hosting an agent in a worker process
+    adds, in seconds, measured with a trivial agent on the states of a
+    game with random agents.
+    """
+    import layout, pacman
+    from ghostAgents import RandomGhost
+    lay = layout.getLayout(layoutName)
+    agents = [RandomGhost(0)] + [RandomGhost(i) for i in range(1, lay.getNumGhosts() + 1)]
+    rng = random.Random(0)
+    for agent in agents: agent.rng = rng
+    states = []
+    while len(states) < numMoves:
+        state = pacman.GameState()
+        state.initialize(lay, lay.getNumGhosts())
+        while not (state.isWin() or state.isLose()) and len(states) < numMoves:
+            for agent in agents:
+                states.append(state.deepCopy())
+                state = state.generateSuccessor(agent.index, agent.getAction(state))
+                if state.isWin() or state.isLose(): break
+    agent = _FirstLegalAgent()
+    proxy = AgentProcess(agent)
+    try:
+        times = []
+        for player in [agent, proxy]:
+            if 'registerInitialState' in dir(player): player.registerInitialState(states[0])
+            start = time.perf_counter()
+            for state in states:
+                if state.data.agentStates[0].configuration == None: continue
+                player.getAction(state)
+            times.append(time.perf_counter() - start)
+    finally:
+        proxy.close()
+    return (times[1] - times[0]) / len(states)
+
+class _FirstLegalAgent(Agent):
+    def getAction( self, state ):
+        return state.getLegalActions(self.index)[0]
+
+if __name__ == '__main__':
+    print('Per-move overhead of an agent process: %.1f us' % (measureOverhead() * 1e6))
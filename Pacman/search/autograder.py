@@ -79,6 +79,45 @@ def readCommand(argv):
                     dest = 'noGraphics',
                     action = 'store_true',
                     help = 'No graphics display for pacman games.')
+    parser.add_option('--jobs', '-j',
+                    dest = 'jobs',
+                    type = 'int',
+                    default = 1,
+                    help = 'Run up to this many test cases at once, each in a process of its own (implies --no-graphics).')
+    parser.add_option('--force',
+                    dest = 'force',
+                    action = 'store_true',
+                    default = False,
+                    help = 'Rerun every test case, even those whose results are cached from an earlier run.')
+    parser.add_option('--perf-baseline',
+                    dest = 'perfBaseline',
+                    default = None,
+                    help = 'Measure the wall time, peak memory and nodes expanded of each test case and fail on regressions against this baseline JSON file (implies --force, runs serially).  Memory is measured on a second, traced run of every test, so this takes about five times as long as a normal run.')
+    parser.add_option('--perf-update',
+                    dest = 'perfUpdate',
+                    action = 'store_true',
+                    default = False,
+                    help = 'With --perf-baseline, write this run\'s measurements to the baseline instead of checking them.')
+    parser.add_option('--time-tolerance',
+                    dest = 'timeTolerance',
+                    type = 'float',
+                    default = 2.0,
+                    help = 'Factor the wall time of a test case may grow by over the baseline (default %default).')
+    parser.add_option('--memory-tolerance',
+                    dest = 'memoryTolerance',
+                    type = 'float',
+                    default = 1.25,
+                    help = 'Factor the peak memory of a test case may grow by over the baseline (default %default).')
+    parser.add_option('--expanded-tolerance',
+                    dest = 'expandedTolerance',
+                    type = 'float',
+                    default = 1.0,
+                    help = 'Factor the nodes expanded by a test case may grow by over the baseline (default %default).')
+    parser.add_option('--test-timeout',
+                    dest = 'testTimeout',
+                    type = 'float',
+                    default = 1800,
+                    help = 'With --jobs, seconds a single test case may run before it is stopped.')
     (options, args) = parser.parse_args(argv)
     return options
 
@@ -201,8 +240,8 @@ def runTest(testName, moduleDict, printTestCase=False, display=None):
     for module in moduleDict:
         setattr(sys.modules[__name__], module, moduleDict[module])
 
-    testDict = testParser.TestParser(testName + ".test").parse()
-    solutionDict = testParser.TestParser(testName + ".solution").parse()
+    testDict = testParser.parseFile(testName + ".test")
+    solutionDict = testParser.parseFile(testName + ".solution")
     test_out_file = os.path.join('%s.test_output' % testName)
     testDict['test_out_file'] = test_out_file
     testClass = getattr(projectTestClasses, testDict['class'])
@@ -222,7 +261,7 @@ def runTest(testName, moduleDict, printTestCase=False, display=None):
 # returns all the tests you need to run in order to run question
 def getDepends(testParser, testRoot, question):
     allDeps = [question]
-    questionDict = testParser.TestParser(os.path.join(testRoot, question, 'CONFIG')).parse()
+    questionDict = testParser.parseFile(os.path.join(testRoot, question, 'CONFIG'))
     if 'depends' in questionDict:
         depends = questionDict['depends'].split()
         for d in depends:
@@ -230,9 +269,27 @@ def getDepends(testParser, testRoot, question):
             allDeps = getDepends(testParser, testRoot, d) + allDeps
     return allDeps
 
+# results of earlier runs, kept in the test root
+RESULT_CACHE_FILE = '.graded-tests.pickle'
+
+# the source files of the project modules loaded so far, other than the
+# student's and the test classes (codePaths): the code the tests run
+# besides theirs, which the result cache must also see unchanged
+def getSupportPaths(codePaths):
+    codeDir = os.path.dirname(os.path.abspath(codePaths['projectTestClasses']))
+    ownPaths = set(os.path.abspath(path) for path in codePaths.values())
+    paths = set()
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if path == None or not path.endswith('.py'): continue
+        path = os.path.abspath(path)
+        if os.path.dirname(path) == codeDir and path not in ownPaths:
+            paths.add(path)
+    return sorted(paths)
+
 # get list of questions to grade
 def getTestSubdirs(testParser, testRoot, questionToGrade):
-    problemDict = testParser.TestParser(os.path.join(testRoot, 'CONFIG')).parse()
+    problemDict = testParser.parseFile(os.path.join(testRoot, 'CONFIG'))
     if questionToGrade != None:
         questions = getDepends(testParser, testRoot, questionToGrade)
         if len(questions) > 1:
@@ -246,13 +303,35 @@ def getTestSubdirs(testParser, testRoot, questionToGrade):
 # evaluate student code
 def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MAP,
              edxOutput=False, muteOutput=False, gsOutput=False,
-            printTestCase=False, questionToGrade=None, display=None):
+            printTestCase=False, questionToGrade=None, display=None,
+            jobs=1, testTimeout=1800, codePaths=None, force=False, performance=None):
     # imports of testbench code.  note that the testClasses import must follow
     # the import of student code due to dependencies
     import testParser
     import testClasses
     for module in moduleDict:
         setattr(sys.modules[__name__], module, moduleDict[module])
+    # Parsed files are kept between runs (see testParser.ParseCache)
+    testParser.loadCache(os.path.join(testRoot, testParser.CACHE_FILE))
+
+    # With several jobs, test cases start running in worker processes as
+    # soon as they are loaded, and each question replays their results in
+    # order when it is graded.  Tests of a question whose prerequisites
+    # fail still run, but their results are never replayed.
+    # Tests measured into a PerformanceLog all run, one at a time, in
+    # this process
+    if performance != None:
+        jobs, force = 1, True
+    pool = None
+    if jobs > 1:
+        pool = grading.TestPool(jobs, testTimeout)
+    # Tests whose files, and the code they run, are unchanged since an
+    # earlier run replay its results (codePaths maps each module in
+    # moduleDict to its source file; without it nothing is cached)
+    results = None
+    if codePaths != None and not generateSolutions:
+        results = grading.ResultCache(os.path.join(testRoot, RESULT_CACHE_FILE), force)
+        supportPaths = getSupportPaths(codePaths)
 
     questions = []
     questionDicts = {}
@@ -263,7 +342,7 @@ def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MA
             continue
 
         # create a question object
-        questionDict = testParser.TestParser(os.path.join(subdir_path, 'CONFIG')).parse()
+        questionDict = testParser.parseFile(os.path.join(subdir_path, 'CONFIG'))
         questionClass = getattr(testClasses, questionDict['class'])
         question = questionClass(questionDict, display)
         questionDicts[q] = questionDict
@@ -275,31 +354,44 @@ def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MA
             test_file = os.path.join(subdir_path, '%s.test' % t)
             solution_file = os.path.join(subdir_path, '%s.solution' % t)
             test_out_file = os.path.join(subdir_path, '%s.test_output' % t)
-            testDict = testParser.TestParser(test_file).parse()
+            testDict = testParser.parseFile(test_file)
             if testDict.get("disabled", "false").lower() == "true":
                 continue
             testDict['test_out_file'] = test_out_file
             testClass = getattr(projectTestClasses, testDict['class'])
             testCase = testClass(question, testDict)
-            def makefun(testCase, solution_file):
+            def makefun(testCase, testDict, solution_file):
                 if generateSolutions:
                     # write solution file to disk
                     return lambda grades: testCase.writeSolution(moduleDict, solution_file)
                 else:
                     # read in solution dictionary and pass as an argument
-                    testDict = testParser.TestParser(test_file).parse()
-                    solutionDict = testParser.TestParser(solution_file).parse()
+                    solutionDict = testParser.parseFile(solution_file)
                     if printTestCase:
                         return lambda grades: printTest(testDict, solutionDict) or testCase.execute(grades, moduleDict, solutionDict)
                     else:
                         return lambda grades: testCase.execute(grades, moduleDict, solutionDict)
-            question.addTestCase(testCase, makefun(testCase, solution_file))
+            thunk = makefun(testCase, testDict, solution_file)
+            if performance != None:
+                thunk = performance.wrap(test_file, testCase, thunk)
+            if results != None:
+                modules = testCase.studentModules
+                if modules == None: modules = sorted([m for m in codePaths if m != 'projectTestClasses'])
+                paths = [test_file, solution_file] + supportPaths + \
+                        [codePaths[m] for m in ['projectTestClasses'] + modules if m in codePaths]
+                thunk = results.wrap(test_file, results.digest(paths), thunk, pool)
+            elif pool != None:
+                thunk = pool.submit(test_file, thunk)
+            question.addTestCase(testCase, thunk)
 
         # Note extra function is necessary for scoping reasons
         def makefun(question):
             return lambda grades: question.execute(grades)
         setattr(sys.modules[__name__], q, makefun(question))
         questions.append((q, question.getMaxPoints()))
+    testParser.saveCache()
+    if results != None and results.replayed > 0:
+        print('Replaying %d unchanged test cases from %s (--force reruns them)' % (results.replayed, results.path))
 
     grades = grading.Grades(projectParams.PROJECT_NAME, questions,
                             gsOutput=gsOutput, edxOutput=edxOutput, muteOutput=muteOutput)
@@ -308,14 +400,18 @@ def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MA
             for prereq in questionDicts[q].get('depends', '').split():
                 grades.addPrereq(q, prereq)
 
-    grades.grade(sys.modules[__name__], bonusPic = projectParams.BONUS_PIC)
+    try:
+        grades.grade(sys.modules[__name__], bonusPic = projectParams.BONUS_PIC)
+    finally:
+        if pool != None: pool.close()
+        if results != None: results.save()
     return grades.points
 
 
 
 def getDisplay(graphicsByDefault, options=None):
     graphics = graphicsByDefault
-    if options is not None and options.noGraphics:
+    if options is not None and (options.noGraphics or options.jobs > 1):
         graphics = False
     if graphics:
         try:
@@ -342,12 +438,22 @@ if __name__ == '__main__':
     # moduleDict = loadModuleDict(moduleCodeDict)
 
     moduleDict = {}
+    modulePaths = {}
     for cp in codePaths:
         moduleName = re.match('.*?([^/]*)\.py', cp).group(1)
-        moduleDict[moduleName] = loadModuleFile(moduleName, os.path.join(options.codeRoot, cp))
+        modulePaths[moduleName] = os.path.join(options.codeRoot, cp)
+        moduleDict[moduleName] = loadModuleFile(moduleName, modulePaths[moduleName])
     moduleName = re.match('.*?([^/]*)\.py', options.testCaseCode).group(1)
-    moduleDict['projectTestClasses'] = loadModuleFile(moduleName, os.path.join(options.codeRoot, options.testCaseCode))
+    modulePaths['projectTestClasses'] = os.path.join(options.codeRoot, options.testCaseCode)
+    moduleDict['projectTestClasses'] = loadModuleFile(moduleName, modulePaths['projectTestClasses'])
+
 
+    performance = None
+    if options.perfBaseline != None:
+        if not options.perfUpdate and not os.path.exists(options.perfBaseline):
+            print('No performance baseline at %s; record one with --perf-update' % options.perfBaseline)
+            sys.exit(2)
+        performance = grading.PerformanceLog()
 
     if options.runTest != None:
         runTest(options.runTest, moduleDict, printTestCase=options.printTestCase, display=getDisplay(True, options))
@@ -355,4 +461,15 @@ if __name__ == '__main__':
         evaluate(options.generateSolutions, options.testRoot, moduleDict,
             gsOutput=options.gsOutput,
             edxOutput=options.edxOutput, muteOutput=options.muteOutput, printTestCase=options.printTestCase,
-            questionToGrade=options.gradeQuestion, display=getDisplay(options.gradeQuestion!=None, options))
+            questionToGrade=options.gradeQuestion, display=getDisplay(options.gradeQuestion!=None, options),
+            jobs=options.jobs, testTimeout=options.testTimeout, codePaths=modulePaths, force=options.force,
+            performance=performance)
+        if performance != None:
+            if options.perfUpdate:
+                performance.save(options.perfBaseline)
+                print('\nPerformance baseline for %d test cases written to %s' % (len(performance.tests), options.perfBaseline))
+            else:
+                tolerances = {'seconds': options.timeTolerance, 'peakBytes': options.memoryTolerance,
+                              'expanded': options.expandedTolerance}
+                if not performance.report(options.perfBaseline, tolerances):
+                    sys.exit(1)
@@ -0,0 +1,346 @@
+# batchGame.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A lockstep simulator that plays many classic Pacman games at once.
+
+BatchGameState holds N games on the same layout as NumPy arrays (agent
+positions, directions and scared timers, food and capsule masks, scores)
+and applies one agent's move in every game with a handful of vectorized
+operations.  The rules are exactly those of PacmanRules and GhostRules in
+pacman.py; verifyAgainstGameState replays random traces through both and
+checks that they agree after every move.
+
+Actions are encoded as indices into ACTIONS.  Positions are kept in
+half-cell units so that scared ghosts (which move at half speed) stay on
+an integer lattice.
+
+To benchmark and verify from the command line:
+
+> python batchGame.py -l mediumClassic -n 1000
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('batchGame.py requires NumPy (pip install numpy)')
+
+from game import Directions, Actions
+import pacman
+import sampling
+
+# Same order as Actions._directionsAsList
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_INDEX = dict([(a, i) for i, a in enumerate(ACTIONS)])
+STOP = ACTION_INDEX[Directions.STOP]
+DX = np.array([Actions.directionToVector(a)[0] for a in ACTIONS], dtype=np.int64)
+DY = np.array([Actions.directionToVector(a)[1] for a in ACTIONS], dtype=np.int64)
+REVERSE = np.array([ACTION_INDEX[Directions.REVERSE[a]] for a in ACTIONS], dtype=np.int64)
+
+class BatchGameState:
+    """
+    N games of classic Pacman on one layout, advanced in lockstep.  Games that
+    have been won or lost are frozen; moves given for them are ignored.
+    """
+
+    def __init__( self, layout, numGames, numGhostAgents=1000 ):
+        self.layout = layout
+        self.numGames = numGames
+        self.width, self.height = layout.width, layout.height
+        self.walls = np.array(layout.walls.data, dtype=bool)
+
+        starts = []
+        numGhosts = 0
+        for isPacman, pos in layout.agentPositions:
+            if not isPacman:
+                if numGhosts == numGhostAgents: continue
+                numGhosts += 1
+            starts.append((2 * pos[0], 2 * pos[1]))
+        self.numAgents = len(starts)
+        self.start = np.array(starts, dtype=np.int64)
+
+        n, a = numGames, self.numAgents
+        self.pos = np.tile(self.start, (n, 1, 1))
+        self.direction = np.full((n, a), STOP, dtype=np.int64)
+        self.scaredTimer = np.zeros((n, a), dtype=np.int64)
+        self.food = np.tile(np.array(layout.food.data, dtype=bool).ravel(), (n, 1))
+        self.numFood = self.food.sum(axis=1)
+        capsules = np.zeros(self.width * self.height, dtype=bool)
+        for x, y in layout.capsules:
+            capsules[x * self.height + y] = True
+        self.capsules = np.tile(capsules, (n, 1))
+        self.score = np.zeros(n, dtype=np.int64)
+        self.win = np.zeros(n, dtype=bool)
+        self.lose = np.zeros(n, dtype=bool)
+
+    def getActive( self ):
+        "Returns a boolean array marking the games that are still running."
+        return ~(self.win | self.lose)
+
+    def getLegalActions( self, agentIndex ):
+        """
+        Returns an (N, len(ACTIONS)) boolean array of the legal actions of
+        the agent in every game, following PacmanRules.getLegalActions and
+        GhostRules.getLegalActions.
+        """
+        n = self.numGames
+        rows = np.arange(n)
+        x2, y2 = self.pos[:, agentIndex, 0], self.pos[:, agentIndex, 1]
+        onGrid = (x2 % 2 == 0) & (y2 % 2 == 0)
+        x, y = x2 // 2, y2 // 2
+
+        legal = np.zeros((n, len(ACTIONS)), dtype=bool)
+        for action in range(len(ACTIONS)):
+            legal[:, action] = ~self.walls[x + DX[action], y + DY[action]]
+        # In between grid points, all agents must continue straight
+        straight = np.zeros_like(legal)
+        straight[rows, self.direction[:, agentIndex]] = True
+        legal = np.where(onGrid[:, None], legal, straight)
+
+        if agentIndex > 0:
+            legal[:, STOP] = False
+            reverse = REVERSE[self.direction[:, agentIndex]]
+            canTurn = legal.sum(axis=1) > 1
+            legal[rows[canTurn], reverse[canTurn]] = False
+        return legal
+
+    def applyActions( self, agentIndex, actions ):
+        """
+        Moves the agent in every active game.  actions is an array of N
+        action indices; entries for finished games are ignored.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        games = np.nonzero(self.getActive())[0]
+        actions = actions[games]
+        legal = self.getLegalActions(agentIndex)[games, actions]
+        if not legal.all():
+            bad = games[~legal][0]
+            raise Exception('Illegal action %s in game %d' % (ACTIONS[actions[~legal][0]], bad))
+
+        scoreChange = np.zeros(len(games), dtype=np.int64)
+        if agentIndex == 0:
+            # PacmanRules.applyAction
+            self.pos[games, 0, 0] += 2 * DX[actions]
+            self.pos[games, 0, 1] += 2 * DY[actions]
+            moved = actions != STOP
+            self.direction[games[moved], 0] = actions[moved]
+
+            # PacmanRules.consume
+            cells = (self.pos[games, 0, 0] // 2) * self.height + self.pos[games, 0, 1] // 2
+            ate = self.food[games, cells]
+            scoreChange += 10 * ate
+            self.food[games[ate], cells[ate]] = False
+            self.numFood[games] -= ate
+            won = ate & (self.numFood[games] == 0) & ~self.lose[games]
+            scoreChange += 500 * won
+            self.win[games[won]] = True
+            capsule = self.capsules[games, cells]
+            self.capsules[games[capsule], cells[capsule]] = False
+            self.scaredTimer[games[capsule], 1:] = pacman.SCARED_TIME
+
+            scoreChange -= pacman.TIME_PENALTY
+            for ghost in range(1, self.numAgents):
+                self._checkDeath(games, ghost, scoreChange)
+        else:
+            # GhostRules.applyAction: scared ghosts move at half speed
+            speed = np.where(self.scaredTimer[games, agentIndex] > 0, 1, 2)
+            self.pos[games, agentIndex, 0] += speed * DX[actions]
+            self.pos[games, agentIndex, 1] += speed * DY[actions]
+            self.direction[games, agentIndex] = actions
+
+            # GhostRules.decrementTimer snaps ghosts back onto the grid
+            timer = self.scaredTimer[games, agentIndex]
+            snap = games[timer == 1]
+            self.pos[snap, agentIndex] = (self.pos[snap, agentIndex] + 1) // 2 * 2
+            self.scaredTimer[games, agentIndex] = np.maximum(0, timer - 1)
+
+            self._checkDeath(games, agentIndex, scoreChange)
+        self.score[games] += scoreChange
+
+    def _checkDeath( self, games, ghost, scoreChange ):
+        """
+        GhostRules.checkDeath and collide for one ghost.  COLLISION_TOLERANCE
+        is 0.7 cells, i.e. at most one half-cell step apart.
+        """
+        delta = np.abs(self.pos[games, ghost] - self.pos[games, 0]).sum(axis=1)
+        collided = delta * 0.5 <= pacman.COLLISION_TOLERANCE
+        scared = self.scaredTimer[games, ghost] > 0
+
+        eaten = collided & scared
+        scoreChange += 200 * eaten
+        self.pos[games[eaten], ghost] = self.start[ghost]
+        self.direction[games[eaten], ghost] = STOP
+        self.scaredTimer[games[eaten], ghost] = 0
+
+        killed = collided & ~scared & ~self.win[games]
+        scoreChange -= 500 * killed
+        self.lose[games[killed]] = True
+
+    def getPositions( self, game ):
+        "Returns the agents' positions in one game, as GameState reports them."
+        return [(x / 2.0, y / 2.0) for x, y in self.pos[game]]
+
+########################
+# Vectorized policies #
+########################
+
+def randomPolicy( rng, includeStop=True ):
+    """
+    Returns a policy choosing uniformly among the legal actions in each game,
+    like RandomGhost (or a random Pacman).
+    """
+    def policy( batch, agentIndex ):
+        legal = batch.getLegalActions(agentIndex)
+        if not includeStop and agentIndex == 0:
+            onlyStop = legal.sum(axis=1) == 1
+            legal[~onlyStop, STOP] = False
+        return (rng.random(legal.shape) * legal).argmax(axis=1)
+    return policy
+
+def directionalGhostPolicy( rng, prob_attack=0.8, prob_scaredFlee=0.8 ):
+    """
+    Returns a policy sampling from DirectionalGhost's distribution: the
+    actions moving closest to Pacman (or furthest, when scared) share
+    prob_attack (prob_scaredFlee) and the rest is spread over all legal
+    actions.
+    """
+    def policy( batch, agentIndex ):
+        legal = batch.getLegalActions(agentIndex)
+        scared = batch.scaredTimer[:, agentIndex] > 0
+        speed = np.where(scared, 1, 2)[:, None]
+        newX = batch.pos[:, agentIndex, 0, None] + speed * DX[None, :]
+        newY = batch.pos[:, agentIndex, 1, None] + speed * DY[None, :]
+        distance = np.abs(newX - batch.pos[:, 0, 0, None]) + np.abs(newY - batch.pos[:, 0, 1, None])
+
+        big = np.iinfo(np.int64).max
+        nearest = np.where(legal, distance, big).min(axis=1)
+        furthest = np.where(legal, distance, -1).max(axis=1)
+        bestScore = np.where(scared, furthest, nearest)
+        best = legal & (distance == bestScore[:, None])
+        bestProb = np.where(scared, prob_scaredFlee, prob_attack)[:, None]
+
+        dist = best * (bestProb / np.maximum(best.sum(axis=1), 1)[:, None])
+        dist = dist + legal * ((1 - bestProb) / np.maximum(legal.sum(axis=1), 1)[:, None])
+        return sampling.sampleRows(dist, rng)
+    return policy
+
+def playBatch( batch, pacmanPolicy, ghostPolicy, maxMoves=1000 ):
+    """
+    Plays every game in batch until it ends or each agent has moved maxMoves
+    times.  Returns the number of individual agent moves simulated.
+    """
+    moves = 0
+    for _ in range(maxMoves):
+        for agentIndex in range(batch.numAgents):
+            active = batch.getActive()
+            if not active.any(): return moves
+            policy = pacmanPolicy if agentIndex == 0 else ghostPolicy
+            batch.applyActions(agentIndex, policy(batch, agentIndex))
+            moves += int(active.sum())
+    return moves
+
+################
+# Verification #
+################
+
+def verifyAgainstGameState( layout, numGames=20, maxMoves=300, seed=0 ):
+    """
+    Plays numGames random traces through a BatchGameState and, move for move,
+    through pacman.GameState, and raises an exception at the first
+    difference in positions, directions, scared timers, food, capsules,
+    score or outcome.  Returns the number of moves compared.
+    """
+    rng = np.random.default_rng(seed)
+    batch = BatchGameState(layout, numGames)
+    states = []
+    for g in range(numGames):
+        state = pacman.GameState()
+        state.initialize(layout, batch.numAgents - 1)
+        states.append(state)
+    policy = randomPolicy(rng)
+
+    compared = 0
+    for _ in range(maxMoves):
+        for agentIndex in range(batch.numAgents):
+            active = batch.getActive()
+            if not active.any(): return compared
+            actions = policy(batch, agentIndex)
+            for g in np.nonzero(active)[0]:
+                legal = [ACTIONS[a] for a in np.nonzero(batch.getLegalActions(agentIndex)[g])[0]]
+                expected = states[g].getLegalActions(agentIndex)
+                if sorted(legal) != sorted(expected):
+                    raise Exception('Game %d: legal actions %s, expected %s' % (g, legal, expected))
+                states[g] = states[g].generateSuccessor(agentIndex, ACTIONS[actions[g]])
+            batch.applyActions(agentIndex, actions)
+            for g in np.nonzero(active)[0]:
+                _compare(batch, g, states[g])
+                compared += 1
+    return compared
+
+def _compare( batch, g, state ):
+    data = state.data
+    agentStates = data.agentStates
+    problems = []
+    if batch.getPositions(g) != [s.getPosition() for s in agentStates]:
+        problems.append('positions %s vs %s' % (batch.getPositions(g), [s.getPosition() for s in agentStates]))
+    if [ACTIONS[d] for d in batch.direction[g]] != [s.getDirection() for s in agentStates]:
+        problems.append('directions')
+    if list(batch.scaredTimer[g]) != [s.scaredTimer for s in agentStates]:
+        problems.append('scared timers')
+    food = batch.food[g].reshape(batch.width, batch.height)
+    if food.tolist() != [list(column) for column in data.food.data]:
+        problems.append('food')
+    capsules = sorted([divmod(int(c), batch.height) for c in np.nonzero(batch.capsules[g])[0]])
+    if capsules != sorted(data.capsules):
+        problems.append('capsules')
+    if batch.score[g] != data.score:
+        problems.append('score %d vs %d' % (batch.score[g], data.score))
+    if batch.win[g] != state.isWin() or batch.lose[g] != state.isLose():
+        problems.append('outcome')
+    if problems:
+        raise Exception('Game %d differs from GameState: %s' % (g, ', '.join(problems)))
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    import time
+    import layout as layoutModule
+    parser = OptionParser('python batchGame.py <options>')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic')
+    parser.add_option('-n', '--numGames', dest='numGames', type='int', default=1000)
+    parser.add_option('-g', '--ghosts', dest='ghosts', default='DirectionalGhost',
+                      help='RandomGhost or DirectionalGhost')
+    parser.add_option('--seed', dest='seed', type='int', default=0)
+    parser.add_option('--verify', dest='verify', type='int', default=20,
+                      help='Number of random traces to check against GameState (0 to skip)')
+    options, _ = parser.parse_args()
+
+    lay = layoutModule.getLayout(options.layout)
+    if lay == None: raise Exception('The layout ' + options.layout + ' cannot be found')
+    if options.verify > 0:
+        compared = verifyAgainstGameState(lay, options.verify, seed=options.seed)
+        print('Verified %d moves against pacman.GameState' % compared)
+
+    rng = np.random.default_rng(options.seed)
+    if options.ghosts == 'RandomGhost':
+        ghostPolicy = randomPolicy(rng)
+    else:
+        ghostPolicy = directionalGhostPolicy(rng)
+    batch = BatchGameState(lay, options.numGames)
+    start = time.time()
+    moves = playBatch(batch, randomPolicy(rng, includeStop=False), ghostPolicy)
+    elapsed = time.time() - start
+    print('Played %d games (%d moves) in %.2f seconds: %.0f moves per minute' %
+          (options.numGames, moves, elapsed, moves / elapsed * 60))
+    print('Average Score: %.1f' % batch.score.mean())
+    print('Win Rate:      %d/%d' % (batch.win.sum(), options.numGames))
@@ -14,50 +14,103 @@
 
 import search
 import random
+import os
+import mmap
 
 # Module Classes
 
-class EightPuzzleState:
-    """
-    The Eight Puzzle is described in the course textbook on
-    page 64.
+# A puzzle on an n x n board is packed into one integer, a fixed number of
+# bits per cell (enough for the largest tile) in row-major order, with the
+# blank as 0.  Moves are looked up in tables indexed by the blank's cell,
+# which PuzzleGeometry keeps for each board size.
+MOVES = ['up', 'down', 'left', 'right']
+# Where each move takes the blank, as (row, column) offsets
+MOVE_OFFSETS = {'up': (-1, 0), 'down': (1, 0), 'left': (0, -1), 'right': (0, 1)}
 
-    This class defines the mechanics of the puzzle itself.  The
-    task of recasting this puzzle as a search problem is left to
-    the EightPuzzleSearchProblem class.
+class PuzzleGeometry:
+    """
+    The packing and move tables of sliding puzzles of one size:
+    legalMoves[blank] lists the moves (in legalMoves order) and
+    targets[blank][move] is the cell the blank moves to.  neighbors[cell]
+    lists the cells next to a cell.
+    """
+    def __init__( self, size ):
+        self.size = size
+        self.cells = size * size
+        self.bits = (self.cells - 1).bit_length()
+        self.mask = (1 << self.bits) - 1
+        self.goal = sum([number << (self.bits * number) for number in range(self.cells)])
+        self.legalMoves, self.targets, self.neighbors = [], [], []
+        for blank in range(self.cells):
+            row, col = divmod(blank, size)
+            moves, targets = [], {}
+            for move in MOVES:
+                newrow, newcol = row + MOVE_OFFSETS[move][0], col + MOVE_OFFSETS[move][1]
+                if 0 <= newrow < size and 0 <= newcol < size:
+                    moves.append(move)
+                    targets[move] = size * newrow + newcol
+            self.legalMoves.append(tuple(moves))
+            self.targets.append(targets)
+            self.neighbors.append(tuple(targets.values()))
+
+    def move( self, packed, blank, target ):
+        "The packed puzzle after the blank at cell blank moves to cell target."
+        # The blank is 0, so the tile just changes cells
+        bits = self.bits
+        tile = (packed >> (bits * target)) & self.mask
+        return packed - (tile << (bits * target)) + (tile << (bits * blank))
+
+_GEOMETRIES = {}
+
+def getGeometry( size ):
+    if size not in _GEOMETRIES: _GEOMETRIES[size] = PuzzleGeometry(size)
+    return _GEOMETRIES[size]
+
+# The eight puzzle's, used by its solution table below
+BITS = getGeometry(3).bits
+CELL_MASK = getGeometry(3).mask
+GOAL = getGeometry(3).goal
+LEGAL_MOVES, TARGETS = getGeometry(3).legalMoves, getGeometry(3).targets
+
+class SlidingPuzzleState:
+    """
+    A sliding puzzle on an n x n board: the eight puzzle (3 x 3), the
+    fifteen puzzle (4 x 4), the twenty-four puzzle (5 x 5) and so on.  The
+    goal has the blank in the top left corner and the tiles in order after
+    it.
     """
 
     def __init__( self, numbers ):
         """
-          Constructs a new eight puzzle from an ordering of numbers.
-
-        numbers: a list of integers from 0 to 8 representing an
-          instance of the eight puzzle.  0 represents the blank
-          space.  Thus, the list
-
-            [1, 0, 2, 3, 4, 5, 6, 7, 8]
-
-          represents the eight puzzle:
-            -------------
-            | 1 |   | 2 |
-            -------------
-            | 3 | 4 | 5 |
-            -------------
-            | 6 | 7 | 8 |
-            ------------
-
-        The configuration of the puzzle is stored in a 2-dimensional
-        list (a list of lists) 'cells'.
+          Constructs a new puzzle from an ordering of numbers: a list of
+        n * n integers from 0 to n * n - 1, row by row, with 0 for the
+        blank (see EightPuzzleState).
+
+        The configuration of the puzzle is packed into the integer
+        'packed' (see PuzzleGeometry), and the blank's cell (row-major)
+        is kept in 'blank'.  'cells' and 'blankLocation' give them as a
+        2-dimensional list and a (row, column) pair.
         """
-        self.cells = []
-        numbers = numbers[:] # Make a copy so as not to cause side-effects.
-        numbers.reverse()
-        for row in range( 3 ):
-            self.cells.append( [] )
-            for col in range( 3 ):
-                self.cells[row].append( numbers.pop() )
-                if self.cells[row][col] == 0:
-                    self.blankLocation = row, col
+        size = int(round(len(numbers) ** 0.5))
+        if size * size != len(numbers) or sorted(numbers) != list(range(len(numbers))):
+            raise Exception("Not a sliding puzzle: %s" % str(numbers))
+        self.geometry = getGeometry(size)
+        bits = self.geometry.bits
+        self.packed = 0
+        for i, number in enumerate(numbers):
+            self.packed |= number << (bits * i)
+            if number == 0:
+                self.blank = i
+
+    def _getCells( self ):
+        size, bits, mask = self.geometry.size, self.geometry.bits, self.geometry.mask
+        return [[(self.packed >> (bits * (size * row + col))) & mask for col in range(size)]
+                for row in range(size)]
+    cells = property(_getCells)
+
+    def _getBlankLocation( self ):
+        return divmod(self.blank, self.geometry.size)
+    blankLocation = property(_getBlankLocation)
 
     def isGoal( self ):
         """
@@ -77,13 +130,7 @@ class EightPuzzleState:
         >>> EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8]).isGoal()
         False
         """
-        current = 0
-        for row in range( 3 ):
-            for col in range( 3 ):
-                if current != self.cells[row][col]:
-                    return False
-                current += 1
-        return True
+        return self.packed == self.geometry.goal
 
     def legalMoves( self ):
         """
@@ -95,17 +142,7 @@ class EightPuzzleState:
         >>> EightPuzzleState([0, 1, 2, 3, 4, 5, 6, 7, 8]).legalMoves()
         ['down', 'right']
         """
-        moves = []
-        row, col = self.blankLocation
-        if(row != 0):
-            moves.append('up')
-        if(row != 2):
-            moves.append('down')
-        if(col != 0):
-            moves.append('left')
-        if(col != 2):
-            moves.append('right')
-        return moves
+        return list(self.geometry.legalMoves[self.blank])
 
     def result(self, move):
         """
@@ -113,38 +150,44 @@ class EightPuzzleState:
         updated based on the provided move.
 
         The move should be a string drawn from a list returned by legalMoves.
-        Illegal moves will raise an exception, which may be an array bounds
-        exception.
+        Illegal moves will raise an exception.
 
         NOTE: This function *does not* change the current object.  Instead,
         it returns a new object.
         """
-        row, col = self.blankLocation
-        if(move == 'up'):
-            newrow = row - 1
-            newcol = col
-        elif(move == 'down'):
-            newrow = row + 1
-            newcol = col
-        elif(move == 'left'):
-            newrow = row
-            newcol = col - 1
-        elif(move == 'right'):
-            newrow = row
-            newcol = col + 1
-        else:
-            raise "Illegal Move"
-
-        # Create a copy of the current eightPuzzle
-        newPuzzle = EightPuzzleState([0, 0, 0, 0, 0, 0, 0, 0, 0])
-        newPuzzle.cells = [values[:] for values in self.cells]
-        # And update it to reflect the move
-        newPuzzle.cells[row][col] = self.cells[newrow][newcol]
-        newPuzzle.cells[newrow][newcol] = self.cells[row][col]
-        newPuzzle.blankLocation = newrow, newcol
-
+        newPuzzle = self.__class__.__new__(self.__class__)
+        newPuzzle.geometry = self.geometry
+        newPuzzle.packed, newPuzzle.blank = self._moved(move)
         return newPuzzle
 
+    def _moved(self, move):
+        "The packed puzzle and blank cell after move."
+        target = self.geometry.targets[self.blank].get(move)
+        if target == None:
+            raise Exception("Illegal Move")
+        return self.geometry.move(self.packed, self.blank, target), target
+
+    def apply(self, move):
+        """
+          Makes the move in this puzzle itself, instead of in a copy as
+        result does, and returns a token that undo takes to restore it.
+
+        >>> puzzle = EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8])
+        >>> token = puzzle.apply('left')
+        >>> puzzle.isGoal()
+        True
+        >>> puzzle.undo(token)
+        >>> puzzle == EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8])
+        True
+        """
+        token = self.packed, self.blank
+        self.packed, self.blank = self._moved(move)
+        return token
+
+    def undo(self, token):
+        "Takes back the move that apply returned token for."
+        self.packed, self.blank = token
+
     # Utilities for comparison and display
     def __eq__(self, other):
         """
@@ -155,27 +198,25 @@ class EightPuzzleState:
               EightPuzzleState([1, 0, 2, 3, 4, 5, 6, 7, 8]).result('left')
           True
         """
-        for row in range( 3 ):
-            if self.cells[row] != other.cells[row]:
-                return False
-        return True
+        return self.packed == other.packed and self.geometry is other.geometry
 
     def __hash__(self):
-        return hash(str(self.cells))
+        return hash(self.packed)
 
     def __getAsciiString(self):
         """
           Returns a display string for the maze
         """
+        width = len(str(self.geometry.cells - 1))
         lines = []
-        horizontalLine = ('-' * (13))
+        horizontalLine = ('-' * ((width + 3) * self.geometry.size + 1))
         lines.append(horizontalLine)
         for row in self.cells:
             rowLine = '|'
             for col in row:
                 if col == 0:
                     col = ' '
-                rowLine = rowLine + ' ' + col.__str__() + ' |'
+                rowLine = rowLine + ' ' + col.__str__().rjust(width) + ' |'
             lines.append(rowLine)
             lines.append(horizontalLine)
         return '\n'.join(lines)
@@ -183,20 +224,56 @@ class EightPuzzleState:
     def __str__(self):
         return self.__getAsciiString()
 
+class EightPuzzleState(SlidingPuzzleState):
+    """
+    The Eight Puzzle is described in the course textbook on
+    page 64.
+
+    This class defines the mechanics of the puzzle itself.  The
+    task of recasting this puzzle as a search problem is left to
+    the EightPuzzleSearchProblem class.
+    """
+
+    def __init__( self, numbers ):
+        """
+          Constructs a new eight puzzle from an ordering of numbers.
+
+        numbers: a list of integers from 0 to 8 representing an
+          instance of the eight puzzle.  0 represents the blank
+          space.  Thus, the list
+
+            [1, 0, 2, 3, 4, 5, 6, 7, 8]
+
+          represents the eight puzzle:
+            -------------
+            | 1 |   | 2 |
+            -------------
+            | 3 | 4 | 5 |
+            -------------
+            | 6 | 7 | 8 |
+            ------------
+        """
+        if len(numbers) != 9:
+            raise Exception("An eight puzzle has 9 cells, not %d" % len(numbers))
+        SlidingPuzzleState.__init__(self, numbers)
+
 # TODO: Implement The methods in this class
 
 class EightPuzzleSearchProblem(search.SearchProblem):
     """
       Implementation of a SearchProblem for the  Eight Puzzle domain
 
-      Each state is represented by an instance of an eightPuzzle.
+      Each state is represented by an instance of an eightPuzzle (or of
+      any SlidingPuzzleState, for boards of other sizes).
     """
+    unitCosts = True # Every move costs 1 (see search.iterativeDeepeningAStarSearch)
+
     def __init__(self,puzzle):
         "Creates a new EightPuzzleSearchProblem which stores search information."
         self.puzzle = puzzle
 
     def getStartState(self):
-        return puzzle
+        return self.puzzle
 
     def isGoalState(self,state):
         return state.isGoal()
@@ -212,6 +289,10 @@ class EightPuzzleSearchProblem(search.SearchProblem):
             succ.append((state.result(a), a, 1))
         return succ
 
+    def getActions(self,state):
+        "The moves from state, for searches that play them in place."
+        return state.legalMoves()
+
     def getCostOfActions(self, actions):
         """
          actions: A list of actions to take
@@ -221,6 +302,20 @@ class EightPuzzleSearchProblem(search.SearchProblem):
         """
         return len(actions)
 
+class CountingPuzzleProblem(EightPuzzleSearchProblem):
+    "An EightPuzzleSearchProblem that counts the states expanded."
+    def __init__(self,puzzle):
+        EightPuzzleSearchProblem.__init__(self, puzzle)
+        self.expanded = 0
+
+    def getSuccessors(self,state):
+        self.expanded += 1
+        return EightPuzzleSearchProblem.getSuccessors(self, state)
+
+    def getActions(self,state):
+        self.expanded += 1
+        return state.legalMoves()
+
 EIGHT_PUZZLE_DATA = [[1, 0, 2, 3, 4, 5, 6, 7, 8],
                      [1, 7, 8, 2, 3, 4, 5, 6, 0],
                      [4, 3, 2, 7, 0, 5, 1, 6, 8],
@@ -262,7 +357,337 @@ def createRandomEightPuzzle(moves=100):
         puzzle = puzzle.result(random.sample(puzzle.legalMoves(), 1)[0])
     return puzzle
 
+# The solution table: the optimal number of moves for every solvable puzzle,
+# found once by a breadth-first search backwards from the goal and kept in a
+# file of one byte per puzzle.  A puzzle's entry is at
+#
+#   blank cell * 8!/2 + (lexicographic rank of the tiles 1-8 in row order) / 2
+#
+# Ranks 2k and 2k+1 differ by swapping the last two tiles, which changes
+# whether the puzzle can be solved, so exactly one of them has an entry.
+TABLE_MAGIC = b'8PUZDIST'
+TABLE_SIZE = 9 * 20160 # 181,440 solvable puzzles
+UNREACHED = 0xFF
+FACTORIALS = [1, 1, 2, 6, 24, 120, 720, 5040, 40320]
+SET_BITS = [bin(mask).count('1') for mask in range(1 << 9)] # Tiles in a mask of unused tiles
+SOLUTION_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eightpuzzle.table')
+
+def tableIndex(packed, blank):
+    """
+      Returns the index of a packed puzzle (see BITS) in the solution
+    table, or None if the puzzle cannot be solved.
+    """
+    unused = 0x1FE # Tiles 1-8 not yet placed
+    rank, parity, place = 0, 0, 7
+    for cell in range(9):
+        if cell == blank: continue
+        tile = (packed >> (BITS * cell)) & CELL_MASK
+        smaller = SET_BITS[unused & ((1 << tile) - 1)]
+        rank += smaller * FACTORIALS[place]
+        parity ^= smaller & 1
+        unused ^= 1 << tile
+        place -= 1
+    # On a board of odd width, solvable means an even number of inversions
+    if parity: return None
+    return blank * 20160 + (rank >> 1)
+
+def buildSolutionTable():
+    "Returns the solution table as a bytearray, by breadth-first search from the goal."
+    table = bytearray([UNREACHED]) * TABLE_SIZE
+    table[tableIndex(GOAL, 0)] = 0
+    frontier, depth = [(GOAL, 0)], 0
+    while frontier:
+        depth += 1
+        nextFrontier = []
+        for packed, blank in frontier:
+            for target in TARGETS[blank].values():
+                tile = (packed >> (BITS * target)) & CELL_MASK
+                neighbor = packed - (tile << (BITS * target)) + (tile << (BITS * blank))
+                index = tableIndex(neighbor, target)
+                if table[index] == UNREACHED:
+                    table[index] = depth
+                    nextFrontier.append((neighbor, target))
+        frontier = nextFrontier
+    return table
+
+_SOLUTION_TABLE = None
+
+def solutionTable(path=None):
+    """
+      Returns the solution table, memory-mapped from its file (by default
+    SOLUTION_TABLE_PATH), which is built and written the first time.  If
+    the file cannot be written the table is kept in memory instead.
+    """
+    global _SOLUTION_TABLE
+    if _SOLUTION_TABLE != None and path == None: return _SOLUTION_TABLE
+    if path == None: path = SOLUTION_TABLE_PATH
+    table = cachedTable(path, TABLE_MAGIC, TABLE_SIZE, buildSolutionTable)
+    if path == SOLUTION_TABLE_PATH: _SOLUTION_TABLE = table
+    return table
+
+def cachedTable(path, magic, size, build):
+    """
+      Returns the table of size bytes stored at path after the header
+    magic, memory-mapped.  If there is no such file, the table is built
+    with build() and written there first; if it cannot be written the
+    built table (a bytearray) is returned.
+    """
+    table = _loadTable(path, magic, size)
+    if table != None: return table
+    table = build()
+    try:
+        # Written aside and renamed, so readers never see half a table
+        temporary = '%s.%d' % (path, os.getpid())
+        f = open(temporary, 'wb')
+        try:
+            f.write(magic)
+            f.write(table)
+        finally:
+            f.close()
+        os.replace(temporary, path)
+    except (IOError, OSError):
+        return table
+    return _loadTable(path, magic, size) or table
+
+class MappedTable:
+    """
+    A table file's entries, read from a memory map past its header: entry i
+    is mapped[offset + i].
+    """
+    def __init__(self, mapped, offset):
+        self.mapped = mapped
+        self.offset = offset
+    def __getitem__(self, index):
+        return self.mapped[self.offset + index]
+    def __len__(self):
+        return len(self.mapped) - self.offset
+
+def _loadTable(path, magic, size):
+    if not os.path.exists(path): return None
+    f = open(path, 'rb')
+    try:
+        if os.fstat(f.fileno()).st_size != len(magic) + size: return None
+        if f.read(len(magic)) != magic: return None
+        return MappedTable(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), len(magic))
+    finally:
+        f.close()
+
+def solutionLength(puzzle):
+    """
+      The fewest moves that solve puzzle, or None if it cannot be solved.
+
+    >>> solutionLength(loadEightPuzzle(4))
+    14
+    """
+    if puzzle.geometry.size != 3:
+        raise Exception("The solution table is for the eight puzzle only")
+    index = tableIndex(puzzle.packed, puzzle.blank)
+    if index == None: return None
+    return solutionTable()[index]
+
+def solveEightPuzzle(puzzle):
+    """
+      Returns the moves of an optimal solution to puzzle, read from the
+    solution table by always making a move that brings the puzzle one move
+    closer to the goal, or None if it cannot be solved.
+
+    >>> len(solveEightPuzzle(loadEightPuzzle(4)))
+    14
+    """
+    table = solutionTable()
+    distance = solutionLength(puzzle)
+    if distance == None: return None
+    moves = []
+    packed, blank = puzzle.packed, puzzle.blank
+    while distance > 0:
+        for move, target in TARGETS[blank].items():
+            tile = (packed >> (BITS * target)) & CELL_MASK
+            neighbor = packed - (tile << (BITS * target)) + (tile << (BITS * blank))
+            if table[tableIndex(neighbor, target)] == distance - 1:
+                moves.append(move)
+                packed, blank, distance = neighbor, target, distance - 1
+                break
+    return moves
+
+def solutionHeuristic(state, problem=None):
+    """
+      The perfect heuristic for EightPuzzleSearchProblem: the exact number
+    of moves left, from the solution table, and infinity for a puzzle that
+    cannot be solved.
+    """
+    length = solutionLength(state)
+    if length == None: return float('inf')
+    return length
+
+# Pattern databases.  A pattern database for a group of tiles holds, for every
+# placement of those tiles, the fewest moves of those tiles that bring them
+# home when the other tiles are ignored, so any tile may slide into any cell
+# not taken by the group.  Each move moves one tile, so with the tiles split
+# into disjoint groups the databases' values add up to a lower bound on the
+# moves left: an admissible heuristic.  A placement with tile i of the group
+# on cell p_i is entry  sum_i p_i * cells**i.
+PDB_MAGIC = b'NPUZPDB1'
+DEFAULT_PARTITIONS = {
+    3: [[1, 2, 3, 4], [5, 6, 7, 8]],
+    4: [[1, 2, 3, 6, 7], [4, 5, 8, 9, 12], [10, 11, 13, 14, 15]],
+    5: [[1, 2, 3, 4], [5, 6, 10, 11], [7, 8, 9, 12], [13, 14, 18, 19], [15, 16, 20, 21], [17, 22, 23, 24]],
+}
+
+def buildPatternDatabase(size, tiles):
+    "Returns the pattern database of tiles, as a bytearray, by breadth-first search from the goal."
+    geometry = getGeometry(size)
+    cells, neighbors = geometry.cells, geometry.neighbors
+    powers = [cells ** i for i in range(len(tiles))]
+    table = bytearray([UNREACHED]) * (cells ** len(tiles))
+    # In the goal, tile t is on cell t
+    start = sum([tile * power for tile, power in zip(tiles, powers)])
+    table[start] = 0
+    frontier, depth = [start], 0
+    while frontier:
+        depth += 1
+        nextFrontier = []
+        for index in frontier:
+            positions, occupied, rest = [], 0, index
+            for _ in powers:
+                rest, position = divmod(rest, cells)
+                positions.append(position)
+                occupied |= 1 << position
+            for position, power in zip(positions, powers):
+                for neighbor in neighbors[position]:
+                    if occupied >> neighbor & 1: continue
+                    successor = index + (neighbor - position) * power
+                    if table[successor] == UNREACHED:
+                        table[successor] = depth
+                        nextFrontier.append(successor)
+        frontier = nextFrontier
+    return table
+
+def patternDatabasePath(size, tiles):
+    name = 'puzzle%d-pdb-%s.table' % (size, '-'.join([str(tile) for tile in tiles]))
+    return os.path.join(os.path.dirname(SOLUTION_TABLE_PATH), name)
+
+def patternDatabase(size, tiles):
+    """
+      Returns the pattern database of tiles on a size x size board, cached
+    on disk next to the solution table (see cachedTable).
+    """
+    cells = size * size
+    return cachedTable(patternDatabasePath(size, tiles), PDB_MAGIC, cells ** len(tiles),
+                       lambda: buildPatternDatabase(size, tiles))
+
+class PatternDatabaseHeuristic:
+    """
+    The disjoint additive pattern database heuristic for one partition of
+    the tiles of a size x size puzzle into groups.
+    """
+    def __init__(self, size, partition=None):
+        if partition == None: partition = DEFAULT_PARTITIONS[size]
+        tiles = sorted([tile for group in partition for tile in group])
+        if tiles != list(range(1, size * size)):
+            raise Exception("The groups must split the tiles 1 to %d between them" % (size * size - 1))
+        self.geometry = getGeometry(size)
+        cells = self.geometry.cells
+        # For each tile: its group's table and what its cell is multiplied
+        # by in the group's entry
+        self.databases = []
+        self.weights = [None] * cells
+        for group in partition:
+            table = patternDatabase(size, group)
+            if isinstance(table, MappedTable): data, offset = table.mapped, table.offset
+            else: data, offset = table, 0
+            self.databases.append((data, offset, group))
+            for i, tile in enumerate(group):
+                self.weights[tile] = (len(self.databases) - 1, cells ** i)
+
+    def __call__(self, state, problem=None):
+        geometry = self.geometry
+        bits, mask, weights = geometry.bits, geometry.mask, self.weights
+        entries = [0] * len(self.databases)
+        packed = state.packed
+        for cell in range(geometry.cells):
+            tile = packed & mask
+            packed >>= bits
+            if tile:
+                group, weight = weights[tile]
+                entries[group] += cell * weight
+        total = 0
+        for (data, offset, group), entry in zip(self.databases, entries):
+            total += data[offset + entry]
+        return total
+
+_PDB_HEURISTICS = {}
+
+def patternDatabaseHeuristic(state, problem=None):
+    """
+      The disjoint additive pattern database heuristic, with the default
+    partition for the size of state's board.  The databases are built the
+    first time they are needed for a size (a few seconds for the fifteen
+    and twenty-four puzzles) and then read from disk.
+    """
+    size = state.geometry.size
+    if size not in _PDB_HEURISTICS: _PDB_HEURISTICS[size] = PatternDatabaseHeuristic(size)
+    return _PDB_HEURISTICS[size](state, problem)
+
+def manhattanPuzzleHeuristic(state, problem=None):
+    "The sum of the tiles' Manhattan distances from their goal cells."
+    geometry = state.geometry
+    size, bits, mask = geometry.size, geometry.bits, geometry.mask
+    packed, total = state.packed, 0
+    for cell in range(geometry.cells):
+        tile = packed & mask
+        packed >>= bits
+        if tile:
+            total += abs(cell // size - tile // size) + abs(cell % size - tile % size)
+    return total
+
+def createRandomPuzzle(size, moves=100):
+    """
+      Creates a random size x size puzzle by applying 'moves' random moves
+    to a solved puzzle.
+    """
+    puzzle = SlidingPuzzleState(list(range(size * size)))
+    for i in range(moves):
+        puzzle = puzzle.result(random.choice(puzzle.legalMoves()))
+    return puzzle
+
+def benchmarkPuzzles(size, numPuzzles=5, moves=100, seed=0, heuristic=patternDatabaseHeuristic):
+    """
+      Solves numPuzzles random size x size puzzles with search.py's IDA*
+    and prints the solution length, nodes expanded and time of each.
+    """
+    import time
+    random.seed(seed)
+    heuristic(SlidingPuzzleState(list(range(size * size)))) # Load the databases first
+    print('%d-puzzle, %s, random walks of %d moves' % (size * size - 1, heuristic.__name__, moves))
+    totalNodes, totalTime = 0, 0.0
+    for i in range(numPuzzles):
+        problem = CountingPuzzleProblem(createRandomPuzzle(size, moves))
+        start = time.perf_counter()
+        path = search.iterativeDeepeningAStarSearch(problem, heuristic)
+        elapsed = time.perf_counter() - start
+        totalNodes += problem.expanded
+        totalTime += elapsed
+        print('  puzzle %d: %d moves, %d nodes in %.2fs' % (i, len(path), problem.expanded, elapsed))
+    print('  %d nodes per second' % (totalNodes / max(totalTime, 1e-9)))
+
 if __name__ == '__main__':
+    import sys
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python eightpuzzle.py [--benchmark N [--size SIZE] [options]]')
+    parser.add_option('--benchmark', dest='benchmark', type='int', default=0,
+                      help='solve N random puzzles with IDA* and report the time taken')
+    parser.add_option('--size', dest='size', type='int', default=4,
+                      help='board size for --benchmark (3, 4 or 5)')
+    parser.add_option('--moves', dest='moves', type='int', default=100,
+                      help='length of the random walks that make the puzzles')
+    parser.add_option('--heuristic', dest='heuristic', default='patternDatabaseHeuristic',
+                      help='patternDatabaseHeuristic or manhattanPuzzleHeuristic')
+    options, otherjunk = parser.parse_args()
+    if options.benchmark > 0:
+        benchmarkPuzzles(options.size, options.benchmark, options.moves,
+                         heuristic=globals()[options.heuristic])
+        sys.exit(0)
+
     puzzle = createRandomEightPuzzle(25)
     print('A random puzzle:')
     print(puzzle)
@@ -270,6 +695,7 @@ if __name__ == '__main__':
     problem = EightPuzzleSearchProblem(puzzle)
     path = search.breadthFirstSearch(problem)
     print('BFS found a path of %d moves: %s' % (len(path), str(path)))
+    print('The solution table says %d moves are needed' % solutionLength(puzzle))
     curr = puzzle
     i = 1
     for a in path:
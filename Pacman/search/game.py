@@ -22,6 +22,7 @@
 
 from util import *
 import time, os
+import bisect
 import traceback
 import sys
 
@@ -159,6 +160,48 @@ class AgentState:
     def getDirection(self):
         return self.configuration.getDirection()
 
+class GridIndex:
+    """
+    Bookkeeping shared by the columns of a Grid (and by its shallow copies):
+    the number of cells equal to True and, once asList has been called, the
+    sorted list of their positions.  GridColumn keeps both up to date on every
+    write, so counting costs O(1) and listing O(number of True cells).
+    """
+    def __init__(self, data, count=0, positions=None):
+        self.data = data
+        self.count = count
+        self.positions = positions
+
+    def update(self, x, y, old, new):
+        wasSet, isSet = old == True, new == True
+        if wasSet == isSet: return
+        if isSet:
+            self.count += 1
+            if self.positions != None: bisect.insort(self.positions, (x, y))
+        else:
+            self.count -= 1
+            if self.positions != None: del self.positions[bisect.bisect_left(self.positions, (x, y))]
+
+    def rebuild(self):
+        self.count = sum([x.count(True) for x in self.data])
+        self.positions = None
+
+class GridColumn(list):
+    """
+    A column grid[x] of a Grid, which reports writes to the grid's GridIndex.
+    """
+    __slots__ = ('x', 'index')
+
+    def __setitem__(self, y, value):
+        if type(y) == slice:
+            list.__setitem__(self, y, value)
+            self.index.rebuild()
+            return
+        if y < 0: y += len(self)
+        old = list.__getitem__(self, y)
+        list.__setitem__(self, y, value)
+        self.index.update(self.x, y, old, value)
+
 class Grid:
     """
     A 2-dimensional array of objects backed by a list of lists.  Data is accessed
@@ -166,6 +209,9 @@ class Grid:
     y vertical and the origin (0,0) in the bottom left corner.
 
     The __str__ method constructs an output that is oriented like a pacman board.
+
+    The columns keep a GridIndex up to date, so count() and asList() do not
+    have to scan the whole board.
     """
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
         if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
@@ -173,15 +219,46 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self._setData([[initialValue for y in range(height)] for x in range(width)])
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
+    def _setData(self, columns, count=None, positions=None):
+        """
+        Installs columns (lists of cells) as the grid's data, wrapping them in
+        GridColumns that share a fresh GridIndex.
+        """
+        self.data = []
+        self.index = GridIndex(self.data, count, positions)
+        for x, values in enumerate(columns):
+            self.data.append(self._makeColumn(x, values))
+        if count == None:
+            self.index.rebuild()
+
+    def _makeColumn(self, x, values):
+        column = GridColumn(values)
+        column.x = x
+        column.index = self.index
+        return column
+
     def __getitem__(self, i):
         return self.data[i]
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        self.data[key] = self._makeColumn(key, item)
+        self.index.rebuild()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['data'] = [list(x) for x in self.data]
+        del state['index']
+        return state
+
+    def __setstate__(self, state):
+        # Grids are pickled with plain lists, which also covers recordings
+        # made before the columns were indexed.
+        self.__dict__.update(state)
+        self._setData(state['data'])
 
     def __str__(self):
         out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
@@ -204,22 +281,40 @@ class Grid:
         return hash(h)
 
     def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g = Grid.__new__(Grid)
+        g.CELLS_PER_INT = self.CELLS_PER_INT
+        g.width = self.width
+        g.height = self.height
+        positions = self.index.positions
+        if positions != None: positions = positions[:]
+        g._setData(self.data, self.index.count, positions)
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
+        g = Grid.__new__(Grid)
+        g.CELLS_PER_INT = self.CELLS_PER_INT
+        g.width = self.width
+        g.height = self.height
         g.data = self.data
+        g.index = self.index
         return g
 
     def count(self, item =True ):
+        if item is True:
+            return self.index.count
         return sum([x.count(item) for x in self.data])
 
     def asList(self, key = True):
+        if key is True:
+            if self.index.positions == None:
+                self.index.positions = self._positionsOf(key)
+            return self.index.positions[:]
+        return self._positionsOf(key)
+
+    def _positionsOf(self, key):
         list = []
         for x in range(self.width):
             for y in range(self.height):
@@ -368,6 +463,26 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+# Zobrist hashing: every piece of a state (a food dot, a capsule, an agent's
+# configuration and scared timer, the score) maps to a pseudo-random 64-bit key
+# and a state hashes to the XOR of the keys of its pieces.  Successors then
+# update the hash by XOR-ing out what changed instead of rehashing the board.
+ZOBRIST_MASK = 0xFFFFFFFFFFFFFFFF
+ZOBRIST_FOOD, ZOBRIST_CAPSULE, ZOBRIST_AGENT, ZOBRIST_SCORE = range(4)
+DIRECTION_CODES = {Directions.NORTH: 0, Directions.SOUTH: 1, Directions.EAST: 2,
+                   Directions.WEST: 3, Directions.STOP: 4}
+
+def zobristKey(*components):
+    """
+    Returns the 64-bit key for a tuple of numbers.  Keys are a splitmix64 mix of
+    the tuple hash, so they agree across processes (numbers, unlike strings,
+    are not subject to hash randomization).
+    """
+    z = (hash(components) + 0x9E3779B97F4A7C15) & ZOBRIST_MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & ZOBRIST_MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & ZOBRIST_MASK
+    return z ^ (z >> 31)
+
 class GameStateData:
     """
 
@@ -391,6 +506,10 @@ class GameStateData:
         self._lose = False
         self._win = False
         self.scoreChange = 0
+        # The successor is about to be edited by the rules, so its hash is
+        # rebuilt from ours in updateHash rather than copied here.
+        self._hash = None
+        self._agentKeys = None
 
     def deepCopy( self ):
         state = GameStateData( self )
@@ -400,6 +519,8 @@ class GameStateData:
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
+        state._hash = self._hash
+        state._agentKeys = self._agentKeys
         return state
 
     def copyAgentStates( self, agentStates ):
@@ -414,6 +535,7 @@ class GameStateData:
         """
         if other == None: return False
         # TODO Check for type of other
+        if self._hash != None and other._hash != None and self._hash != other._hash: return False
         if not self.agentStates == other.agentStates: return False
         if not self.food == other.food: return False
         if not self.capsules == other.capsules: return False
@@ -422,15 +544,64 @@ class GameStateData:
 
     def __hash__( self ):
         """
-        Allows states to be keys of dictionaries.
+        Allows states to be keys of dictionaries.  The Zobrist hash is built
+        once and then maintained incrementally by updateHash.
+        """
+        if self._hash == None:
+            self._computeHash()
+        return self._hash
+
+    def _agentKey( self, index ):
+        agentState = self.agentStates[index]
+        if agentState.configuration == None: return 0
+        x, y = agentState.configuration.pos
+        direction = DIRECTION_CODES.get(agentState.configuration.direction, -1)
+        return zobristKey(ZOBRIST_AGENT, index, x, y, direction, agentState.scaredTimer)
+
+    def _computeHash( self ):
+        """
+        Hashes the whole state from scratch (O(width * height)).
+        """
+        self._agentKeys = [self._agentKey(i) for i in range(len(self.agentStates))]
+        h = zobristKey(ZOBRIST_SCORE, self.score)
+        for key in self._agentKeys:
+            h ^= key
+        for x, y in self.food.asList():
+            h ^= zobristKey(ZOBRIST_FOOD, x, y)
+        for x, y in self.capsules:
+            h ^= zobristKey(ZOBRIST_CAPSULE, x, y)
+        self._hash = h
+
+    def updateHash( self, prevState ):
+        """
+        Derives this successor's hash from that of prevState (the data it was
+        generated from) in O(number of agents).  Expects the food and capsule
+        changes to be recorded in _foodEaten and _capsuleEaten.  If prevState
+        was never hashed, the hash is left to be computed on demand.
+        """
+        self.rehash( prevState._hash, prevState._agentKeys, prevState.score )
+
+    def rehash( self, prevHash, prevAgentKeys, prevScore ):
+        """
+        updateHash, given the hash, agent keys and score of the previous data
+        rather than the data itself (which GameState.apply has edited).
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        if prevHash == None:
+            self._hash = self._agentKeys = None
+            return
+        h = prevHash ^ zobristKey(ZOBRIST_SCORE, prevScore) ^ zobristKey(ZOBRIST_SCORE, self.score)
+        agentKeys = prevAgentKeys[:]
+        for index in range(len(agentKeys)):
+            key = self._agentKey(index)
+            if key != agentKeys[index]:
+                h ^= agentKeys[index] ^ key
+                agentKeys[index] = key
+        if self._foodEaten != None:
+            h ^= zobristKey(ZOBRIST_FOOD, *self._foodEaten)
+        if self._capsuleEaten != None:
+            h ^= zobristKey(ZOBRIST_CAPSULE, *self._capsuleEaten)
+        self._hash = h
+        self._agentKeys = agentKeys
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -503,6 +674,8 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self._hash = None
+        self._agentKeys = None
 
 try:
     import boinc
@@ -527,7 +700,10 @@ class Game:
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
+        # CPU seconds, for agents that report them (see agentProcess.py)
+        self.totalAgentCpuTimes = [0 for agent in agents]
         self.agentTimeout = False
+        self.recorder = None # Streams the moves, see recording.py
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
 
@@ -587,7 +763,7 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
                             timed_func(self.state.deepCopy())
@@ -610,6 +786,7 @@ class Game:
 
         agentIndex = self.startingIndex
         numAgents = len( self.agents )
+        reportsCpuTime = ['gameCpuTime' in dir(agent) for agent in self.agents]
 
         while not self.gameOver:
             # Fetch the next agent
@@ -621,7 +798,7 @@ class Game:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
                             observation = timed_func(self.state.deepCopy())
@@ -644,7 +821,7 @@ class Game:
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
                     try:
                         start_time = time.time()
                         if skip_action:
@@ -685,6 +862,8 @@ class Game:
             else:
                 action = agent.getAction(observation)
             self.unmute()
+            if reportsCpuTime[agentIndex]:
+                self.totalAgentCpuTimes[agentIndex] = agent.gameCpuTime
 
             # Execute the action
             self.moveHistory.append( (agentIndex, action) )
@@ -698,6 +877,8 @@ class Game:
                     return
             else:
                 self.state = self.state.generateSuccessor( agentIndex, action )
+            if self.recorder != None:
+                self.recorder.recordMove( agentIndex, action, self.state )
 
             # Change the display
             self.display.update( self.state.data )
@@ -0,0 +1,324 @@
+# gameServer.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Plays games against Pacman agents that connect over a socket.
+
+The server (python pacman.py --serve ADDRESS ...) runs every game on one
+asyncio event loop, so a slow client only holds up its own games.  The
+ghosts are local agents given with -g.  An ADDRESS is either HOST:PORT
+(or tcp:HOST:PORT) or unix:PATH.
+
+Clients use RemoteGameClient, which wraps any game.Agent:
+
+  python gameServer.py ADDRESS -p GreedyAgent [-a ARGS] [-n GAMES]
+
+The protocol is a sequence of frames, each a 4-byte little-endian payload
+length, a 1-byte frame type and the payload:
+
+  HELLO    client  JSON {"name": ..., "games": ...}
+  START    server  agent index, move timeout (double), the layout text and
+                   the initial state packed as by recording.encodeState
+  READY    client  sent once registerInitialState has returned
+  REQUEST  server  JSON of the state's changes since the client's last
+                   request (see agentProcess.stateDelta)
+  ACTION   client  one byte, the action's code in recording.ACTIONS
+  END      server  JSON {"score", "win", "lose", "moves", "crashed"}
+
+Nothing the server reads from a client is unpickled or executed.  A client
+that misses a deadline (startup or move) loses its game.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import copy
+
+HELLO, START, READY, REQUEST, ACTION, END = range(1, 7)
+HEADER = '<IB'
+HEADER_SIZE = struct.calcsize(HEADER)
+MAX_FRAME = 1 << 20
+
+def frame( kind, payload=b'' ):
+    return struct.pack(HEADER, len(payload), kind) + payload
+
+def parseAddress( address ):
+    """
+    Returns ('unix', path) or ('tcp', host, port).
+    """
+    if address.startswith('unix:'):
+        return ('unix', address[len('unix:'):])
+    if address.startswith('tcp:'):
+        address = address[len('tcp:'):]
+    host, port = address.rsplit(':', 1)
+    return ('tcp', host or '127.0.0.1', int(port))
+
+def removeStaleSocket( path ):
+    """
+    Deletes the unix socket at path if no server is listening on it (one
+    left behind by a server that was killed), so that it can be bound again.
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode): return
+    except FileNotFoundError:
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+    finally:
+        probe.close()
+
+def encodeDelta( delta ):
+    return json.dumps(delta, separators=(',', ':')).encode('utf-8')
+
+def decodeDelta( payload ):
+    """
+    Inverts encodeDelta, turning the positions JSON made into lists back
+    into tuples.
+    """
+    agents, eaten, added, capsules, score, scoreChange, win, lose, agentsEaten, \
+        agentMoved, foodEaten, foodAdded, capsuleEaten = json.loads(payload.decode('utf-8'))
+    agents = [(index, configuration and (tuple(configuration[0]), configuration[1]), scaredTimer, isPacman, numCarrying, numReturned)
+              for index, configuration, scaredTimer, isPacman, numCarrying, numReturned in agents]
+    return (agents, [tuple(p) for p in eaten], [tuple(p) for p in added],
+            capsules and [tuple(p) for p in capsules], score, scoreChange, win, lose, agentsEaten, agentMoved,
+            foodEaten and tuple(foodEaten), foodAdded and tuple(foodAdded), capsuleEaten and tuple(capsuleEaten))
+
+class ProtocolError(Exception):
+    pass
+
+class GameServer:
+    """
+    Serves games on layout against copies of ghosts until numGames games
+    (None for no limit) have been played.
+    """
+    def __init__( self, layout, ghosts, numGames=None, timeout=30, record=False ):
+        self.layout = layout
+        self.ghosts = ghosts
+        self.numGames = numGames
+        self.timeout = timeout
+        self.record = record
+        self.gamesStarted = 0
+        self.games = []
+        self.masterSeed = None
+        self.finished = None
+
+    async def serve( self, address ):
+        import random
+        self.masterSeed = random.getrandbits(64)
+        self.finished = asyncio.Event()
+        kind = parseAddress(address)
+        if kind[0] == 'unix':
+            removeStaleSocket(kind[1])
+            server = await asyncio.start_unix_server(self.handleClient, kind[1])
+        else:
+            server = await asyncio.start_server(self.handleClient, kind[1], kind[2])
+        print('Serving Pacman games on %s' % address)
+        try:
+            async with server:
+                if self.numGames == None:
+                    await server.serve_forever()
+                else:
+                    await self.finished.wait()
+        finally:
+            if kind[0] == 'unix' and os.path.exists(kind[1]): os.unlink(kind[1])
+        return self.games
+
+    async def handleClient( self, reader, writer ):
+        try:
+            kind, payload = await asyncio.wait_for(readFrame(reader), self.timeout)
+            if kind != HELLO: raise ProtocolError('expected HELLO')
+            hello = json.loads(payload.decode('utf-8'))
+            for i in range(int(hello.get('games', 1))):
+                if self.numGames != None and self.gamesStarted >= self.numGames: break
+                gameNumber = self.gamesStarted
+                self.gamesStarted += 1
+                game = await self.playGame(gameNumber, reader, writer)
+                self.games.append(game)
+                if self.numGames != None and len(self.games) >= self.numGames:
+                    self.finished.set()
+                if game.agentCrashed: break
+        except (ProtocolError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError) as e:
+            print('Dropping client: %s' % (str(e) or e.__class__.__name__), file=sys.stderr)
+        finally:
+            writer.close()
+
+    async def playGame( self, gameNumber, reader, writer ):
+        """
+        Plays one game with the client as Pacman and returns the Game.
+        """
+        import pacman, recording, textDisplay, util
+        from agentProcess import stateDelta
+        from game import Agent
+        rules = pacman.ClassicGameRules(self.timeout)
+        rules.quiet = True
+        rng = util.randomStream(self.masterSeed, gameNumber, 'game')
+        game = rules.newGame(self.layout, Agent(0), copy.deepcopy(self.ghosts), textDisplay.NullGraphics(), True, rng=rng)
+        if self.record:
+            game.recorder = recording.RecordingWriter(pacman.recordingName(gameNumber), self.layout, game.state.getNumAgents())
+        state = game.state
+        text = '\n'.join(self.layout.layoutText).encode('utf-8')
+        writer.write(frame(START, struct.pack('<BdI', 0, rules.getMoveTimeout(0), len(text)) + text +
+                           recording.encodeState(state)))
+        await writer.drain()
+
+        agentIndex, numAgents = game.startingIndex, len(game.agents)
+        lastSent = state
+        try:
+            await self.expect(reader, READY, rules.getMaxStartupTime(0))
+            while not game.gameOver:
+                if agentIndex == 0:
+                    writer.write(frame(REQUEST, encodeDelta(stateDelta(lastSent.data, state.data))))
+                    lastSent = state
+                    await writer.drain()
+                    payload = await self.expect(reader, ACTION, rules.getMoveTimeout(0))
+                    if len(payload) != 1 or payload[0] >= len(recording.ACTIONS):
+                        raise ProtocolError('malformed ACTION')
+                    action = recording.ACTIONS[payload[0]]
+                else:
+                    action = game.agents[agentIndex].getAction(state.__class__(state))
+                game.moveHistory.append((agentIndex, action))
+                state = state.generateSuccessor(agentIndex, action)
+                game.state = state
+                if game.recorder != None: game.recorder.recordMove(agentIndex, action, state)
+                rules.process(state, game)
+                agentIndex = (agentIndex + 1) % numAgents
+        except asyncio.TimeoutError:
+            game.agentTimeout = True
+            game._agentCrash(0, quiet=True)
+        except Exception as e:
+            # Illegal moves, malformed frames and lost connections
+            print('Game %d: %s' % (gameNumber, e), file=sys.stderr)
+            game._agentCrash(0, quiet=True)
+        if game.recorder != None: game.recorder.close(state)
+        outcome = {'score': state.getScore(), 'win': state.isWin(), 'lose': state.isLose(),
+                   'moves': len(game.moveHistory), 'crashed': game.agentCrashed}
+        try:
+            writer.write(frame(END, json.dumps(outcome).encode('utf-8')))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        return game
+
+    async def expect( self, reader, kind, timeout ):
+        received, payload = await asyncio.wait_for(readFrame(reader), timeout)
+        if received != kind: raise ProtocolError('expected frame type %d, got %d' % (kind, received))
+        return payload
+
+async def readFrame( reader ):
+    length, kind = struct.unpack(HEADER, await reader.readexactly(HEADER_SIZE))
+    if length > MAX_FRAME: raise ProtocolError('frame of %d bytes is too large' % length)
+    return kind, await reader.readexactly(length)
+
+def serve( address, layout, ghosts, numGames, timeout=30, record=False ):
+    """
+    Runs a GameServer until numGames games have been played and prints the
+    usual summary.
+    """
+    import pacman
+    games = asyncio.run(GameServer(layout, ghosts, numGames, timeout, record).serve(address))
+    if games:
+        pacman.printSummary([game.state.getScore() for game in games], [game.state.isWin() for game in games])
+    return games
+
+class RemoteGameClient:
+    """
+    Plays agent, any game.Agent, in the games of a GameServer.
+    """
+    def __init__( self, address, agent, name='client' ):
+        self.address = address
+        self.agent = agent
+        self.name = name
+
+    def play( self, numGames=1 ):
+        """
+        Plays up to numGames games and returns their outcomes (see END).
+        """
+        kind = parseAddress(self.address)
+        if kind[0] == 'unix':
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.connect(kind[1])
+        else:
+            connection = socket.create_connection((kind[1], kind[2]))
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = connection.makefile('rb')
+        try:
+            connection.sendall(frame(HELLO, json.dumps({'name': self.name, 'games': numGames}).encode('utf-8')))
+            outcomes = []
+            while True:
+                kind, payload = _receive(stream)
+                if kind == None: break
+                if kind != START: raise ProtocolError('expected START')
+                outcomes.append(self.playGame(connection, stream, payload))
+            return outcomes
+        finally:
+            stream.close()
+            connection.close()
+
+    def playGame( self, connection, stream, start ):
+        import recording
+        from agentProcess import applyStateDelta, agentCopy
+        index, timeout, length = struct.unpack_from('<BdI', start)
+        offset = struct.calcsize('<BdI')
+        layoutText = start[offset:offset + length].decode('utf-8').split('\n')
+        state = recording.decodeState(start[offset + length:], recording.internLayout(layoutText))
+        self.agent.index = index
+        if 'registerInitialState' in dir(self.agent):
+            self.agent.registerInitialState(agentCopy(state))
+        connection.sendall(frame(READY))
+        while True:
+            kind, payload = _receive(stream)
+            if kind == REQUEST:
+                state = applyStateDelta(state, decodeDelta(payload))
+                action = self.agent.getAction(agentCopy(state))
+                connection.sendall(frame(ACTION, bytes([recording.ACTION_CODES[action]])))
+            elif kind == END:
+                if 'final' in dir(self.agent): self.agent.final(state)
+                return json.loads(payload.decode('utf-8'))
+            else:
+                raise ProtocolError('unexpected frame type %s' % kind)
+
+def _receive( stream ):
+    "Reads a frame, or returns (None, None) at the end of the stream."
+    header = stream.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE: return None, None
+    length, kind = struct.unpack(HEADER, header)
+    payload = stream.read(length)
+    if len(payload) < length: raise ProtocolError('connection closed mid-frame')
+    return kind, payload
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    import pacman
+    parser = OptionParser('USAGE: python gameServer.py ADDRESS -p AGENT [-a ARGS] [-n GAMES]')
+    parser.add_option('-p', '--pacman', dest='pacman', default='GreedyAgent',
+                      help='the agent TYPE to play Pacman with')
+    parser.add_option('-a', '--agentArgs', dest='agentArgs',
+                      help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
+    parser.add_option('-n', '--numGames', dest='numGames', type='int', default=1,
+                      help='the number of GAMES to play')
+    parser.add_option('--name', dest='name', default='client',
+                      help='the name to give the server')
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    if len(otherjunk) != 1: parser.error('give the server ADDRESS')
+    agent = pacman.loadAgent(options.pacman, True)(**pacman.parseAgentArgs(options.agentArgs))
+    outcomes = RemoteGameClient(otherjunk[0], agent, options.name).play(options.numGames)
+    if outcomes:
+        pacman.printSummary([o['score'] for o in outcomes], [o['win'] for o in outcomes])
@@ -16,19 +16,21 @@ from game import Agent
 from game import Actions
 from game import Directions
 import random
+from array import array
 from util import manhattanDistance
 import util
 
 class GhostAgent( Agent ):
-    def __init__( self, index ):
+    def __init__( self, index, rng=None ):
         self.index = index
+        self.rng = rng # Random stream to sample moves from; see ClassicGameRules.newGame
 
     def getAction( self, state ):
         dist = self.getDistribution(state)
         if len(dist) == 0:
             return Directions.STOP
         else:
-            return util.chooseFromDistribution( dist )
+            return util.chooseFromDistribution( dist, self.rng )
 
     def getDistribution(self, state):
         "Returns a Counter encoding a distribution over actions from the provided state."
@@ -44,8 +46,8 @@ class RandomGhost( GhostAgent ):
 
 class DirectionalGhost( GhostAgent ):
     "A ghost that prefers to rush Pacman, or flee when scared."
-    def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8 ):
-        self.index = index
+    def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8, rng=None ):
+        GhostAgent.__init__( self, index, rng )
         self.prob_attack = prob_attack
         self.prob_scaredFlee = prob_scaredFlee
 
@@ -79,3 +81,122 @@ class DirectionalGhost( GhostAgent ):
         for a in legalActions: dist[a] += ( 1-bestProb ) / len(legalActions)
         dist.normalize()
         return dist
+
+class MazeGhost( DirectionalGhost ):
+    """
+    A DirectionalGhost that measures distance to Pacman through the maze
+    rather than as the crow flies, using the layout's DistanceField.
+    """
+    def getAction( self, state ):
+        # Samples the same distribution as getDistribution without building
+        # it: with probability bestProb one of the best actions, and
+        # otherwise any legal action.
+        legalActions = state.getLegalActions( self.index )
+        if len(legalActions) == 0: return Directions.STOP
+        bestActions, bestProb = self._bestActions( state, legalActions )
+        rng = self.rng
+        if rng == None: rng = random
+        if rng.random() < bestProb:
+            return bestActions[int(rng.random() * len(bestActions))]
+        return legalActions[int(rng.random() * len(legalActions))]
+
+    def getDistribution( self, state ):
+        legalActions = state.getLegalActions( self.index )
+        dist = util.Counter()
+        if len(legalActions) == 0: return dist
+        bestActions, bestProb = self._bestActions( state, legalActions )
+        for a in bestActions: dist[a] = bestProb / len(bestActions)
+        for a in legalActions: dist[a] += ( 1-bestProb ) / len(legalActions)
+        dist.normalize()
+        return dist
+
+    def _bestActions( self, state, legalActions ):
+        ghostState = state.data.agentStates[self.index]
+        field = getDistanceField( state.data.layout.walls )
+        x, y = ghostState.configuration.pos
+        pacmanPosition = state.data.agentStates[0].configuration.pos
+        isScared = ghostState.scaredTimer > 0
+        speed = 1
+        if isScared: speed = 0.5
+
+        distances = []
+        for action in legalActions:
+            dx, dy = Actions._directions[action]
+            distances.append( field.distance( (x + dx * speed, y + dy * speed), pacmanPosition ) )
+        if isScared:
+            bestScore, bestProb = max( distances ), self.prob_scaredFlee
+        else:
+            bestScore, bestProb = min( distances ), self.prob_attack
+        return [action for action, distance in zip( legalActions, distances ) if distance == bestScore], bestProb
+
+UNREACHABLE = 0xFFFF
+
+class DistanceField:
+    """
+    The maze distance between every pair of open cells of a layout, found
+    with a breadth-first search from each cell and kept in a flat array, so
+    a distance is one lookup.  Build fields with getDistanceField, which
+    shares them between ghosts and games.
+    """
+    def __init__( self, walls ):
+        cells = [(x, y) for x in range(walls.width) for y in range(walls.height) if not walls[x][y]]
+        self.index = dict([(cell, i) for i, cell in enumerate(cells)])
+        n = self.size = len(cells)
+        neighbors = [[self.index[(x + dx, y + dy)] for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]
+                      if (x + dx, y + dy) in self.index] for x, y in cells]
+        distances = self.distances = array('H', [UNREACHABLE]) * (n * n)
+        for source in range(n):
+            row = source * n
+            distances[row + source] = 0
+            frontier, depth = [source], 0
+            while frontier:
+                depth += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in neighbors[cell]:
+                        if distances[row + neighbor] == UNREACHABLE:
+                            distances[row + neighbor] = depth
+                            nextFrontier.append(neighbor)
+                frontier = nextFrontier
+
+    def distance( self, pos1, pos2 ):
+        """
+        The maze distance from pos1 to pos2.  Positions halfway between two
+        cells (those of scared ghosts) are half a step from each of them.
+        """
+        index = self.index
+        if pos1 in index and pos2 in index:
+            return self.distances[index[pos1] * self.size + index[pos2]]
+        best = UNREACHABLE
+        for a, offsetA in _cellsAround(pos1):
+            for b, offsetB in _cellsAround(pos2):
+                if a in index and b in index:
+                    best = min(best, self.distances[index[a] * self.size + index[b]] + offsetA + offsetB)
+        return best
+
+def _cellsAround( pos ):
+    "The cells next to pos and how far it is from each."
+    x, y = pos
+    xs, ys = set([int(x), int(x + 0.5)]), set([int(y), int(y + 0.5)])
+    return [((cx, cy), abs(x - cx) + abs(y - cy)) for cx in xs for cy in ys]
+
+_DISTANCE_FIELDS = {} # packed walls -> DistanceField
+_RECENT_FIELDS = [] # (walls, DistanceField), most recently used first
+RECENT_FIELDS_SIZE = 4
+
+def getDistanceField( walls ):
+    """
+    Returns the DistanceField of a walls Grid, building it the first time
+    any layout with these walls is seen.  The few Grids asked about last
+    are remembered, so they skip packing their walls into a key.
+    """
+    for i, (recentWalls, field) in enumerate(_RECENT_FIELDS):
+        if recentWalls is walls:
+            if i > 0: _RECENT_FIELDS.insert(0, _RECENT_FIELDS.pop(i))
+            return field
+    key = walls.packBits()
+    if key not in _DISTANCE_FIELDS:
+        _DISTANCE_FIELDS[key] = DistanceField(walls)
+    _RECENT_FIELDS.insert(0, (walls, _DISTANCE_FIELDS[key]))
+    del _RECENT_FIELDS[RECENT_FIELDS_SIZE:]
+    return _DISTANCE_FIELDS[key]
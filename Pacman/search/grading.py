@@ -15,6 +15,9 @@
 "Common code for autograders"
 
 import cgi
+import hashlib
+import os
+import pickle
 import time
 import sys
 import json
@@ -75,8 +78,9 @@ class Grades:
 
       if self.mute: util.mutePrint()
       try:
-        util.TimeoutFunction(getattr(gradingModule, q),1800)(self) # Call the question's function
-        #TimeoutFunction(getattr(gradingModule, q),1200)(self) # Call the question's function
+        # Per-move timeouts inside the question nest within this one
+        with util.Deadline(1800):
+          getattr(gradingModule, q)(self) # Call the question's function
       except Exception as inst:
         self.addExceptionMessage(q, inst, traceback)
         self.addErrorHints(exceptionMap, inst, q[1])
@@ -148,11 +152,14 @@ to follow your instructor's guidelines to receive credit on your project.
     """
     self.fail('FAIL: Exception raised: %s' % inst)
     self.addMessage('')
-    for line in traceback.format_exc().split('\n'):
+    text = traceback.format_exc()
+    if 'tracebackText' in dir(inst): text = inst.tracebackText
+    for line in text.split('\n'):
         self.addMessage(line)
 
   def addErrorHints(self, exceptionMap, errorInstance, questionNum):
     typeOf = str(type(errorInstance))
+    if 'typeName' in dir(errorInstance): typeOf = errorInstance.typeName
     questionName = 'q' + questionNum
     errorHint = ''
 
@@ -302,7 +309,425 @@ to follow your instructor's guidelines to receive credit on your project.
       #self.messages[self.currentQuestion].append(line)
 
 
+class RemoteTestException(Exception):
+  """
+  An exception raised by a test in a worker process, raised again in the
+  grading process when the test is replayed.  It reads as the original:
+  same message, and the original's type and traceback for Grades to report.
+  """
+  def __init__(self, message, typeName, tracebackText):
+    Exception.__init__(self, message)
+    self.typeName = typeName
+    self.tracebackText = tracebackText
+
+
+class RecordingGrades:
+  """
+  Stands in for Grades while a test runs in a worker process.  The calls
+  the test makes and everything it prints are recorded in order, and
+  replay plays them back on the real Grades, so a test's messages, points
+  and output come out exactly as if it had run in place.
+  """
+  def __init__(self):
+    self.events = []
+    self.outcome = ('return', None)
+
+  def _record(self, method, *args):
+    self.events.append(('call', method, args))
+
+  def fail(self, message, raw=False):
+    self._record('fail', message, raw)
+
+  def assignZeroCredit(self):
+    self._record('assignZeroCredit')
+
+  def addPoints(self, amt):
+    self._record('addPoints', amt)
+
+  def deductPoints(self, amt):
+    self._record('deductPoints', amt)
+
+  def assignFullCredit(self, message="", raw=False):
+    self._record('assignFullCredit', message, raw)
+
+  def addMessage(self, message, raw=False):
+    self._record('addMessage', message, raw)
+
+  def addMessageToEmail(self, message):
+    self._record('addMessageToEmail', message)
 
+  # Stands in for sys.stdout too
+  def write(self, text):
+    if text: self.events.append(('print', text))
+
+  def flush(self):
+    pass
+
+  def replayEvents(self, grades):
+    "Plays back what the test printed and did to its grades."
+    for event in self.events:
+      if event[0] == 'print':
+        sys.stdout.write(event[1])
+      else:
+        getattr(grades, event[1])(*event[2])
+
+  def replay(self, grades):
+    "Plays the test back on grades and returns (or raises) what it did."
+    self.replayEvents(grades)
+    kind = self.outcome[0]
+    if kind == 'return':
+      return self.outcome[1]
+    if kind == 'raise':
+      raise RemoteTestException(*self.outcome[1:])
+    if kind == 'exit':
+      raise SystemExit(self.outcome[1])
+    if kind == 'timeout':
+      raise util.TimeoutFunctionException('Test timed out after %s seconds' % self.outcome[1])
+    raise RemoteTestException('Test process died (exit code %s)' % self.outcome[1],
+                              'crash', 'The test process died before reporting its result.')
+
+
+def runRecorded(thunk):
+  """
+  Runs thunk in this process against a RecordingGrades and returns the
+  recording.  An exception the test raises propagates as it is, once
+  what the test did before it has been recorded into it.
+  """
+  recording = RecordingGrades()
+  stdout = sys.stdout
+  sys.stdout = recording
+  try:
+    recording.outcome = ('return', thunk(recording))
+  except BaseException as inst:
+    inst.recording = recording
+    raise
+  finally:
+    sys.stdout = stdout
+  return recording
+
+
+def _runRecorded(thunk, connection, timeout):
+  "Body of a TestPool worker: runs thunk against a RecordingGrades."
+  util.forgetDeadlines()
+  util.unmutePrint()
+  recording = RecordingGrades()
+  # Left in place to the end: the process exits without flushing the
+  # stdout it inherited, which may hold the parent's buffered output
+  sys.stdout = recording
+  try:
+    with util.Deadline(timeout):
+      recording.outcome = ('return', thunk(recording))
+  except SystemExit as inst:
+    recording.outcome = ('exit', inst.code)
+  except Exception as inst:
+    recording.outcome = ('raise', str(inst), str(type(inst)), traceback.format_exc())
+  connection.send(recording)
+  connection.close()
+
+
+class TestPool:
+  """
+  Runs test thunks in forked worker processes, at most jobs at once, in
+  the order they were submitted.  Each test gets a process of its own, so
+  one that crashes or hangs takes nothing else with it: a test still
+  running timeout seconds (plus KILL_GRACE, for code that swallows the
+  timeout) after it started is killed and replays as a timeout.
+  """
+  KILL_GRACE = 5
+
+  def __init__(self, jobs, timeout=None):
+    import multiprocessing
+    self.context = multiprocessing.get_context('fork')
+    self.jobs = max(1, jobs)
+    self.timeout = timeout
+    self.queue = [] # (key, thunk) not started yet
+    self.running = {} # connection -> (key, process, kill time)
+    self.done = {} # key -> RecordingGrades
+
+  def submit(self, key, thunk):
+    """
+    Queues thunk (a function of a Grades) to run under key and returns a
+    thunk that waits for it and replays it on the Grades it is given.
+    """
+    self.queue.append((key, thunk))
+    self._start()
+    return lambda grades: self.result(key).replay(grades)
+
+  def result(self, key):
+    "Waits for the test submitted under key and returns its RecordingGrades."
+    from multiprocessing.connection import wait
+    while key not in self.done:
+      self._start()
+      killTimes = [entry[2] for entry in self.running.values() if entry[2] != None]
+      delay = None
+      if killTimes: delay = max(0, min(killTimes) - time.time())
+      for connection in wait(list(self.running), delay):
+        self._collect(connection)
+      self._killExpired()
+    return self.done[key]
+
+  def close(self):
+    "Kills whatever is still running and drops what has not started."
+    self.queue = []
+    for connection, (key, process, killAt) in list(self.running.items()):
+      process.kill()
+      process.join()
+      connection.close()
+    self.running = {}
+
+  def _start(self):
+    while self.queue and len(self.running) < self.jobs:
+      key, thunk = self.queue.pop(0)
+      receiver, sender = self.context.Pipe(False)
+      process = self.context.Process(target=_runRecorded, args=(thunk, sender, self.timeout))
+      process.daemon = True
+      sys.stdout.flush()
+      process.start()
+      sender.close()
+      killAt = None
+      if self.timeout != None: killAt = time.time() + self.timeout + self.KILL_GRACE
+      self.running[receiver] = (key, process, killAt)
+
+  def _collect(self, connection):
+    key, process, killAt = self.running.pop(connection)
+    try:
+      recording = connection.recv()
+    except (EOFError, OSError):
+      recording = None
+    connection.close()
+    process.join()
+    if recording == None:
+      recording = RecordingGrades()
+      recording.outcome = ('crash', process.exitcode)
+    self.done[key] = recording
+
+  def _killExpired(self):
+    now = time.time()
+    for connection, (key, process, killAt) in list(self.running.items()):
+      if killAt != None and now >= killAt:
+        process.kill()
+        process.join()
+        connection.close()
+        del self.running[connection]
+        recording = RecordingGrades()
+        recording.outcome = ('timeout', self.timeout)
+        self.done[key] = recording
+
+
+class ResultCache:
+  """
+  Results of test cases kept between autograder runs.  Each is stored
+  under a digest of every file its result depends on, and an unchanged
+  test is replayed from its recording instead of run.  Only tests that
+  returned are kept; one that raised or timed out runs again next time.
+  With force, nothing is replayed, but the fresh results are still kept.
+  """
+  VERSION = 1
+
+  def __init__(self, path, force=False):
+    self.path = path
+    self.force = force
+    self.results = {} # test key -> (digest, RecordingGrades)
+    self.hashes = {} # file path -> sha1 of its contents, this run
+    self.changed = False
+    self.replayed = 0
+    try:
+      with open(path, 'rb') as handle:
+        version, results = pickle.load(handle)
+      if version == self.VERSION: self.results = results
+    except Exception:
+      # Missing, cut short or from another version: start afresh
+      self.results = {}
+
+  def fileDigest(self, path):
+    if path not in self.hashes:
+      try:
+        with open(path, 'rb') as handle:
+          self.hashes[path] = hashlib.sha1(handle.read()).hexdigest()
+      except (IOError, OSError):
+        self.hashes[path] = 'missing'
+    return self.hashes[path]
+
+  def digest(self, paths):
+    "Returns a digest of the contents of the files at paths."
+    text = '\n'.join(['%s %s' % (path, self.fileDigest(path)) for path in paths])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+  def wrap(self, key, digest, thunk, pool=None):
+    """
+    Returns the thunk to grade the test stored under key with: it replays
+    the cached result if digest still matches, and otherwise runs thunk
+    (in pool, if one is given) and keeps its result.
+    """
+    entry = self.results.get(key)
+    if not self.force and entry != None and entry[0] == digest:
+      self.replayed += 1
+      return lambda grades: entry[1].replay(grades)
+    if pool != None:
+      pool.submit(key, thunk)
+      return lambda grades: self._keep(key, digest, pool.result(key)).replay(grades)
+    def run(grades):
+      try:
+        recording = runRecorded(thunk)
+      except BaseException as inst:
+        if 'recording' in dir(inst): inst.recording.replayEvents(grades)
+        raise
+      return self._keep(key, digest, recording).replay(grades)
+    return run
+
+  def _keep(self, key, digest, recording):
+    if recording.outcome[0] == 'return':
+      self.results[key] = (digest, recording)
+      self.changed = True
+    return recording
+
+  def save(self):
+    if not self.changed: return
+    temporary = '%s.%d' % (self.path, os.getpid())
+    try:
+      with open(temporary, 'wb') as handle:
+        pickle.dump((self.VERSION, self.results), handle, pickle.HIGHEST_PROTOCOL)
+      os.replace(temporary, self.path)
+      self.changed = False
+    except (IOError, OSError):
+      if os.path.exists(temporary): os.remove(temporary)
+
+
+class PerformanceLog:
+  """
+  Wall time, peak memory and nodes expanded of each test case, for the
+  autograder's performance gate.  The time is that of the test's real,
+  untraced run.  Tracing allocations slows Python code down several times
+  over, and unevenly, so the peak memory is taken by tracemalloc on a
+  second run of the test in a forked process, whose results are thrown
+  away along with anything the rerun changed.  Nodes expanded are read
+  from the test case's expanded attribute.
+
+  The log is saved as a baseline JSON file and later runs are compared
+  against it: a measurement regresses when it exceeds the baseline value
+  times its tolerance plus a small absolute slack (PERFORMANCE_SLACK),
+  which keeps millisecond tests from failing on timer noise.
+  """
+  VERSION = 1
+  METRICS = ['seconds', 'peakBytes', 'expanded']
+  PERFORMANCE_SLACK = {'seconds': 0.1, 'peakBytes': 64 * 1024, 'expanded': 0}
+
+  def __init__(self):
+    self.tests = {} # test path -> {metric: value}
+
+  def wrap(self, key, testCase, thunk):
+    "Returns thunk, measured into the log under key."
+    def run(grades):
+      start = time.perf_counter()
+      try:
+        result = thunk(grades)
+      finally:
+        self.tests[key] = {'seconds': round(time.perf_counter() - start, 4), 'peakBytes': None,
+                           'expanded': testCase.expanded}
+      self.tests[key]['peakBytes'] = self.peakMemory(thunk)
+      return result
+    return run
+
+  def peakMemory(self, thunk):
+    """
+    Returns the peak bytes traced while thunk runs against a RecordingGrades
+    in a forked process, or None if that process died without reporting.
+    """
+    import multiprocessing
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(False)
+    process = context.Process(target=_tracePeak, args=(thunk, sender))
+    process.daemon = True
+    sys.stdout.flush()
+    process.start()
+    sender.close()
+    try:
+      return receiver.recv()
+    except (EOFError, OSError):
+      return None
+    finally:
+      receiver.close()
+      if process.is_alive(): process.kill()
+      process.join()
+
+  def save(self, path):
+    with open(path, 'w') as handle:
+      json.dump({'version': self.VERSION, 'tests': self.tests}, handle, indent=1, sort_keys=True)
+      handle.write('\n')
+
+  @staticmethod
+  def load(path):
+    "Returns the measurements saved in the baseline at path, by test."
+    with open(path) as handle:
+      baseline = json.load(handle)
+    if baseline.get('version') != PerformanceLog.VERSION:
+      raise Exception('%s is not a performance baseline this autograder can read' % path)
+    return baseline['tests']
+
+  def compare(self, baseline, tolerances):
+    """
+    Returns the regressions against baseline (as returned by load) as a
+    list of (test, metric, baseline value, value, limit); tolerances maps
+    each metric to the factor it may grow by.
+    """
+    regressions = []
+    for test in sorted(self.tests):
+      if test not in baseline: continue
+      for metric in self.METRICS:
+        old, new = baseline[test].get(metric), self.tests[test][metric]
+        if old == None or new == None: continue
+        limit = old * tolerances[metric] + self.PERFORMANCE_SLACK[metric]
+        if new > limit:
+          regressions.append((test, metric, old, new, limit))
+    return regressions
+
+  def report(self, baselinePath, tolerances):
+    """
+    Prints how this run compares with the baseline at baselinePath and
+    returns whether it passes the gate.
+    """
+    baseline = self.load(baselinePath)
+    regressions = self.compare(baseline, tolerances)
+    new = [test for test in sorted(self.tests) if test not in baseline]
+    print('\nPerformance against %s\n%s' % (baselinePath, '=' * (24 + len(baselinePath))))
+    print('%d test cases compared, tolerances: %s' % (len(self.tests) - len(new),
+          ', '.join(['%s x%s' % (metric, tolerances[metric]) for metric in self.METRICS])))
+    for test in new:
+      print('*** NEW: %s has no baseline' % test)
+    if not regressions:
+      print('*** PASS: no performance regressions')
+      return True
+    rows = [('test', 'metric', 'baseline', 'now', 'limit', 'change')]
+    for test, metric, old, new, limit in regressions:
+      change = '+inf'
+      if old > 0: change = '+%d%%' % round(100.0 * (new - old) / old)
+      rows.append((test, metric, _formatMetric(metric, old), _formatMetric(metric, new),
+                   _formatMetric(metric, limit), change))
+    widths = [max([len(row[i]) for row in rows]) for i in range(len(rows[0]))]
+    print('*** FAIL: %d performance regressions' % len(regressions))
+    for row in rows:
+      print('***   ' + '  '.join([cell.ljust(width) for cell, width in zip(row, widths)]).rstrip())
+    return False
+
+def _tracePeak(thunk, connection):
+  "Body of PerformanceLog.peakMemory's process."
+  import tracemalloc
+  util.forgetDeadlines()
+  util.unmutePrint()
+  tracemalloc.start()
+  try:
+    runRecorded(thunk)
+  except (Exception, SystemExit):
+    pass # Measured up to where it stopped, as on the real run
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  connection.send(peak)
+  connection.close()
+
+def _formatMetric(metric, value):
+  if metric == 'seconds': return '%.3fs' % value
+  if metric == 'peakBytes': return '%.1fKiB' % (value / 1024.0)
+  return '%d' % value
 
 
 class Counter(dict):
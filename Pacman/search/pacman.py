@@ -43,6 +43,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -71,14 +72,24 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # Explored-state tracking is opt-in instrumentation (see ExploredTracker).
+    # The default tracker is attached to every newly initialized state;
+    # ClassicGameRules.newGame can attach a per-game tracker instead.  Both
+    # are inherited by successors and copies of the state.
+    defaultExploredTracker = None
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
-        return tmp
+        tracker = GameState.defaultExploredTracker
+        if tracker == None: return set()
+        return tracker.getAndReset()
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def trackExplored( self, tracker ):
+        """
+        Records the states generated from this one (and their successors) in
+        tracker, an ExploredTracker.  Pass None to stop tracking.
+        """
+        self.exploredTracker = tracker
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
@@ -100,29 +111,86 @@ class GameState:
 
         # Copy current state
         state = GameState(self)
+        state._play( agentIndex, action )
+        state.data.updateHash( self.data )
+        if self.exploredTracker != None:
+            self.exploredTracker.record(self, state)
+        return state
 
+    def apply( self, action, agentIndex=0 ):
+        """
+        Plays the action for the agent (Pacman by default) in this state itself,
+        instead of in a copy as generateSuccessor does, and returns a token that
+        undo takes to restore the state.  Moves must be undone in the reverse
+        order they were applied.  States played this way are not recorded by
+        the exploredTracker.
+        """
+        if self.isWin() or self.isLose(): raise Exception('Can\'t apply an action to a terminal state.')
+        data = self.data
+        if agentIndex == 0:
+            # Pacman can eat a capsule, scaring every ghost, or run into ghosts
+            agents = [(i, agentState.configuration, agentState.scaredTimer)
+                      for i, agentState in enumerate(data.agentStates)]
+            capsules = data.capsules
+            if Actions.getSuccessor(data.agentStates[0].configuration.pos, action) in capsules:
+                data.capsules = capsules[:] # consume removes it in place
+            eaten = None
+        else:
+            agentState = data.agentStates[agentIndex]
+            agents = [(agentIndex, agentState.configuration, agentState.scaredTimer)]
+            capsules = None
+            eaten = data._eaten[agentIndex]
+        token = (agents, capsules, eaten, data.food, data._eaten, data.score, data.scoreChange,
+                 data._foodEaten, data._foodAdded, data._capsuleEaten, data._agentMoved,
+                 data._hash, data._agentKeys)
+
+        # What GameStateData( prevState ) starts a successor with
+        data._foodEaten = data._foodAdded = data._capsuleEaten = None
+        data.scoreChange = 0
+        self._play( agentIndex, action )
+        data.rehash( token[11], token[12], token[5] )
+        return token
+
+    def undo( self, token ):
+        "Takes back the move that apply returned token for."
+        agents, capsules, eaten, food, agentsEaten, score, scoreChange, foodEaten, foodAdded, \
+            capsuleEaten, agentMoved, stateHash, agentKeys = token
+        data = self.data
+        for index, configuration, scaredTimer in agents:
+            agentState = data.agentStates[index]
+            agentState.configuration = configuration
+            agentState.scaredTimer = scaredTimer
+        if capsules != None: data.capsules = capsules
+        data.food = food
+        data._eaten = agentsEaten
+        if eaten != None: agentsEaten[agents[0][0]] = eaten
+        data.score, data.scoreChange = score, scoreChange
+        data._foodEaten, data._foodAdded, data._capsuleEaten = foodEaten, foodAdded, capsuleEaten
+        data._agentMoved = agentMoved
+        data._hash, data._agentKeys = stateHash, agentKeys
+        data._win = data._lose = False
+
+    def _play( self, agentIndex, action ):
+        "Edits this state by the rules to reflect the agent's move."
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
-            state.data._eaten = [False for i in range(state.getNumAgents())]
-            PacmanRules.applyAction( state, action )
+            self.data._eaten = [False for i in range(self.getNumAgents())]
+            PacmanRules.applyAction( self, action )
         else:                # A ghost is moving
-            GhostRules.applyAction( state, action, agentIndex )
+            GhostRules.applyAction( self, action, agentIndex )
 
         # Time passes
         if agentIndex == 0:
-            state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
+            self.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( self.data.agentStates[agentIndex] )
 
         # Resolve multi-agent effects
-        GhostRules.checkDeath( state, agentIndex )
+        GhostRules.checkDeath( self, agentIndex )
 
         # Book keeping
-        state.data._agentMoved = agentIndex
-        state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
-        return state
+        self.data._agentMoved = agentIndex
+        self.data.score += self.data.scoreChange
 
     def getLegalPacmanActions( self ):
         return self.getLegalActions( 0 )
@@ -223,8 +291,10 @@ class GameState:
         """
         if prevState != None: # Initial state
             self.data = GameStateData(prevState.data)
+            self.exploredTracker = prevState.exploredTracker
         else:
             self.data = GameStateData()
+            self.exploredTracker = GameState.defaultExploredTracker
 
     def deepCopy( self ):
         state = GameState( self )
@@ -253,6 +323,61 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+class ExploredTracker:
+    """
+    Records the states passed through GameState.generateSuccessor, for
+    instrumenting how much of the state space an agent explores.
+
+    mode 'set' keeps every distinct state (memory grows with the search).
+    mode 'count' only counts successor calls.
+    mode 'sample' keeps a hash-based sample of at most maxStates distinct
+      states: whenever the sample overflows, only states whose hash has one
+      more trailing zero bit are kept, so getNumExplored stays an unbiased
+      estimate of the number of distinct states.
+    """
+    def __init__( self, mode='set', maxStates=10000 ):
+        if mode not in ['set', 'count', 'sample']:
+            raise Exception('Unknown explored tracking mode ' + str(mode))
+        self.mode = mode
+        self.maxStates = maxStates
+        self.reset()
+
+    def reset( self ):
+        self.numSuccessors = 0
+        self.states = set()
+        self.sampleBits = 0
+
+    def record( self, state, successor ):
+        self.numSuccessors += 1
+        if self.mode == 'set':
+            self.states.add(state)
+            self.states.add(successor)
+        elif self.mode == 'sample':
+            mask = (1 << self.sampleBits) - 1
+            for s in (state, successor):
+                if hash(s) & mask == 0:
+                    self.states.add(s)
+            while len(self.states) > self.maxStates:
+                self.sampleBits += 1
+                mask = (1 << self.sampleBits) - 1
+                self.states = set([s for s in self.states if hash(s) & mask == 0])
+
+    def getNumExplored( self ):
+        """
+        Returns the number of distinct states seen (an estimate in 'sample'
+        mode), or None in 'count' mode.
+        """
+        if self.mode == 'count': return None
+        return len(self.states) << self.sampleBits
+
+    def getAndReset( self ):
+        """
+        Returns the recorded (or sampled) states and starts over.
+        """
+        states = self.states
+        self.reset()
+        return states
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
@@ -271,12 +396,27 @@ class ClassicGameRules:
     def __init__(self, timeout=30):
         self.timeout = timeout
 
-    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False):
+    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False, exploredTracker=None, rng=None):
+        """
+        Sets up a game.  rng, if given, is the game's random stream (see
+        util.randomStream): it is handed to every agent with an 'rng'
+        attribute, so the game's randomness does not depend on what else
+        draws from the random module.  Agents with a 'moveWarningTime'
+        attribute are told how long they may take per move.
+        """
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize( layout, len(ghostAgents) )
+        if exploredTracker != None:
+            initState.trackExplored( exploredTracker )
+        if rng != None:
+            for agent in agents:
+                if 'rng' in dir(agent): agent.rng = rng
+        for index, agent in enumerate(agents):
+            if 'moveWarningTime' in dir(agent): agent.moveWarningTime = self.getMoveWarningTime(index)
         game = Game(agents, display, self, catchExceptions=catchExceptions)
         game.state = initState
+        game.rng = rng
         self.initialState = initState.deepCopy()
         self.quiet = quiet
         return game
@@ -364,8 +504,7 @@ class PacmanRules:
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
+            numFood = state.getNumFood() # O(1): the food grid keeps its count
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
@@ -414,7 +553,10 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            # Replace rather than edit the configuration: it is shared with the
+            # predecessor state, whose hash must not change under it.
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration( nearestPoint( configuration.pos ), configuration.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -512,7 +654,9 @@ def readCommand( argv ):
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file to replay', default=None)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int',
+                      help=default('The move to start the replay at'), default=0)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -521,8 +665,14 @@ def readCommand( argv ):
                       help=default('Time to delay between frames; <0 means keyboard'), default=0.1)
     parser.add_option('-c', '--catchExceptions', action='store_true', dest='catchExceptions',
                       help='Turns on exception handling and timeouts during games', default=False)
-    parser.add_option('--timeout', dest='timeout', type='int',
+    parser.add_option('--timeout', dest='timeout', type='float',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes to play the games in (1 plays them in this process)'), default=1)
+    parser.add_option('--agentProcesses', action='store_true', dest='agentProcesses',
+                      help='Runs each agent in its own process, killed if it times out', default=False)
+    parser.add_option('--serve', dest='serve', metavar='ADDRESS',
+                      help='Plays NUMGAMES games against Pacman agents connecting to ADDRESS (HOST:PORT or unix:PATH; see gameServer.py)', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -536,6 +686,14 @@ def readCommand( argv ):
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
 
+    # Special case: served games get their Pacman agents from remote clients
+    if options.serve != None:
+        import gameServer
+        ghostType = loadAgent(options.ghost, True)
+        ghosts = [ghostType( i+1 ) for i in range( options.numGhosts )]
+        gameServer.serve(options.serve, args['layout'], ghosts, options.numGames, options.timeout, options.record)
+        sys.exit(0)
+
     # Choose a Pacman agent
     noKeyboard = options.gameToReplay == None and (options.textGraphics or options.quietGraphics)
     pacmanType = loadAgent(options.pacman, noKeyboard)
@@ -570,16 +728,21 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    args['agentProcesses'] = options.agentProcesses
+    if options.agentProcesses and options.workers > 1:
+        raise Exception('--agentProcesses cannot be combined with --workers')
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print('Replaying recorded game %s.' % options.gameToReplay)
-        import pickle
-        f = open(options.gameToReplay, 'rb')
-        try: recorded = pickle.load(f)
-        finally: f.close()
-        recorded['display'] = args['display']
-        replayGame(**recorded)
+        import recording
+        if options.replayFrom > 0:
+            state, actions = recording.seekRecording(options.gameToReplay, options.replayFrom)
+            replayGame(state.data.layout, actions, args['display'], state)
+        else:
+            recorded = recording.loadRecording(options.gameToReplay)
+            replayGame(recorded.layout, recorded.actions, args['display'], recorded.initialState())
         sys.exit(0)
 
     return args
@@ -607,11 +770,18 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def replayGame( layout, actions, display ):
+def replayGame( layout, actions, display, startState = None ):
+    """
+    Replays actions from startState, by default the start of a game with
+    all of the layout's ghosts.
+    """
     import pacmanAgents, ghostAgents
     rules = ClassicGameRules()
-    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(layout.getNumGhosts())]
+    numGhosts = layout.getNumGhosts()
+    if startState != None: numGhosts = startState.getNumAgents() - 1
+    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(numGhosts)]
     game = rules.newGame( layout, agents[0], agents[1:], display )
+    if startState != None: game.state = startState
     state = game.state
     display.initialize(state.data)
 
@@ -625,46 +795,161 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=1, agentProcesses=False ):
     import __main__
     __main__.__dict__['_display'] = display
 
+    if workers > 1:
+        return runGamesInParallel( layout, pacman, ghosts, numGames, record, numTraining, catchExceptions, timeout, workers )
+
     rules = ClassicGameRules(timeout)
     games = []
-
-    for i in range( numGames ):
-        beQuiet = i < numTraining
-        if beQuiet:
-                # Suppress output and graphics
-            import textDisplay
-            gameDisplay = textDisplay.NullGraphics()
-            rules.quiet = True
-        else:
-            gameDisplay = display
-            rules.quiet = False
-        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
-        if not beQuiet: games.append(game)
-
-        if record:
-            import time, pickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = open(fname, 'wb')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            pickle.dump(components, f)
-            f.close()
+    masterSeed = random.getrandbits(64)
+    if agentProcesses:
+        # The agents' workers live (and learn) across all the games
+        import agentProcess
+        pacman = agentProcess.AgentProcess(pacman)
+        ghosts = [agentProcess.AgentProcess(ghost) for ghost in ghosts]
+
+    try:
+        for i in range( numGames ):
+            beQuiet = i < numTraining
+            if beQuiet:
+                    # Suppress output and graphics
+                import textDisplay
+                gameDisplay = textDisplay.NullGraphics()
+                rules.quiet = True
+            else:
+                gameDisplay = display
+                rules.quiet = False
+            rng = seedGame( masterSeed, i )
+            game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions, rng=rng)
+            if record:
+                import recording
+                game.recorder = recording.RecordingWriter( recordingName(i), layout, game.state.getNumAgents() )
+            game.run()
+            if not beQuiet: games.append(game)
+
+            if record:
+                game.recorder.close( game.state )
+    finally:
+        if agentProcesses:
+            for agent in [pacman] + ghosts: agent.close()
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
         wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print('Average Score:', sum(scores) / float(len(scores)))
-        print('Scores:       ', ', '.join([str(score) for score in scores]))
-        print('Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate))
-        print('Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins]))
+        printSummary( scores, wins )
 
     return games
 
+def seedGame( masterSeed, i ):
+    """
+    Returns the random stream of game i of a run and reseeds the random
+    module from the same pair, for agents that still draw from it.  This
+    makes each game's outcome depend only on (masterSeed, i), so serial and
+    parallel runs of the same games agree exactly.
+    """
+    random.seed(util.randomStream(masterSeed, i, 'global').getrandbits(64))
+    return util.randomStream(masterSeed, i, 'game')
+
+def recordingName( i ):
+    import time
+    return ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+
+def recordGame( layout, actions, numAgents, i ):
+    "Records a finished game given by its actions (see recording.py)."
+    import recording
+    recording.writeRecording( recordingName(i), layout, actions, numAgents )
+
+def printSummary( scores, wins ):
+    winRate = wins.count(True)/ float(len(wins))
+    print('Average Score:', sum(scores) / float(len(scores)))
+    print('Scores:       ', ', '.join([str(score) for score in scores]))
+    print('Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate))
+    print('Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins]))
+
+class GameResult:
+    """
+    What a worker process sends back about a game it played: the outcome,
+    the number of agents that played, the move history and the per-agent
+    computation time, but none of the agents or states.
+    """
+    def __init__( self, game, index, masterSeed ):
+        self.index = index
+        self.masterSeed = masterSeed
+        self.score = game.state.getScore()
+        self.win = game.state.isWin()
+        self.numAgents = game.state.getNumAgents()
+        self.moveHistory = game.moveHistory
+        self.totalAgentTimes = game.totalAgentTimes
+        self.agentCrashed = game.agentCrashed
+        self.agentTimeout = game.agentTimeout
+
+    def getScore( self ):
+        return self.score
+
+    def isWin( self ):
+        return self.win
+
+# What each worker process needs to set up a game; see _initWorker.
+_WORKER_SETUP = None
+
+def _initWorker( layout, pacman, ghosts, catchExceptions, timeout ):
+    global _WORKER_SETUP
+    import __main__, textDisplay
+    __main__.__dict__['_display'] = textDisplay.NullGraphics()
+    _WORKER_SETUP = (layout, pacman, ghosts, catchExceptions, timeout)
+
+def _playGame( task ):
+    """
+    Plays game number index of the run seeded with masterSeed.  Every game
+    gets fresh copies of the agents, so a game's outcome does not depend on
+    which worker plays it or what that worker played before.
+    """
+    import copy, textDisplay
+    index, masterSeed = task
+    layout, pacman, ghosts, catchExceptions, timeout = _WORKER_SETUP
+    rng = seedGame( masterSeed, index )
+    rules = ClassicGameRules(timeout)
+    game = rules.newGame( layout, copy.deepcopy(pacman), copy.deepcopy(ghosts), textDisplay.NullGraphics(), True, catchExceptions, rng=rng)
+    game.run()
+    return GameResult(game, index, masterSeed)
+
+def runGamesInParallel( layout, pacman, ghosts, numGames, record, numTraining, catchExceptions, timeout, workers ):
+    """
+    Plays the games in a pool of worker processes, without graphics, and
+    returns a list of GameResults in game order.  Games are seeded as in
+    runGames (see seedGame), so with -f (fixRandomSeed) the results are the
+    same as those of a serial run, whatever the number of workers.
+    """
+    import multiprocessing
+    if numTraining > 0:
+        raise Exception('Training games need a single agent learning across games; they cannot be run with --workers')
+    masterSeed = random.getrandbits(64)
+    tasks = [(i, masterSeed) for i in range(numGames)]
+
+    # Fork where possible so that agents that cannot be pickled (e.g. those
+    # holding lambdas) still reach the workers.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    pool = context.Pool(workers, _initWorker, (layout, pacman, ghosts, catchExceptions, timeout))
+    try:
+        chunksize = max(1, numGames // (4 * workers))
+        results = list(pool.imap(_playGame, tasks, chunksize))
+    finally:
+        pool.close()
+        pool.join()
+
+    for result in results:
+        if record:
+            recordGame( layout, result.moveHistory, result.numAgents, result.index )
+    if numGames > 0:
+        printSummary( [result.getScore() for result in results], [result.isWin() for result in results] )
+    return results
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
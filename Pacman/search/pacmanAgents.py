@@ -14,8 +14,11 @@
 
 from pacman import Directions
 from game import Agent
+import math
 import random
+import time
 import game
+import rollout
 import util
 
 class LeftTurnAgent(game.Agent):
@@ -33,9 +36,10 @@ class LeftTurnAgent(game.Agent):
         return Directions.STOP
 
 class GreedyAgent(Agent):
-    def __init__(self, evalFn="scoreEvaluation"):
+    def __init__(self, evalFn="scoreEvaluation", rng=None):
         self.evaluationFunction = util.lookup(evalFn, globals())
         assert self.evaluationFunction != None
+        self.rng = rng # Random stream for breaking ties; see ClassicGameRules.newGame
 
     def getAction(self, state):
         # Generate candidate actions
@@ -46,7 +50,355 @@ class GreedyAgent(Agent):
         scored = [(self.evaluationFunction(state), action) for state, action in successors]
         bestScore = max(scored)[0]
         bestActions = [pair[1] for pair in scored if pair[0] == bestScore]
-        return random.choice(bestActions)
+        rng = self.rng
+        if rng == None: rng = random
+        return rng.choice(bestActions)
 
 def scoreEvaluation(state):
     return state.getScore()
+
+class MCTSAgent(Agent):
+    """
+    Monte-Carlo tree search over Pacman's moves.  Each iteration walks down
+    the tree by UCT, letting the ghosts move by a rollout policy after each
+    of Pacman's moves, adds one node and scores it by the mean of a batch of
+    rollouts (see rollout.py).  The search runs until timePerMove seconds
+    have passed, or most of the rules' move warning time if that is less,
+    and Pacman makes the move tried most often.
+    """
+    def __init__(self, timePerMove=0.5, depth=20, rollouts=4, ghosts='directional',
+                 exploration=1.0, verbose=False, rng=None):
+        self.timePerMove = float(timePerMove)
+        self.depth = int(depth)
+        self.rolloutsPerLeaf = int(rollouts)
+        self.ghostPolicy = rollout.GHOST_POLICIES[ghosts]
+        self.exploration = float(exploration)
+        self.verbose = bool(int(verbose))
+        self.rng = rng # Random stream for rollouts; see ClassicGameRules.newGame
+        self.moveWarningTime = None # Set by ClassicGameRules.newGame
+        self.plies = 0
+        self.searchTime = 0.0
+
+    def registerInitialState(self, state):
+        self.plies = 0
+        self.searchTime = 0.0
+
+    def getAction(self, state):
+        start = time.perf_counter()
+        budget = self.timePerMove
+        if self.moveWarningTime != None: budget = min(budget, 0.8 * self.moveWarningTime)
+        rng = self.rng
+        if rng == None: rng = random
+
+        sim = rollout.SimState(state)
+        root = _TreeNode()
+        bounds = [None, None] # Lowest and highest values seen, to scale UCT by
+        iterations = 0
+        while iterations == 0 or time.perf_counter() - start < budget:
+            self._iterate(sim, root, bounds, rng)
+            iterations += 1
+
+        action = max(root.children.items(), key=lambda item: item[1].visits)[0]
+        elapsed = time.perf_counter() - start
+        self.plies += sim.plies
+        self.searchTime += elapsed
+        if self.verbose:
+            print('MCTS: %d iterations, %d plies in %.2fs (%d plies/s)' % (
+                iterations, sim.plies, elapsed, sim.plies / elapsed))
+        return rollout.ACTIONS[action]
+
+    def _iterate(self, sim, root, bounds, rng):
+        tokens = []
+        path = [root]
+        node = root
+        while not sim.isTerminal():
+            if node.untried == None:
+                # Ghosts move at random, so a node first reached when
+                # the game had ended may be reached later when it has not
+                node.untried = sim.getLegalActions(0)
+            if node.untried:
+                action = node.untried.pop(int(rng.random() * len(node.untried)))
+                expanding = True
+            else:
+                action = self._select(node, bounds)
+                expanding = False
+            tokens.append(sim.apply(0, action))
+            for index in range(1, sim.numAgents):
+                if sim.isTerminal(): break
+                tokens.append(sim.apply(index, self.ghostPolicy(sim, index, rng)))
+            if expanding:
+                node.children[action] = _TreeNode()
+            node = node.children[action]
+            path.append(node)
+            if expanding: break
+
+        if sim.isTerminal(): value = sim.evaluate()
+        else: value = rollout.rolloutBatch(sim, self.rolloutsPerLeaf, self.depth, self.ghostPolicy, rng)
+        for token in reversed(tokens): sim.undo(token)
+
+        if bounds[0] == None or value < bounds[0]: bounds[0] = value
+        if bounds[1] == None or value > bounds[1]: bounds[1] = value
+        for visited in path:
+            visited.visits += 1
+            visited.total += value
+
+    def _select(self, node, bounds):
+        low, high = bounds
+        scale = max(high - low, 1e-9)
+        logVisits = math.log(node.visits)
+        best, bestAction = None, None
+        for action, child in node.children.items():
+            score = (child.total / child.visits - low) / scale + \
+                    self.exploration * math.sqrt(logVisits / child.visits)
+            if best == None or score > best: best, bestAction = score, action
+        return bestAction
+
+    def getPliesPerSecond(self):
+        "Plies simulated per second of search so far this game."
+        if self.searchTime == 0: return 0.0
+        return self.plies / self.searchTime
+
+    def final(self, state):
+        if self.verbose:
+            print('MCTS: %d plies simulated at %d plies/s' % (self.plies, self.getPliesPerSecond()))
+
+class _TreeNode:
+    def __init__(self):
+        self.untried = None # Pacman's moves not yet tried here, once visited
+        self.children = {}
+        self.visits = 0
+        self.total = 0.0
+
+EXACT, LOWER, UPPER = range(3) # What a transposition table value is: exact or a bound
+
+class TranspositionTable:
+    """
+    A fixed-size table of search results keyed by Zobrist hash (hash of a
+    GameState) and the agent to move.  Each bucket has two slots: the first
+    keeps the deepest result, unless it is from an earlier move's search, and
+    the second takes whatever the first turns away, so recent shallow
+    results are kept too.
+    """
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.slots = [None] * (2 * size)
+        self.generation = 0
+
+    def newSearch(self):
+        "Marks what is stored so far as old, so new results replace it."
+        self.generation += 1
+
+    def lookup(self, key, agentIndex):
+        i = 2 * (key % self.size)
+        for entry in (self.slots[i], self.slots[i + 1]):
+            if entry != None and entry[0] == key and entry[1] == agentIndex: return entry
+        return None
+
+    def store(self, key, agentIndex, plies, value, flag, move):
+        i = 2 * (key % self.size)
+        entry = (key, agentIndex, plies, value, flag, move, self.generation)
+        deepest = self.slots[i]
+        if deepest == None or plies >= deepest[2] or deepest[6] != self.generation or \
+           (deepest[0] == key and deepest[1] == agentIndex):
+            self.slots[i] = entry
+        else:
+            self.slots[i + 1] = entry
+
+class _SearchTimeout(Exception):
+    pass
+
+class AdversarialSearchAgent(Agent):
+    """
+    Searches the game tree by iterative deepening, one round (a move by
+    Pacman and then by each ghost) deeper each time, until timePerMove
+    seconds have passed (or most of the rules' move warning time, if that is
+    less) or maxDepth rounds are done, and plays the best move of the
+    deepest search that finished.  Results are kept in a transposition
+    table, which also orders moves: the best move found before is tried
+    first.  Subclasses define search.
+    """
+    CHECK_INTERVAL = 256 # Nodes between looks at the clock
+
+    def __init__(self, evalFn="scoreEvaluation", timePerMove=0.5, maxDepth=20,
+                 tableSize=1 << 16, verbose=False):
+        self.evaluationFunction = util.lookup(evalFn, globals())
+        assert self.evaluationFunction != None
+        self.timePerMove = float(timePerMove)
+        self.maxDepth = int(maxDepth)
+        self.table = TranspositionTable(int(tableSize))
+        self.verbose = bool(int(verbose))
+        self.moveWarningTime = None # Set by ClassicGameRules.newGame
+        self.nodes = 0
+        self.searchTime = 0.0
+        self.depths = []
+
+    def registerInitialState(self, state):
+        self.nodes = 0
+        self.searchTime = 0.0
+        self.depths = []
+
+    def getAction(self, state):
+        start = time.perf_counter()
+        budget = self.timePerMove
+        if self.moveWarningTime != None: budget = min(budget, 0.8 * self.moveWarningTime)
+        self.stopAt = start + budget
+        self.table.newSearch()
+        startNodes = self.nodes
+
+        legal = state.getLegalActions(0)
+        bestAction, depth = legal[0], 0
+        # The search plays moves in place (GameState.apply) on its own copy,
+        # undoing each one even when a timeout unwinds it: the copy shares
+        # some of its data (the eaten list) with the live state
+        state = state.__class__(state)
+        try:
+            while depth < self.maxDepth:
+                bestAction = self.search(state, legal, (depth + 1) * state.getNumAgents())
+                depth += 1
+                # The best move so far is searched first next time
+                legal = [bestAction] + [action for action in legal if action != bestAction]
+        except _SearchTimeout:
+            pass
+
+        elapsed = time.perf_counter() - start
+        self.searchTime += elapsed
+        self.depths.append(depth)
+        if self.verbose:
+            nodes = self.nodes - startNodes
+            print('%s: depth %d, %d nodes in %.2fs (%d nodes/s)' % (
+                self.__class__.__name__, depth, nodes, elapsed, nodes / elapsed))
+        return bestAction
+
+    def search(self, state, legal, plies):
+        "Returns the best of Pacman's legal actions, searching plies agent moves deep."
+        util.raiseNotDefined()
+
+    def countNode(self):
+        self.nodes += 1
+        if self.nodes % self.CHECK_INTERVAL == 0 and time.perf_counter() > self.stopAt:
+            raise _SearchTimeout()
+
+    def orderMoves(self, legal, entry):
+        "Puts the best move in a transposition table entry first."
+        if entry == None or entry[5] == None or entry[5] not in legal: return legal
+        return [entry[5]] + [action for action in legal if action != entry[5]]
+
+    def getNodesPerSecond(self):
+        if self.searchTime == 0: return 0.0
+        return self.nodes / self.searchTime
+
+    def getEffectiveDepth(self):
+        "The mean depth, in rounds, of the searches that finished in time."
+        if not self.depths: return 0.0
+        return float(sum(self.depths)) / len(self.depths)
+
+    def final(self, state):
+        if self.verbose:
+            print('%s: %d nodes at %d nodes/s, effective depth %.2f' % (
+                self.__class__.__name__, self.nodes, self.getNodesPerSecond(), self.getEffectiveDepth()))
+
+class AlphaBetaAgent(AdversarialSearchAgent):
+    "Minimax with alpha-beta pruning: every ghost plays against Pacman."
+
+    def search(self, state, legal, plies):
+        alpha, beta = -float('inf'), float('inf')
+        bestAction = legal[0]
+        for action in legal:
+            token = state.apply(action, 0)
+            try:
+                value = self.alphaBeta(state, 1, plies - 1, alpha, beta)
+            finally:
+                state.undo(token)
+            if value > alpha: alpha, bestAction = value, action
+        return bestAction
+
+    def alphaBeta(self, state, agentIndex, plies, alpha, beta):
+        self.countNode()
+        if plies == 0 or state.isWin() or state.isLose():
+            return self.evaluationFunction(state)
+        key = hash(state)
+        entry = self.table.lookup(key, agentIndex)
+        if entry != None and entry[2] >= plies:
+            value, flag = entry[3], entry[4]
+            if flag == EXACT: return value
+            if flag == LOWER: alpha = max(alpha, value)
+            elif flag == UPPER: beta = min(beta, value)
+            if alpha >= beta: return value
+
+        originalAlpha, originalBeta = alpha, beta
+        nextAgent = (agentIndex + 1) % state.getNumAgents()
+        bestMove = None
+        if agentIndex == 0:
+            best = -float('inf')
+            for action in self.orderMoves(state.getLegalActions(agentIndex), entry):
+                token = state.apply(action, agentIndex)
+                try:
+                    value = self.alphaBeta(state, nextAgent, plies - 1, alpha, beta)
+                finally:
+                    state.undo(token)
+                if value > best: best, bestMove = value, action
+                alpha = max(alpha, best)
+                if alpha >= beta: break
+        else:
+            best = float('inf')
+            for action in self.orderMoves(state.getLegalActions(agentIndex), entry):
+                token = state.apply(action, agentIndex)
+                try:
+                    value = self.alphaBeta(state, nextAgent, plies - 1, alpha, beta)
+                finally:
+                    state.undo(token)
+                if value < best: best, bestMove = value, action
+                beta = min(beta, best)
+                if alpha >= beta: break
+
+        if best <= originalAlpha: flag = UPPER
+        elif best >= originalBeta: flag = LOWER
+        else: flag = EXACT
+        self.table.store(key, agentIndex, plies, best, flag, bestMove)
+        return best
+
+class ExpectimaxAgent(AdversarialSearchAgent):
+    "Expectimax: every ghost picks among its legal moves uniformly at random."
+
+    def search(self, state, legal, plies):
+        best, bestAction = -float('inf'), legal[0]
+        for action in legal:
+            token = state.apply(action, 0)
+            try:
+                value = self.expectimax(state, 1, plies - 1)
+            finally:
+                state.undo(token)
+            if value > best: best, bestAction = value, action
+        return bestAction
+
+    def expectimax(self, state, agentIndex, plies):
+        self.countNode()
+        if plies == 0 or state.isWin() or state.isLose():
+            return self.evaluationFunction(state)
+        key = hash(state)
+        entry = self.table.lookup(key, agentIndex)
+        if entry != None and entry[2] >= plies: return entry[3]
+
+        nextAgent = (agentIndex + 1) % state.getNumAgents()
+        legal = state.getLegalActions(agentIndex)
+        bestMove = None
+        if agentIndex == 0:
+            value = -float('inf')
+            for action in self.orderMoves(legal, entry):
+                token = state.apply(action, agentIndex)
+                try:
+                    successorValue = self.expectimax(state, nextAgent, plies - 1)
+                finally:
+                    state.undo(token)
+                if successorValue > value: value, bestMove = successorValue, action
+        else:
+            value = 0.0
+            for action in legal:
+                token = state.apply(action, agentIndex)
+                try:
+                    value += self.expectimax(state, nextAgent, plies - 1)
+                finally:
+                    state.undo(token)
+            value /= len(legal)
+        self.table.store(key, agentIndex, plies, value, EXACT, bestMove)
+        return value
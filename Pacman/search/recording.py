@@ -0,0 +1,450 @@
+# recording.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Recorded games in a compact binary format that is written as the game is
+played.
+
+A recording is laid out as follows (all integers little-endian):
+
+  header     MAGIC, the SHA-1 of the layout text, its length and the text,
+             the keyframe interval and the number of agents that played
+  body       one byte per move, (agentIndex << 3) | action code, with a
+             keyframe record (KEYFRAME, move number, length, full state)
+             after every keyframeInterval moves
+  outcome    OUTCOME, the number of moves, the final score, win and lose
+  index      INDEX, the number of keyframes and (move number, file offset)
+             for each
+  trailer    the offset of the index and INDEX_MAGIC
+
+Everything up to the outcome is streamed, so a game that crashes still
+leaves a readable recording; only the index, which lets stateAt jump to
+a move without simulating from the start, is missing.  Layouts are
+interned by their hash, so loading many recordings of one layout parses
+it once.  Recordings made by older versions (pickles of {'layout',
+'actions'}) still load, and convertRecording upgrades them; they are
+assumed to have been played with all of the layout's ghosts.
+
+Run 'python recording.py --convert FILE...' to convert old recordings, and
+'python recording.py --verify DIRECTORY' to check that the recordings in a
+directory still replay to the outcomes they recorded.
+"""
+
+import hashlib
+import os
+import pickle
+import struct
+from game import Directions, Configuration
+
+MAGIC = b'PACREC\x00\x01'
+INDEX_MAGIC = b'PACRIDX\x00'
+KEYFRAME, OUTCOME, INDEX = 0x80, 0x81, 0x82
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict([(action, code) for code, action in enumerate(ACTIONS)])
+MAX_AGENTS = 16 # Moves must stay below the record tags
+
+_LAYOUTS = {}
+
+def layoutHash( layoutText ):
+    return hashlib.sha1('\n'.join(layoutText).encode('utf-8')).digest()
+
+def internLayout( layoutText, digest=None ):
+    """
+    Returns the Layout for layoutText, sharing one object between all the
+    recordings of the same layout.
+    """
+    import layout
+    if digest == None: digest = layoutHash(layoutText)
+    if digest not in _LAYOUTS:
+        _LAYOUTS[digest] = layout.Layout(layoutText)
+    return _LAYOUTS[digest]
+
+class RecordingWriter:
+    """
+    Streams a game played by numAgents agents to path.  Call recordMove
+    after every move and close at the end of the game; Game.run does the
+    former for its recorder.
+    """
+    def __init__( self, path, layout, numAgents, keyframeInterval=100 ):
+        if numAgents > MAX_AGENTS:
+            raise Exception('Recordings hold at most %d agents' % MAX_AGENTS)
+        self.path = path
+        self.keyframeInterval = keyframeInterval
+        self.numMoves = 0
+        self.keyframes = []
+        self.file = open(path, 'wb')
+        text = '\n'.join(layout.layoutText).encode('utf-8')
+        self.file.write(MAGIC + layoutHash(layout.layoutText) + struct.pack('<I', len(text)) + text)
+        self.file.write(struct.pack('<IB', keyframeInterval, numAgents))
+
+    def recordMove( self, agentIndex, action, state ):
+        "Records a move; state is the state it led to."
+        self.file.write(bytes([(agentIndex << 3) | ACTION_CODES[action]]))
+        self.numMoves += 1
+        if self.keyframeInterval > 0 and self.numMoves % self.keyframeInterval == 0:
+            self.keyframes.append((self.numMoves, self.file.tell()))
+            frame = encodeState(state)
+            self.file.write(struct.pack('<BII', KEYFRAME, self.numMoves, len(frame)) + frame)
+
+    def close( self, finalState ):
+        "Writes the outcome of the game and the index."
+        self.file.write(struct.pack('<BIdBB', OUTCOME, self.numMoves, finalState.getScore(),
+                                    finalState.isWin(), finalState.isLose()))
+        indexOffset = self.file.tell()
+        self.file.write(struct.pack('<BI', INDEX, len(self.keyframes)))
+        for move, offset in self.keyframes:
+            self.file.write(struct.pack('<IQ', move, offset))
+        self.file.write(struct.pack('<Q', indexOffset) + INDEX_MAGIC)
+        self.file.close()
+
+def encodeState( state ):
+    """
+    Packs everything about a GameState that the rest of the game depends on:
+    score, game-over flags, agents, capsules and a bitmap of the food.
+    """
+    data = state.data
+    parts = [struct.pack('<dBBB', data.score, data._win, data._lose, len(data.agentStates))]
+    for agentState in data.agentStates:
+        if agentState.configuration == None:
+            x = y = 0
+            direction = 0xFF
+        else:
+            x, y = agentState.configuration.pos
+            direction = ACTION_CODES[agentState.configuration.direction]
+        # Positions are multiples of 1/2 (scared ghosts move at half speed)
+        parts.append(struct.pack('<hhBhBhh', int(x * 2), int(y * 2), direction, agentState.scaredTimer,
+                                 agentState.isPacman, agentState.numCarrying, agentState.numReturned))
+    parts.append(struct.pack('<H', len(data.capsules)))
+    for x, y in data.capsules:
+        parts.append(struct.pack('<HH', x, y))
+    food = data.food
+    bits = bytearray((food.width * food.height + 7) // 8)
+    for x, y in food.asList():
+        i = x * food.height + y
+        bits[i >> 3] |= 1 << (i & 7)
+    parts.append(bytes(bits))
+    return b''.join(parts)
+
+def decodeState( frame, layout ):
+    "Rebuilds the GameState that encodeState packed into frame."
+    import pacman
+    score, win, lose, numAgents = struct.unpack_from('<dBBB', frame)
+    offset = struct.calcsize('<dBBB')
+    state = pacman.GameState()
+    state.initialize(layout, numAgents - 1)
+    data = state.data
+    if score == int(score): score = int(score)
+    data.score, data._win, data._lose = score, bool(win), bool(lose)
+    agentSize = struct.calcsize('<hhBhBhh')
+    for agentState in data.agentStates:
+        x, y, direction, scaredTimer, isPacman, numCarrying, numReturned = struct.unpack_from('<hhBhBhh', frame, offset)
+        offset += agentSize
+        if direction == 0xFF:
+            agentState.configuration = None
+        else:
+            agentState.configuration = Configuration((_coordinate(x), _coordinate(y)), ACTIONS[direction])
+        agentState.scaredTimer = scaredTimer
+        agentState.isPacman = bool(isPacman)
+        agentState.numCarrying, agentState.numReturned = numCarrying, numReturned
+    numCapsules, = struct.unpack_from('<H', frame, offset)
+    offset += 2
+    data.capsules = []
+    for i in range(numCapsules):
+        data.capsules.append(struct.unpack_from('<HH', frame, offset))
+        offset += 4
+    bits = frame[offset:]
+    height = data.food.height
+    data.food._setData([[bool(bits[i >> 3] & (1 << (i & 7))) for i in range(x * height, (x + 1) * height)]
+                        for x in range(data.food.width)])
+    return state
+
+def _coordinate( doubled ):
+    if doubled % 2 == 0: return doubled // 2
+    return doubled / 2.0
+
+class Recording:
+    """
+    A recorded game: its layout, its actions as (agentIndex, action) pairs,
+    the number of agents that played (None for old pickles), and, when it
+    was recorded in this format and finished, its outcome (numMoves, score,
+    win, lose).
+    """
+    def __init__( self, layout, actions, outcome=None, keyframes=None, path=None, numAgents=None ):
+        self.layout = layout
+        self.actions = actions
+        self.numAgents = numAgents
+        self.outcome = outcome
+        self.keyframes = keyframes or []
+        self.path = path
+
+    def initialState( self ):
+        import pacman
+        state = pacman.GameState()
+        numGhosts = self.layout.getNumGhosts()
+        if self.numAgents != None: numGhosts = self.numAgents - 1
+        state.initialize(self.layout, numGhosts)
+        return state
+
+    def stateAt( self, move ):
+        """
+        Returns the state after the first move actions, starting from the
+        last keyframe at or before it.
+        """
+        import bisect
+        start, state = 0, None
+        i = bisect.bisect_right([m for m, offset in self.keyframes], move) - 1
+        if i >= 0:
+            start, offset = self.keyframes[i]
+            f = open(self.path, 'rb')
+            try:
+                f.seek(offset)
+                tag, frameMove, length = struct.unpack('<BII', f.read(9))
+                state = decodeState(f.read(length), self.layout)
+            finally:
+                f.close()
+        if state == None: state = self.initialState()
+        for agentIndex, action in self.actions[start:move]:
+            state = state.generateSuccessor(agentIndex, action)
+        return state
+
+def loadRecording( path ):
+    """
+    Reads a recording in either format.
+    """
+    f = open(path, 'rb')
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            recorded = pickle.load(f)
+            return Recording(internLayout(recorded['layout'].layoutText), recorded['actions'], path=path)
+        layout, numAgents = _readHeader(f)
+        bodyOffset = f.tell()
+        actions, keyframes, outcome = _readBody(f.read(), bodyOffset, path)
+    finally:
+        f.close()
+    return Recording(layout, actions, outcome, keyframes, path, numAgents)
+
+def seekRecording( path, move ):
+    """
+    Returns the state after the first move moves of a recording and the
+    actions that follow, reading the file only from the last keyframe at
+    or before move (found through the index) on.
+    """
+    import bisect
+    index = readIndex(path)
+    if index == None:
+        recorded = loadRecording(path)
+        return recorded.stateAt(move), recorded.actions[move:]
+    f = open(path, 'rb')
+    try:
+        f.read(len(MAGIC))
+        layout, numAgents = _readHeader(f)
+        i = bisect.bisect_right([m for m, offset in index], move) - 1
+        if i >= 0:
+            start, offset = index[i]
+            f.seek(offset)
+        else:
+            start, offset = 0, f.tell()
+        actions, keyframes, outcome = _readBody(f.read(), offset, path)
+    finally:
+        f.close()
+    recorded = Recording(layout, [None] * start + actions, outcome, keyframes, path, numAgents)
+    return recorded.stateAt(move), recorded.actions[move:]
+
+def _readHeader( f ):
+    "Reads the header after MAGIC and returns the layout and the number of agents."
+    digest = f.read(20)
+    length, = struct.unpack('<I', f.read(4))
+    text = f.read(length).decode('utf-8')
+    keyframeInterval, numAgents = struct.unpack('<IB', f.read(5))
+    return internLayout(text.split('\n'), digest), numAgents
+
+def _readBody( contents, base, path ):
+    """
+    Parses moves and keyframes up to the outcome.  base is the file offset
+    of contents, so the keyframes come back with file offsets.  Keyframes
+    are found while reading the moves, so a recording that has no index
+    (its game never finished) still loads.
+    """
+    actions, keyframes, outcome = [], [], None
+    offset, end = 0, len(contents)
+    while offset < end:
+        byte = contents[offset]
+        if byte < KEYFRAME:
+            actions.append((byte >> 3, ACTIONS[byte & 7]))
+            offset += 1
+        elif byte == KEYFRAME:
+            if offset + 9 > end: break
+            move, frameLength = struct.unpack_from('<II', contents, offset + 1)
+            if offset + 9 + frameLength > end: break # Cut off mid-write
+            keyframes.append((move, base + offset))
+            offset += 9 + frameLength
+        elif byte == OUTCOME:
+            if offset + 15 > end: break
+            numMoves, score, win, lose = struct.unpack_from('<IdBB', contents, offset + 1)
+            outcome = (numMoves, score, bool(win), bool(lose))
+            break
+        else:
+            raise Exception('Corrupt recording %s at byte %d' % (path, base + offset))
+    return actions, keyframes, outcome
+
+def readIndex( path ):
+    """
+    Returns the (move number, offset) keyframe index of a finished
+    recording without reading its moves, or None if it has none.
+    """
+    f = open(path, 'rb')
+    try:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < 16: return None
+        f.seek(-16, os.SEEK_END)
+        indexOffset, magic = struct.unpack('<Q8s', f.read(16))
+        if magic != INDEX_MAGIC: return None
+        f.seek(indexOffset)
+        tag, count = struct.unpack('<BI', f.read(5))
+        return [struct.unpack('<IQ', f.read(12)) for i in range(count)]
+    finally:
+        f.close()
+
+def writeRecording( path, layout, actions, numAgents, keyframeInterval=100 ):
+    """
+    Writes a finished game given by its actions and the number of agents
+    that played it, simulating it to produce the keyframes and outcome.
+    """
+    import pacman
+    state = pacman.GameState()
+    state.initialize(layout, numAgents - 1)
+    writer = RecordingWriter(path, layout, numAgents, keyframeInterval)
+    for agentIndex, action in actions:
+        state = state.generateSuccessor(agentIndex, action)
+        writer.recordMove(agentIndex, action, state)
+    writer.close(state)
+
+def convertRecording( oldPath, newPath=None ):
+    """
+    Rewrites a recording (typically an old pickle) in the current format,
+    by default as oldPath + '.rec'.
+    """
+    if newPath == None: newPath = oldPath + '.rec'
+    recorded = loadRecording(oldPath)
+    writeRecording(newPath, recorded.layout, recorded.actions, recorded.initialState().getNumAgents())
+    return newPath
+
+def verifyRecording( path ):
+    """
+    Re-simulates a recording without a display and compares the result
+    with its recorded outcome.  Returns (number of moves simulated, a
+    description of the divergence or None); recordings without an outcome
+    to check against (old pickles, unfinished games) give (0, None).
+    """
+    try:
+        recorded = loadRecording(path)
+    except Exception as e:
+        return 0, 'unreadable: %s' % e
+    if recorded.outcome == None:
+        return 0, None
+    state = recorded.initialState()
+    moves = 0
+    for agentIndex, action in recorded.actions:
+        if state.isWin() or state.isLose():
+            break
+        try:
+            state = state.generateSuccessor(agentIndex, action)
+        except Exception as e:
+            return moves, 'move %d (agent %d, %s) failed: %s' % (moves + 1, agentIndex, action, e)
+        moves += 1
+    numMoves, score, win, lose = recorded.outcome
+    replayed = (moves, state.getScore(), state.isWin(), state.isLose())
+    if replayed != (numMoves, score, win, lose):
+        return moves, 'recorded %s, replay gives %s' % (_describeOutcome(numMoves, score, win, lose),
+                                                        _describeOutcome(*replayed))
+    return moves, None
+
+def _describeOutcome( numMoves, score, win, lose ):
+    result = 'unfinished'
+    if win: result = 'win'
+    if lose: result = 'loss'
+    return 'score %d (%s) after %d moves' % (score, result, numMoves)
+
+def findRecordings( directory ):
+    "Lists the recordings, in either format, under directory."
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            f = open(path, 'rb')
+            try: start = f.read(len(MAGIC))
+            finally: f.close()
+            # Pickles of protocol 2 and later start with 0x80
+            if start == MAGIC or start[:1] == b'\x80':
+                paths.append(path)
+    return paths
+
+def verifyRecordings( paths, workers=1 ):
+    """
+    Verifies recordings in a pool of worker processes and prints a report
+    with the divergences and the throughput.  Returns the list of
+    (path, problem) for the recordings that did not verify.
+    """
+    import multiprocessing, time
+    start = time.time()
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            chunksize = max(1, len(paths) // (8 * workers))
+            results = pool.map(verifyRecording, paths, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [verifyRecording(path) for path in paths]
+    elapsed = max(time.time() - start, 1e-9)
+
+    totalMoves = sum([moves for moves, problem in results])
+    failures = [(path, problem) for path, (moves, problem) in zip(paths, results) if problem != None]
+    unchecked = len([1 for moves, problem in results if moves == 0 and problem == None])
+    print('Verified %d recordings (%d moves) in %.2f s: %d moves/s with %d worker(s)' %
+          (len(paths) - unchecked, totalMoves, elapsed, totalMoves / elapsed, workers))
+    if unchecked:
+        print('%d had no recorded outcome to check (convert old recordings with --convert)' % unchecked)
+    if failures:
+        print('%d did not verify:' % len(failures))
+        for path, problem in failures:
+            print('  %s: %s' % (path, problem))
+    return failures
+
+if __name__ == '__main__':
+    import sys
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python recording.py (--convert FILE... | --verify DIRECTORY...)')
+    parser.add_option('--convert', action='store_true', dest='convert', default=False,
+                      help='Converts the given recordings to the current format')
+    parser.add_option('--verify', action='store_true', dest='verify', default=False,
+                      help='Replays all the recordings under the given directories and checks their outcomes')
+    parser.add_option('--workers', dest='workers', type='int', default=1,
+                      help='Number of processes to verify recordings in')
+    options, paths = parser.parse_args(sys.argv[1:])
+    if options.convert == options.verify or not paths:
+        parser.error('give either --convert or --verify, and some paths')
+    if options.convert:
+        for path in paths:
+            print('%s -> %s' % (path, convertRecording(path)))
+    else:
+        recordings = []
+        for path in paths:
+            if os.path.isdir(path): recordings += findRecordings(path)
+            else: recordings.append(path)
+        if verifyRecordings(recordings, options.workers):
+            sys.exit(1)
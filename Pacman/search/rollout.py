@@ -0,0 +1,393 @@
+# rollout.py
+# ----------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A fast simulator for Monte-Carlo rollouts of classic Pacman.
+
+SimState is a mutable copy of a GameState made for playing moves out
+quickly: apply plays one agent's move in place and returns a token that
+undo takes to put the state back, so a search walks down and back up one
+state instead of copying a GameState per move.  The rules are those of
+PacmanRules and GhostRules in pacman.py; verifyAgainstGameState replays
+random traces through both and checks that they agree.
+
+Actions are indices into ACTIONS and agent positions are kept in half-cell
+units, as in batchGame.py, so scared ghosts stay on an integer lattice.
+Food and capsules are indexed by the layout's open cells, in the order of
+its DistanceField.
+
+The ghost policies (randomGhost, directionalGhost, mazeGhost) sample the
+same distributions as the ghost agents of the same names, and rollout and
+rolloutBatch play games out with them.  Every SimState counts the plies it
+has simulated, so searches can report plies per second; to benchmark:
+
+> python rollout.py -l mediumClassic
+"""
+
+import random
+import time
+from game import Directions
+import ghostAgents
+import pacman
+
+# Same order as Actions._directionsAsList
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_INDEX = dict([(a, i) for i, a in enumerate(ACTIONS)])
+STOP = ACTION_INDEX[Directions.STOP]
+DX = [0, 0, 1, -1, 0]
+DY = [1, -1, 0, 0, 0]
+REVERSE = [ACTION_INDEX[Directions.REVERSE[a]] for a in ACTIONS]
+
+class SimState:
+    """
+    Classic Pacman from a GameState, played in place.  Agent 0 is Pacman.
+    """
+
+    def __init__( self, state ):
+        data = state.data
+        walls = data.layout.walls
+        self.field = ghostAgents.getDistanceField(walls)
+        self.cellIndex = self.field.index
+        cells = sorted(self.cellIndex, key=self.cellIndex.get)
+
+        # moves[cell]: the directions that do not run into a wall;
+        # neighbors[cell][action]: the cell that direction leads to
+        self.moves, self.neighbors = [], []
+        for x, y in cells:
+            moves, neighbors = [], []
+            for action in range(STOP):
+                neighbor = self.cellIndex.get((x + DX[action], y + DY[action]))
+                if neighbor != None: moves.append(action)
+                neighbors.append(neighbor)
+            neighbors.append(self.cellIndex[(x, y)])
+            self.moves.append(tuple(moves))
+            self.neighbors.append(neighbors)
+
+        self.food = bytearray(len(cells))
+        for x, y in data.food.asList(): self.food[self.cellIndex[(x, y)]] = 1
+        self.foodCount = data.food.count()
+        self.capsules = set([self.cellIndex[position] for position in data.capsules])
+
+        agentStates = data.agentStates
+        self.numAgents = len(agentStates)
+        self.x, self.y, self.direction, self.scared, self.startX, self.startY = [], [], [], [], [], []
+        for agentState in agentStates:
+            x, y = agentState.configuration.pos
+            self.x.append(int(round(x * 2)))
+            self.y.append(int(round(y * 2)))
+            self.direction.append(ACTION_INDEX[agentState.configuration.direction])
+            self.scared.append(agentState.scaredTimer)
+            x, y = agentState.start.pos
+            self.startX.append(int(round(x * 2)))
+            self.startY.append(int(round(y * 2)))
+        self.score = data.score
+        self.win, self.lose = data._win, data._lose
+        self.plies = 0
+
+    def isTerminal( self ):
+        return self.win or self.lose
+
+    def cellOf( self, agentIndex ):
+        "The open cell the agent is on, or None if it is between two cells."
+        x, y = self.x[agentIndex], self.y[agentIndex]
+        if x & 1 or y & 1: return None
+        return self.cellIndex[(x >> 1, y >> 1)]
+
+    def getLegalActions( self, agentIndex ):
+        """
+        The agent's legal actions, as GameState.getLegalActions gives them
+        (in order), as indices into ACTIONS.
+        """
+        if self.win or self.lose: return []
+        cell = self.cellOf(agentIndex)
+        if cell == None:
+            # In between grid points, agents must continue straight
+            return [self.direction[agentIndex]]
+        moves = self.moves[cell]
+        if agentIndex == 0: return list(moves) + [STOP]
+        reverse = REVERSE[self.direction[agentIndex]]
+        if reverse in moves and len(moves) > 1:
+            return [action for action in moves if action != reverse]
+        return list(moves)
+
+    def apply( self, agentIndex, action ):
+        """
+        Plays action (an index into ACTIONS, which must be legal) for the
+        agent and returns the token to undo it with.
+        """
+        self.plies += 1
+        x, y, direction, scared = self.x, self.y, self.direction, self.scared
+        token = (agentIndex, x[agentIndex], y[agentIndex], direction[agentIndex], scared[agentIndex],
+                 self.score, self.win, self.lose)
+        if agentIndex == 0:
+            return token + self._movePacman(action)
+
+        if scared[agentIndex] > 0: speed = 1
+        else: speed = 2
+        x[agentIndex] += DX[action] * speed
+        y[agentIndex] += DY[action] * speed
+        direction[agentIndex] = action
+        # Time passes
+        timer = scared[agentIndex]
+        if timer == 1:
+            # Back to the nearest grid point
+            x[agentIndex] += x[agentIndex] & 1
+            y[agentIndex] += y[agentIndex] & 1
+        if timer > 0: scared[agentIndex] = timer - 1
+        if abs(x[agentIndex] - x[0]) + abs(y[agentIndex] - y[0]) <= 1:
+            self._collide(agentIndex)
+        return token + (-1, -1, None)
+
+    def _movePacman( self, action ):
+        x, y = self.x, self.y
+        x[0] += DX[action] * 2
+        y[0] += DY[action] * 2
+        if action != STOP: self.direction[0] = action
+        cell = self.cellIndex[(x[0] >> 1, y[0] >> 1)]
+        foodCell = capsuleCell = -1
+        ghosts = None
+        scoreChange = -pacman.TIME_PENALTY
+        if self.food[cell]:
+            self.food[cell] = 0
+            self.foodCount -= 1
+            foodCell = cell
+            scoreChange += 10
+            if self.foodCount == 0 and not self.lose:
+                scoreChange += 500
+                self.win = True
+        if cell in self.capsules:
+            ghosts = self._ghosts()
+            self.capsules.remove(cell)
+            capsuleCell = cell
+            for index in range(1, self.numAgents): self.scared[index] = pacman.SCARED_TIME
+        self.score += scoreChange
+        for index in range(1, self.numAgents):
+            if abs(x[index] - x[0]) + abs(y[index] - y[0]) <= 1:
+                if ghosts == None: ghosts = self._ghosts()
+                self._collide(index)
+        return (foodCell, capsuleCell, ghosts)
+
+    def _ghosts( self ):
+        return [(index, self.x[index], self.y[index], self.direction[index], self.scared[index])
+                for index in range(1, self.numAgents)]
+
+    def _collide( self, index ):
+        if self.scared[index] > 0:
+            self.score += 200
+            self.x[index], self.y[index] = self.startX[index], self.startY[index]
+            self.direction[index] = STOP
+            self.scared[index] = 0
+        elif not self.win:
+            self.score -= 500
+            self.lose = True
+
+    def undo( self, token ):
+        "Takes back the move apply returned token for."
+        agentIndex, x, y, direction, scared, self.score, self.win, self.lose, foodCell, capsuleCell, ghosts = token
+        self.x[agentIndex], self.y[agentIndex] = x, y
+        self.direction[agentIndex], self.scared[agentIndex] = direction, scared
+        if foodCell >= 0:
+            self.food[foodCell] = 1
+            self.foodCount += 1
+        if capsuleCell >= 0: self.capsules.add(capsuleCell)
+        if ghosts != None:
+            for index, x, y, direction, scared in ghosts:
+                self.x[index], self.y[index] = x, y
+                self.direction[index], self.scared[index] = direction, scared
+
+    def nearestFoodDistance( self ):
+        "The maze distance from Pacman to the closest food, 0 if none is left."
+        if self.foodCount == 0: return 0
+        field, food = self.field, self.food
+        row = self.cellOf(0) * field.size
+        distances = field.distances
+        return min([distances[row + cell] for cell in range(field.size) if food[cell]])
+
+    def evaluate( self ):
+        """
+        The score, less the steps to the nearest food for unfinished games:
+        what a rollout that stops here is worth.
+        """
+        if self.win or self.lose: return self.score
+        return self.score - self.nearestFoodDistance()
+
+    def matches( self, state ):
+        "Whether this is the same position as GameState state."
+        data = state.data
+        if self.score != data.score or self.win != data._win or self.lose != data._lose: return False
+        for index, agentState in enumerate(data.agentStates):
+            x, y = agentState.configuration.pos
+            if (self.x[index], self.y[index]) != (x * 2, y * 2): return False
+            if ACTIONS[self.direction[index]] != agentState.configuration.direction: return False
+            if self.scared[index] != agentState.scaredTimer: return False
+        food = set([self.cellIndex[position] for position in data.food.asList()])
+        if food != set([cell for cell in range(len(self.food)) if self.food[cell]]): return False
+        return self.capsules == set([self.cellIndex[position] for position in data.capsules])
+
+####################
+# Rollout policies #
+####################
+
+def randomGhost( sim, index, rng ):
+    "A legal action chosen uniformly at random, as RandomGhost does."
+    legal = sim.getLegalActions(index)
+    return legal[int(rng.random() * len(legal))]
+
+def directionalGhost( sim, index, rng, prob_attack=0.8, prob_scaredFlee=0.8 ):
+    """
+    Samples DirectionalGhost's distribution: with probability prob_attack
+    (prob_scaredFlee when scared) one of the actions closest to Pacman
+    (furthest from him), and otherwise any legal action.
+    """
+    legal = sim.getLegalActions(index)
+    scared = sim.scared[index] > 0
+    if scared: bestProb = prob_scaredFlee
+    else: bestProb = prob_attack
+    if len(legal) > 1 and rng.random() < bestProb:
+        if scared: speed = 1
+        else: speed = 2
+        x, y, px, py = sim.x[index], sim.y[index], sim.x[0], sim.y[0]
+        distances = [abs(x + DX[a] * speed - px) + abs(y + DY[a] * speed - py) for a in legal]
+        if scared: best = max(distances)
+        else: best = min(distances)
+        legal = [a for a, distance in zip(legal, distances) if distance == best]
+    return legal[int(rng.random() * len(legal))]
+
+def mazeGhost( sim, index, rng, prob_attack=0.8, prob_scaredFlee=0.8 ):
+    "Samples MazeGhost's distribution, which measures through the maze."
+    legal = sim.getLegalActions(index)
+    scared = sim.scared[index] > 0
+    if scared: bestProb = prob_scaredFlee
+    else: bestProb = prob_attack
+    if len(legal) > 1 and rng.random() < bestProb:
+        if scared: speed = 1
+        else: speed = 2
+        x, y = sim.x[index], sim.y[index]
+        pacmanPosition = (sim.x[0] >> 1, sim.y[0] >> 1)
+        distances = [sim.field.distance(((x + DX[a] * speed) / 2.0, (y + DY[a] * speed) / 2.0), pacmanPosition)
+                     for a in legal]
+        if scared: best = max(distances)
+        else: best = min(distances)
+        legal = [a for a, distance in zip(legal, distances) if distance == best]
+    return legal[int(rng.random() * len(legal))]
+
+GHOST_POLICIES = {'random': randomGhost, 'directional': directionalGhost, 'maze': mazeGhost}
+
+def pacmanPolicy( sim, rng ):
+    """
+    Pacman's rollout policy: a move that eats food if there is one, and
+    otherwise any move but stopping or turning back, unless nothing else
+    is legal.
+    """
+    legal = sim.getLegalActions(0)
+    cell = sim.cellOf(0)
+    neighbors, food = sim.neighbors[cell], sim.food
+    eating = [a for a in legal if a != STOP and food[neighbors[a]]]
+    if eating: return eating[int(rng.random() * len(eating))]
+    reverse = REVERSE[sim.direction[0]]
+    onward = [a for a in legal if a != STOP and a != reverse]
+    if not onward: onward = [a for a in legal if a != STOP] or legal
+    return onward[int(rng.random() * len(onward))]
+
+def rollout( sim, depth, ghostPolicy=directionalGhost, rng=None, agentIndex=0 ):
+    """
+    Plays from sim, starting with agentIndex's move, until the game ends or
+    depth more rounds have started, and returns what the final position is
+    worth (SimState.evaluate).  sim is left as it was.
+    """
+    if rng == None: rng = random
+    tokens = []
+    numAgents = sim.numAgents
+    for _ in range(depth):
+        while agentIndex < numAgents and not (sim.win or sim.lose):
+            if agentIndex == 0: action = pacmanPolicy(sim, rng)
+            else: action = ghostPolicy(sim, agentIndex, rng)
+            tokens.append(sim.apply(agentIndex, action))
+            agentIndex += 1
+        if sim.win or sim.lose: break
+        agentIndex = 0
+    value = sim.evaluate()
+    for token in reversed(tokens): sim.undo(token)
+    return value
+
+def rolloutBatch( sim, numRollouts, depth, ghostPolicy=directionalGhost, rng=None, agentIndex=0 ):
+    "The mean value of numRollouts rollouts from sim."
+    total = 0.0
+    for _ in range(numRollouts):
+        total += rollout(sim, depth, ghostPolicy, rng, agentIndex)
+    return total / numRollouts
+
+################
+# Verification #
+################
+
+def verifyAgainstGameState( layout, numGames=20, seed=0, maxMoves=2000 ):
+    """
+    Plays numGames random traces through a SimState and a GameState side by
+    side, checking after every move that they agree and that undoing the
+    move restores the SimState.  Returns the number of moves checked.
+    """
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(numGames):
+        state = pacman.GameState()
+        state.initialize(layout, layout.getNumGhosts())
+        sim = SimState(state)
+        agentIndex = 0
+        for _ in range(maxMoves):
+            if state.isWin() or state.isLose(): break
+            legal = sim.getLegalActions(agentIndex)
+            expected = [ACTION_INDEX[a] for a in state.getLegalActions(agentIndex)]
+            assert legal == expected, 'Legal actions differ: %s != %s' % (legal, expected)
+            action = legal[int(rng.random() * len(legal))]
+            before = (sim.x[:], sim.y[:], sim.direction[:], sim.scared[:], sim.score, bytes(sim.food), set(sim.capsules))
+            token = sim.apply(agentIndex, action)
+            sim.undo(token)
+            after = (sim.x[:], sim.y[:], sim.direction[:], sim.scared[:], sim.score, bytes(sim.food), set(sim.capsules))
+            assert before == after, 'Undo did not restore the state'
+            sim.apply(agentIndex, action)
+            state = state.generateSuccessor(agentIndex, ACTIONS[action])
+            assert sim.matches(state), 'States differ after move %d' % checked
+            checked += 1
+            agentIndex = (agentIndex + 1) % sim.numAgents
+    return checked
+
+def measurePlies( layout, seconds=2.0, depth=20, ghostPolicy=directionalGhost, seed=0 ):
+    "Runs rollouts from the start of layout for seconds; returns plies per second."
+    state = pacman.GameState()
+    state.initialize(layout, layout.getNumGhosts())
+    sim = SimState(state)
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        rolloutBatch(sim, 10, depth, ghostPolicy, rng)
+    return sim.plies / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    import layout as layouts
+    parser = OptionParser('USAGE: python rollout.py [options]')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic')
+    parser.add_option('-g', '--ghosts', dest='ghosts', default='directional',
+                      help='ghost rollout policy: ' + ', '.join(sorted(GHOST_POLICIES)))
+    parser.add_option('-d', '--depth', dest='depth', type='int', default=20,
+                      help='rounds per rollout')
+    parser.add_option('--verify', dest='verify', type='int', default=20,
+                      help='Number of random traces to check against GameState (0 to skip)')
+    options, otherjunk = parser.parse_args()
+    lay = layouts.getLayout(options.layout)
+    if options.verify > 0:
+        print('Verified %d moves against pacman.GameState' % verifyAgainstGameState(lay, options.verify))
+    rate = measurePlies(lay, depth=options.depth, ghostPolicy=GHOST_POLICIES[options.ghosts])
+    print('Rollouts on %s: %d plies per second' % (options.layout, rate))
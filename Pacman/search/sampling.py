@@ -0,0 +1,214 @@
+# sampling.py
+# -----------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Sampling from discrete distributions with alias tables.
+
+An AliasTable (Vose's alias method) takes O(n) to build and then draws a
+sample in O(1) from a single uniform number: pick a column uniformly, then
+keep it or take its alias depending on where the number fell inside the
+column.  getTable caches tables by distribution, so the handful of
+distributions a ghost keeps sampling from (two to four legal actions with
+the same few probabilities) are each built once.  util.sample,
+util.nSample and util.chooseFromDistribution draw from these tables.
+
+For rollouts, sampleIndices draws many samples from one table at once and
+sampleRows draws one sample from each row of a 2-d array of weights; both
+need NumPy, which is only imported when they are first used (util imports
+this module, and most games never touch NumPy).
+"""
+
+import random
+
+MAX_TABLES = 4096 # Cached tables kept before the cache is cleared
+
+class AliasTable:
+    """
+    An alias table for weights (any non-negative numbers with a positive
+    sum) over values.
+    """
+    def __init__( self, weights, values ):
+        n = len(weights)
+        if n == 0 or n != len(values):
+            raise ValueError('Need one weight for each of at least one value')
+        total = float(sum(weights))
+        if not total > 0:
+            raise ValueError('Cannot sample from weights that sum to %s' % total)
+        self.values = list(values)
+        self.size = n
+        self.probabilities = [0.0] * n
+        self.aliases = list(range(n))
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] = (scaled[more] + scaled[less]) - 1.0
+            if scaled[more] < 1.0: small.append(more)
+            else: large.append(more)
+        # What is left is 1 up to rounding
+        for i in small + large:
+            self.probabilities[i] = 1.0
+        self._arrays = None
+
+    def sampleIndex( self, rng=None ):
+        if rng == None: rng = random
+        u = rng.random() * self.size
+        i = int(u)
+        if u - i < self.probabilities[i]: return i
+        return self.aliases[i]
+
+    def sample( self, rng=None ):
+        if rng == None: rng = random
+        u = rng.random() * self.size
+        i = int(u)
+        if u - i < self.probabilities[i]: return self.values[i]
+        return self.values[self.aliases[i]]
+
+    def sampleMany( self, n, rng=None ):
+        "Returns a list of n independent samples."
+        if rng == None: rng = random
+        uniform, size = rng.random, self.size
+        probabilities, aliases, values = self.probabilities, self.aliases, self.values
+        samples = []
+        for _ in range(n):
+            u = uniform() * size
+            i = int(u)
+            if u - i < probabilities[i]: samples.append(values[i])
+            else: samples.append(values[aliases[i]])
+        return samples
+
+    def sampleIndices( self, n, rng=None ):
+        """
+        Returns a NumPy array of n sampled indices into values.  rng may be a
+        NumPy Generator or a random.Random stream (see numpyGenerator).
+        """
+        generator = numpyGenerator(rng)
+        np = _numpy()
+        if self._arrays == None:
+            self._arrays = (np.array(self.probabilities), np.array(self.aliases, dtype=np.int64))
+        probabilities, aliases = self._arrays
+        u = generator.random(n) * self.size
+        columns = np.minimum(u.astype(np.int64), self.size - 1)
+        return np.where(u - columns < probabilities[columns], columns, aliases[columns])
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('Batch sampling requires NumPy (pip install numpy)')
+    return numpy
+
+_TABLES = {} # (weights, values) -> AliasTable
+_DICT_TABLES = {} # dict items, in the dict's order -> AliasTable
+
+def getTable( weights, values ):
+    """
+    Returns the AliasTable for weights over values, reusing the one built
+    last time the same distribution was asked for.
+    """
+    try:
+        key = (tuple(weights), tuple(values))
+        table = _TABLES.get(key)
+    except TypeError:
+        # Unhashable values: nothing to cache them by
+        return AliasTable(weights, values)
+    if table == None:
+        table = AliasTable(weights, values)
+        if len(_TABLES) >= MAX_TABLES: _TABLES.clear()
+        _TABLES[key] = table
+    return table
+
+def tableFor( distribution, values=None ):
+    """
+    Returns the AliasTable for a dict (a util.Counter) from values to
+    weights, or for a list of weights with a matching list of values.
+    """
+    if not isinstance(distribution, dict):
+        return getTable(distribution, values)
+    # Keyed without sorting, so a dict built the same way as before is one
+    # lookup; the table itself is built over the sorted items, as always
+    try:
+        key = tuple(distribution.items())
+        table = _DICT_TABLES.get(key)
+    except TypeError:
+        key = table = None
+    if table == None:
+        items = sorted(distribution.items())
+        table = getTable([item[1] for item in items], [item[0] for item in items])
+        if key != None:
+            if len(_DICT_TABLES) >= MAX_TABLES: _DICT_TABLES.clear()
+            _DICT_TABLES[key] = table
+    return table
+
+def numpyGenerator( rng=None ):
+    """
+    Returns rng if it is a NumPy Generator and otherwise a Generator seeded
+    from rng (a random.Random stream, or the random module if None), so
+    batch samples follow the same seeds as the rest of a game.
+    """
+    np = _numpy()
+    if rng == None: rng = random
+    if 'integers' in dir(rng): return rng
+    return np.random.default_rng(rng.getrandbits(64))
+
+def sampleRows( weights, rng=None ):
+    """
+    Returns one sampled column index for each row of the 2-d array weights,
+    which may hold different distributions in different rows (so there is
+    no table to reuse; rows are sampled by inverse CDF).  Rows must have a
+    positive sum.
+    """
+    generator = numpyGenerator(rng)
+    np = _numpy()
+    cdf = np.cumsum(weights, axis=1)
+    r = generator.random(cdf.shape[0])[:, None] * cdf[:, -1:]
+    return np.minimum((cdf <= r).sum(axis=1), cdf.shape[1] - 1)
+
+def timeSampling( trials=100000 ):
+    """
+    Returns the seconds per sample of the sort, normalize and cumulative
+    scan util.sample used to do and of a cached alias table, on a ghost's
+    move distribution.
+    """
+    import time
+    distribution = {'North': 0.05, 'South': 0.05, 'East': 0.85, 'West': 0.05}
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(trials):
+        items = sorted(distribution.items())
+        weights = [item[1] for item in items]
+        values = [item[0] for item in items]
+        total = float(sum(weights))
+        weights = [w / total for w in weights]
+        choice = rng.random()
+        i, cumulative = 0, weights[0]
+        while choice > cumulative:
+            i += 1
+            cumulative += weights[i]
+        values[i]
+    scan = (time.perf_counter() - start) / trials
+    start = time.perf_counter()
+    for _ in range(trials):
+        tableFor(distribution).sample(rng)
+    alias = (time.perf_counter() - start) / trials
+    return scan, alias
+
+if __name__ == '__main__':
+    scan, alias = timeSampling()
+    print('Cumulative scan: %.2f us per sample' % (scan * 1e6))
+    print('Alias table:     %.2f us per sample' % (alias * 1e6))
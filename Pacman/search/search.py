@@ -234,8 +234,154 @@ def GreedyBestFirstSearch(problem, heuristic):
                     Queue.update((newPath, newDirections), heuristic(successor[0], problem))
     return -1
 
+def playsInPlace(problem, state):
+    """
+    Whether a search can walk problem with a single state: the problem lists
+    the actions from a state with getActions(state), and states make moves in
+    place with apply(action), which returns a token, and take them back with
+    undo(token) (as EightPuzzleState and GameState do).
+    """
+    return 'getActions' in dir(problem) and 'apply' in dir(state) and 'undo' in dir(state)
+
+def pathKeyFunction(state):
+    """
+    Returns the function that gives the key a state played in place is kept
+    on the search path under: the packed board of a sliding puzzle, which
+    is exact, and otherwise a copy of the state (made as GameState copies
+    itself), which the path set compares with ==.  A hash alone would let
+    two states that collide prune each other.
+    """
+    if 'packed' in dir(state): return lambda state: state.packed
+    return lambda state: state.__class__(state)
+
+def depthLimitedSearch(problem, limit):
+    """
+    Searches depth first for a goal at most limit actions away, skipping
+    states already on the current path, and returns the actions to it, or
+    None if there is none that close.  Problems that play in place (see
+    playsInPlace) are searched with one state, making and undoing moves;
+    the states on the path are then kept as pathKeyFunction says.
+    """
+    start = problem.getStartState()
+    actions = []
+    if playsInPlace(problem, start):
+        keyOf = pathKeyFunction(start)
+        found = _limitedInPlace(problem, start, limit, actions, set([keyOf(start)]), keyOf)
+    else:
+        found = _limited(problem, start, limit, actions, [start])
+    if found: return actions
+    return None
+
+def _limited(problem, state, limit, actions, path):
+    if problem.isGoalState(state): return True
+    if limit == 0: return False
+    for successor, action, stepCost in problem.getSuccessors(state):
+        if successor in path: continue
+        actions.append(action)
+        path.append(successor)
+        if _limited(problem, successor, limit - 1, actions, path): return True
+        path.pop()
+        actions.pop()
+    return False
+
+def _limitedInPlace(problem, state, limit, actions, path, keyOf):
+    if problem.isGoalState(state): return True
+    if limit == 0: return False
+    for action in problem.getActions(state):
+        token = state.apply(action)
+        try:
+            key = keyOf(state)
+            if key in path: continue
+            actions.append(action)
+            path.add(key)
+            if _limitedInPlace(problem, state, limit - 1, actions, path, keyOf): return True
+            path.remove(key)
+            actions.pop()
+        finally:
+            # The caller gets the start state back as it was, found or not
+            state.undo(token)
+    return False
+
+def iterativeDeepeningSearch(problem, maxDepth=1000):
+    """
+    Depth-limited searches with limits 0, 1, 2, ... up to maxDepth: finds a
+    goal with the fewest actions in memory proportional to its depth.
+    """
+    for limit in range(maxDepth + 1):
+        actions = depthLimitedSearch(problem, limit)
+        if actions != None: return actions
+    return -1
+
+def iterativeDeepeningAStarSearch(problem, heuristic=nullHeuristic):
+    """
+    IDA*: depth-first searches that cut off paths whose cost plus heuristic
+    exceeds a bound, starting with the heuristic of the start state and
+    raising the bound to the least value cut off each time.  With an
+    admissible heuristic the path returned is optimal, in memory
+    proportional to its length.  Problems that play in place (see
+    playsInPlace) and declare that every action costs 1 (a true unitCosts
+    attribute) are searched with one state; others through getSuccessors.
+    """
+    start = problem.getStartState()
+    inPlace = playsInPlace(problem, start) and 'unitCosts' in dir(problem) and problem.unitCosts
+    if inPlace: keyOf = pathKeyFunction(start)
+    bound = heuristic(start, problem)
+    while bound != float('inf'):
+        actions = []
+        if inPlace:
+            cutOff = _boundedInPlace(problem, start, 0, bound, heuristic, actions, set([keyOf(start)]), keyOf)
+        else:
+            cutOff = _bounded(problem, start, 0, bound, heuristic, actions, [start])
+        if cutOff == None: return actions
+        bound = cutOff
+    return -1
+
+def _bounded(problem, state, cost, bound, heuristic, actions, path):
+    """
+    Returns None if a goal is found within bound (with the actions to it in
+    actions), and otherwise the least cost plus heuristic that was cut off.
+    """
+    f = cost + heuristic(state, problem)
+    if f > bound: return f
+    if problem.isGoalState(state): return None
+    least = float('inf')
+    for successor, action, stepCost in problem.getSuccessors(state):
+        if successor in path: continue
+        actions.append(action)
+        path.append(successor)
+        cutOff = _bounded(problem, successor, cost + stepCost, bound, heuristic, actions, path)
+        if cutOff == None: return None
+        path.pop()
+        actions.pop()
+        least = min(least, cutOff)
+    return least
+
+def _boundedInPlace(problem, state, cost, bound, heuristic, actions, path, keyOf):
+    "_bounded for a problem with unit costs, played in place."
+    f = cost + heuristic(state, problem)
+    if f > bound: return f
+    if problem.isGoalState(state): return None
+    least = float('inf')
+    for action in problem.getActions(state):
+        token = state.apply(action)
+        try:
+            key = keyOf(state)
+            if key in path: continue
+            actions.append(action)
+            path.add(key)
+            cutOff = _boundedInPlace(problem, state, cost + 1, bound, heuristic, actions, path, keyOf)
+            if cutOff == None: return None
+            path.remove(key)
+            actions.pop()
+            if cutOff < least: least = cutOff
+        finally:
+            state.undo(token)
+    return least
+
 # Abbreviations
 bfs = breadthFirstSearch
 dfs = depthFirstSearch
 astar = aStarSearch
 ucs = uniformCostSearch
+ids = iterativeDeepeningSearch
+idastar = iterativeDeepeningAStarSearch
@@ -0,0 +1,210 @@
+# searchSweep.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Runs search agent configurations across layouts and seeds and tabulates
+the path cost, nodes expanded and time of each search.
+
+  python searchSweep.py -a fn=bfs -a fn=astar,heuristic=manhattanHeuristic \\
+                        -l tinyMaze,mediumMaze,bigMaze --seeds 0,1 -j 4
+
+Every (agent, agent args, layout, seed) combination is one run.  Runs go
+through a shared queue that idle workers pull from, biggest layouts first,
+so a few slow searches do not hold up the rest.  Each finished run is
+appended to the checkpoint file at once; running the same sweep again
+skips what the checkpoint already holds, so an interrupted sweep resumes
+where it stopped.  The results table is written as tab-separated values.
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+FIELDS = ['agent', 'args', 'layout', 'seed', 'status', 'cost', 'expanded', 'seconds']
+
+def runKey( run ):
+    return (run['agent'], run['args'], run['layout'], run['seed'])
+
+def runSearch( task ):
+    """
+    Runs one configuration: builds the agent, lets it plan on the layout's
+    start state under a deadline, and returns the result as a dict.
+    """
+    import layout, pacman, util
+    agentName, agentArgs, layoutName, seed, timeout = task
+    result = {'agent': agentName, 'args': agentArgs, 'layout': layoutName, 'seed': seed,
+              'status': 'ok', 'cost': None, 'expanded': None, 'seconds': None}
+    random.seed(seed)
+    util.mutePrint()
+    start = time.perf_counter()
+    try:
+        with util.Deadline(timeout):
+            lay = layout.getLayout(layoutName)
+            if lay == None: raise Exception('The layout %s cannot be found' % layoutName)
+            state = pacman.GameState()
+            state.initialize(lay, lay.getNumGhosts())
+            agent = pacman.loadAgent(agentName, True)(**pacman.parseAgentArgs(agentArgs or None))
+            start = time.perf_counter()
+            if 'searchFunction' in dir(agent) and 'searchType' in dir(agent):
+                # What SearchAgent.registerInitialState does, keeping the problem
+                problem = agent.searchType(state)
+                actions = agent.searchFunction(problem)
+                result['cost'] = problem.getCostOfActions(actions)
+                if '_expanded' in dir(problem): result['expanded'] = problem._expanded
+            else:
+                agent.registerInitialState(state)
+                result['cost'] = len(agent.actions)
+    except util.TimeoutFunctionException:
+        result['status'] = 'timeout'
+    except Exception as e:
+        result['status'] = 'error: %s' % str(e).split('\n')[0]
+    finally:
+        util.unmutePrint()
+    result['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+def loadCheckpoint( path ):
+    "Returns the runs recorded in a checkpoint file, by key."
+    done = {}
+    if path == None or not os.path.exists(path): return done
+    f = open(path)
+    try:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try: run = json.loads(line)
+            except ValueError: continue # A line cut short by an interruption
+            done[runKey(run)] = run
+    finally:
+        f.close()
+    return done
+
+def _endsWithNewline( path ):
+    f = open(path, 'rb')
+    try:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+    finally:
+        f.close()
+
+def layoutSize( layoutName ):
+    import layout
+    lay = layout.getLayout(layoutName)
+    if lay == None: return 0
+    return lay.width * lay.height
+
+def sweep( agents, layouts, seeds, workers=1, timeout=60, checkpoint=None ):
+    """
+    Runs every configuration in agents (a list of (agent, args) pairs) on
+    every layout with every seed and returns the results, resuming from
+    checkpoint if it is given.
+    """
+    done = loadCheckpoint(checkpoint)
+    tasks = [(agent, args, layoutName, seed, timeout)
+             for agent, args in agents for layoutName in layouts for seed in seeds
+             if (agent, args, layoutName, seed) not in done]
+    sizes = dict([(layoutName, layoutSize(layoutName)) for layoutName in layouts])
+    tasks.sort(key=lambda task: -sizes[task[2]])
+    if done:
+        print('Resuming: %d runs already done, %d to go' % (len(done), len(tasks)))
+
+    out = None
+    if checkpoint != None:
+        out = open(checkpoint, 'a')
+        if out.tell() > 0 and not _endsWithNewline(checkpoint): out.write('\n')
+    try:
+        if workers > 1:
+            import multiprocessing
+            pool = multiprocessing.get_context('fork').Pool(workers)
+            try:
+                for result in pool.imap_unordered(runSearch, tasks, 1):
+                    done[runKey(result)] = result
+                    _report(result, len(done), out)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for task in tasks:
+                result = runSearch(task)
+                done[runKey(result)] = result
+                _report(result, len(done), out)
+    finally:
+        if out != None: out.close()
+
+    keys = [(agent, args, layoutName, seed) for agent, args in agents for layoutName in layouts for seed in seeds]
+    return [done[key] for key in keys if key in done]
+
+def _report( result, count, out ):
+    if out != None:
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+    print('%4d  %s %s on %s (seed %s): %s' % (count, result['agent'], result['args'] or '',
+                                            result['layout'], result['seed'], result['status']))
+
+def writeTable( results, path ):
+    f = open(path, 'w')
+    try:
+        f.write('\t'.join(FIELDS) + '\n')
+        for result in results:
+            f.write('\t'.join([_cell(result[field]) for field in FIELDS]) + '\n')
+    finally:
+        f.close()
+
+def printTable( results ):
+    rows = [FIELDS] + [[_cell(result[field]) for field in FIELDS] for result in results]
+    widths = [max([len(row[i]) for row in rows]) for i in range(len(FIELDS))]
+    for row in rows:
+        print('  '.join([cell.ljust(width) for cell, width in zip(row, widths)]).rstrip())
+
+def _cell( value ):
+    if value == None: return '-'
+    return str(value)
+
+def readCommand( argv ):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python searchSweep.py -a ARGS [-a ARGS ...] -l LAYOUTS [options]')
+    parser.add_option('-p', '--pacman', dest='pacman', default='SearchAgent',
+                      help='the agent TYPE to sweep (default SearchAgent)')
+    parser.add_option('-a', '--agentArgs', dest='agentArgs', action='append', default=[],
+                      help='agent arguments, e.g. "fn=astar,heuristic=manhattanHeuristic"; repeat for more configurations')
+    parser.add_option('-l', '--layouts', dest='layouts', default='all',
+                      help='comma separated layouts, or "all" for every layout in layouts/')
+    parser.add_option('--seeds', dest='seeds', default='0',
+                      help='comma separated random seeds')
+    parser.add_option('-j', '--workers', dest='workers', type='int', default=1,
+                      help='number of processes to run searches in')
+    parser.add_option('--timeout', dest='timeout', type='float', default=60,
+                      help='seconds allowed per search')
+    parser.add_option('--checkpoint', dest='checkpoint', default='sweep-checkpoint.jsonl',
+                      help='file finished runs are appended to and resumed from')
+    parser.add_option('-o', '--output', dest='output', default='sweep-results.tsv',
+                      help='file to write the results table to')
+    options, otherjunk = parser.parse_args(argv)
+    if otherjunk: parser.error('Command line input not understood: ' + str(otherjunk))
+    if options.layouts == 'all':
+        layouts = sorted([name[:-len('.lay')] for name in os.listdir('layouts') if name.endswith('.lay')])
+    else:
+        layouts = options.layouts.split(',')
+    agents = [(options.pacman, args) for args in (options.agentArgs or [''])]
+    seeds = [int(seed) for seed in options.seeds.split(',')]
+    return options, agents, layouts, seeds
+
+if __name__ == '__main__':
+    options, agents, layouts, seeds = readCommand(sys.argv[1:])
+    results = sweep(agents, layouts, seeds, options.workers, options.timeout, options.checkpoint)
+    writeTable(results, options.output)
+    print('')
+    printTable(results)
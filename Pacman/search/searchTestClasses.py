@@ -51,49 +51,63 @@ def checkSolution(problem, path):
     state = followAction(state, action, problem)
   return problem.isGoalState(state)
 
+# Parsed graphs, by their text (see GraphSearch)
+_GRAPHS = {}
+
+def _parseGraph(graph_text):
+    "Returns (start state, goals, successors, ordered edges) of a graph specification."
+    lines = graph_text.split('\n')
+    r = re.match('start_state:(.*)', lines[0])
+    if r == None:
+        print("Broken graph:")
+        print('"""%s"""' % graph_text)
+        raise Exception("GraphSearch graph specification start_state not found or incorrect on line 0")
+    start_state = r.group(1).strip()
+    r = re.match('goal_states:(.*)', lines[1])
+    if r == None:
+        print("Broken graph:")
+        print('"""%s"""' % graph_text)
+        raise Exception("GraphSearch graph specification goal_states not found or incorrect on line 1")
+    goals = r.group(1).split()
+    goals = [str.strip(g) for g in goals]
+    successors = {}
+    all_states = set()
+    orderedSuccessorTuples = []
+    for l in lines[2:]:
+        if len(l.split()) == 3:
+            start, action, next_state = l.split()
+            cost = 1
+        elif len(l.split()) == 4:
+            start, action, next_state, cost = l.split()
+        else:
+            print("Broken graph:")
+            print('"""%s"""' % graph_text)
+            raise Exception("Invalid line in GraphSearch graph specification on line:" + l)
+        cost = float(cost)
+        orderedSuccessorTuples.append((start, action, next_state, cost))
+        all_states.add(start)
+        all_states.add(next_state)
+        if start not in successors:
+            successors[start] = []
+        successors[start].append((next_state, action, cost))
+    for s in all_states:
+        if s not in successors:
+            successors[s] = []
+    return start_state, goals, successors, orderedSuccessorTuples
+
 # Search problem on a plain graph
 class GraphSearch(SearchProblem):
 
-    # Read in the state graph; define start/end states, edges and costs
+    # Read in the state graph; define start/end states, edges and costs.
+    # The parsed graph is shared by every GraphSearch on the same text and
+    # never changed; only expanded_states belongs to this instance.
     def __init__(self, graph_text):
         self.expanded_states = []
-        lines = graph_text.split('\n')
-        r = re.match('start_state:(.*)', lines[0])
-        if r == None:
-            print("Broken graph:")
-            print('"""%s"""' % graph_text)
-            raise Exception("GraphSearch graph specification start_state not found or incorrect on line 0")
-        self.start_state = r.group(1).strip()
-        r = re.match('goal_states:(.*)', lines[1])
-        if r == None:
-            print("Broken graph:")
-            print('"""%s"""' % graph_text)
-            raise Exception("GraphSearch graph specification goal_states not found or incorrect on line 1")
-        goals = r.group(1).split()
-        self.goals = [str.strip(g) for g in goals]
-        self.successors = {}
-        all_states = set()
-        self.orderedSuccessorTuples = []
-        for l in lines[2:]:
-            if len(l.split()) == 3:
-                start, action, next_state = l.split()
-                cost = 1
-            elif len(l.split()) == 4:
-                start, action, next_state, cost = l.split()
-            else:
-                print("Broken graph:")
-                print('"""%s"""' % graph_text)
-                raise Exception("Invalid line in GraphSearch graph specification on line:" + l)
-            cost = float(cost)
-            self.orderedSuccessorTuples.append((start, action, next_state, cost))
-            all_states.add(start)
-            all_states.add(next_state)
-            if start not in self.successors:
-                self.successors[start] = []
-            self.successors[start].append((next_state, action, cost))
-        for s in all_states:
-            if s not in self.successors:
-                self.successors[s] = []
+        graph = _GRAPHS.get(graph_text)
+        if graph == None:
+            graph = _parseGraph(graph_text)
+            _GRAPHS[graph_text] = graph
+        self.start_state, self.goals, self.successors, self.orderedSuccessorTuples = graph
 
     # Get start state
     def getStartState(self):
@@ -165,6 +179,9 @@ def parseHeuristic(heuristicText):
 
 class GraphSearchTest(testClasses.TestCase):
 
+    # Graph searches only run code from search.py
+    studentModules = ['search']
+
     def __init__(self, question, testDict):
         super(GraphSearchTest, self).__init__(question, testDict)
         self.graph_text = testDict['graph']
@@ -205,6 +222,7 @@ class GraphSearchTest(testClasses.TestCase):
             grades.addMessage('FAIL: %s' % self.path)
             grades.addMessage('\t%s' % error)
             return False
+        self.expanded = len(expanded_states)
 
         if solution in gold_solution and (not self.exactExpansionOrder or expanded_states in gold_expanded_states):
             grades.addMessage('PASS: %s' % self.path)
@@ -305,6 +323,7 @@ class PacmanSearchTest(testClasses.TestCase):
         gold_expanded = max(int(solutionDict['expanded_nodes']), int(solutionDict['rev_expanded_nodes']))
 
         solution, expanded, error = self.getSolInfo(search, searchAgents)
+        self.expanded = expanded
         if error != None:
             grades.addMessage('FAIL: %s' % self.path)
             grades.addMessage('%s' % error)
@@ -393,6 +412,7 @@ class CornerProblemTest(testClasses.TestCase):
         gameState.initialize(lay, 0)
         problem = searchAgents.CornersProblem(gameState)
         path = search.bfs(problem)
+        self.expanded = problem._expanded
 
         gameState = pacman.GameState()
         gameState.initialize(lay, 0)
@@ -579,6 +599,7 @@ class HeuristicGrade(testClasses.TestCase):
         path = search.astar(problem, heuristic)
 
         expanded = problem._expanded
+        self.expanded = expanded
 
         if not checkSolution(problem, path):
             grades.addMessage('FAIL: %s' % self.path)
@@ -789,6 +810,7 @@ class CornerHeuristicPacman(testClasses.TestCase):
             grades.addMessage('FAIL: Inconsistent heuristic')
             return False
         expanded = problem._expanded
+        self.expanded = expanded
         points = 0
         for threshold in thresholds:
             if expanded <= threshold:
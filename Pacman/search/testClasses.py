@@ -144,6 +144,13 @@ class NumberPassedQuestion(Question):
 # Template modeling a generic test case
 class TestCase(object):
 
+    # Names of the student code modules the result depends on, for the
+    # autograder's result cache; None for all of them
+    studentModules = None
+    # Nodes the test's search expanded, when it counts them, for the
+    # autograder's performance log
+    expanded = None
+
     def raiseNotDefined(self):
         print('Method not implemented: %s' % inspect.stack()[1][3])
         sys.exit(1)
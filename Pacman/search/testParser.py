@@ -12,9 +12,18 @@
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
 
+import hashlib
+import os
+import pickle
 import re
 import sys
 
+# Compiled once for every file parsed
+BLANK_LINE = re.compile(r'\A\s*\Z')
+ONE_LINE = re.compile(r'\A([^"]*?):\s*"([^"]*)"\s*\Z')
+MULTILINE_START = re.compile(r'\A([^"]*?):\s*"""\s*\Z')
+MULTILINE_END = re.compile(r'\A\s*"""\s*\Z')
+
 class TestParser(object):
 
     def __init__(self, path):
@@ -34,9 +43,12 @@ class TestParser(object):
 
     def parse(self):
         # read in the test case and remove comments
-        test = {}
         with open(self.path) as handle:
-            raw_lines = handle.read().split('\n')
+            return self.parseText(handle.read())
+
+    def parseText(self, text):
+        test = {}
+        raw_lines = text.split('\n')
 
         test_text = self.removeComments(raw_lines)
         test['__raw_lines__'] = raw_lines
@@ -47,21 +59,21 @@ class TestParser(object):
         # read a property in each loop cycle
         while(i < len(lines)):
             # skip blank lines
-            if re.match('\A\s*\Z', lines[i]):
+            if BLANK_LINE.match(lines[i]):
                 test['__emit__'].append(("raw", raw_lines[i]))
                 i += 1
                 continue
-            m = re.match('\A([^"]*?):\s*"([^"]*)"\s*\Z', lines[i])
+            m = ONE_LINE.match(lines[i])
             if m:
                 test[m.group(1)] = m.group(2)
                 test['__emit__'].append(("oneline", m.group(1)))
                 i += 1
                 continue
-            m = re.match('\A([^"]*?):\s*"""\s*\Z', lines[i])
+            m = MULTILINE_START.match(lines[i])
             if m:
                 msg = []
                 i += 1
-                while(not re.match('\A\s*"""\s*\Z', lines[i])):
+                while(not MULTILINE_END.match(lines[i])):
                     msg.append(raw_lines[i])
                     i += 1
                 test[m.group(1)] = '\n'.join(msg)
@@ -73,6 +85,77 @@ class TestParser(object):
         return test
 
 
+CACHE_FILE = '.parsed-tests.pickle' # Kept in the test root
+CACHE_VERSION = 1
+
+class ParseCache(object):
+    """
+    Parsed test, solution and CONFIG files, kept between autograder runs in
+    a pickle.  A file whose modification time and size are unchanged is
+    not read at all; one that was touched is read and hashed, and only
+    parsed again if its contents changed.  Each parse returns a fresh
+    top-level dict, so callers may add keys to it.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {} # file path -> (mtime, size, sha1, parsed dict)
+        self.changed = False
+        if path != None: self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as handle:
+                version, entries = pickle.load(handle)
+            if version == CACHE_VERSION: self.entries = entries
+        except Exception:
+            # Missing, cut short or from another version: start afresh
+            self.entries = {}
+
+    def save(self):
+        if self.path == None or not self.changed: return
+        temporary = '%s.%d' % (self.path, os.getpid())
+        try:
+            with open(temporary, 'wb') as handle:
+                pickle.dump((CACHE_VERSION, self.entries), handle, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path)
+            self.changed = False
+        except (IOError, OSError):
+            # A read-only test tree still grades, just without the cache
+            if os.path.exists(temporary): os.remove(temporary)
+
+    def parse(self, path):
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry != None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return dict(entry[3])
+        with open(path, 'rb') as handle:
+            data = handle.read()
+        digest = hashlib.sha1(data).hexdigest()
+        if entry != None and entry[2] == digest:
+            parsed = entry[3]
+        else:
+            # Decoded as open() in text mode would, universal newlines included
+            text = data.decode().replace('\r\n', '\n').replace('\r', '\n')
+            parsed = TestParser(path).parseText(text)
+        self.entries[path] = (stat.st_mtime_ns, stat.st_size, digest, parsed)
+        self.changed = True
+        return dict(parsed)
+
+_CACHE = ParseCache()
+
+def loadCache(path):
+    "Parses through the cache kept at path from now on."
+    global _CACHE
+    _CACHE = ParseCache(path)
+
+def saveCache():
+    _CACHE.save()
+
+def parseFile(path):
+    "Returns the parsed dict of a test, solution or CONFIG file."
+    return _CACHE.parse(path)
+
+
 def emitTestDict(testDict, handle):
     for kind, data in testDict['__emit__']:
         if kind == "raw":
@@ -0,0 +1,74 @@
+# test_recording.py
+# -----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Checks that recordings of games played with fewer ghosts than their layout
+has (pacman.py -k) replay to the outcomes they recorded.
+
+  python -m unittest test_recording
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import layout
+import pacman
+import recording
+import textDisplay
+from ghostAgents import RandomGhost
+from pacmanAgents import GreedyAgent
+
+class FewerGhostsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.layout = layout.getLayout('mediumClassic')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def playGame(self, seed, recorder=None):
+        "Plays mediumClassic with one ghost, as pacman.py -k 1 does."
+        rules = pacman.ClassicGameRules()
+        rules.quiet = True
+        game = rules.newGame(self.layout, GreedyAgent(), [RandomGhost(1)], textDisplay.NullGraphics(),
+                             True, rng=pacman.seedGame(seed, 0))
+        game.recorder = recorder
+        game.run()
+        if recorder != None: recorder.close(game.state)
+        return game
+
+    def testStreamedRecordingVerifies(self):
+        for seed in range(3):
+            path = os.path.join(self.directory, 'streamed-%d' % seed)
+            game = self.playGame(seed, recording.RecordingWriter(path, self.layout, 2))
+            moves, problem = recording.verifyRecording(path)
+            self.assertEqual(problem, None)
+            self.assertEqual(moves, len(game.moveHistory))
+            recorded = recording.loadRecording(path)
+            self.assertEqual(recorded.numAgents, 2)
+            self.assertEqual(recorded.stateAt(len(recorded.actions)), game.state)
+
+    def testRewrittenRecordingVerifies(self):
+        # What runGamesInParallel does with the games its workers send back
+        for seed in range(3):
+            path = os.path.join(self.directory, 'rewritten-%d' % seed)
+            game = self.playGame(seed)
+            recording.writeRecording(path, self.layout, game.moveHistory, game.state.getNumAgents())
+            self.assertEqual(recording.verifyRecording(path), (len(game.moveHistory), None))
+
+if __name__ == '__main__':
+    unittest.main()
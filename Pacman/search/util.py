@@ -29,6 +29,7 @@
 import sys
 import inspect
 import heapq, random
+import sampling
 
 
 class FixedRandom:
@@ -472,39 +473,22 @@ def normalize(vectorOrCounter):
         if s == 0: return vector
         return [el / s for el in vector]
 
-def nSample(distribution, values, n):
-    if sum(distribution) != 1:
-        distribution = normalize(distribution)
-    rand = [random.random() for i in range(n)]
-    rand.sort()
-    samples = []
-    samplePos, distPos, cdf = 0,0, distribution[0]
-    while samplePos < n:
-        if rand[samplePos] < cdf:
-            samplePos += 1
-            samples.append(values[distPos])
-        else:
-            distPos += 1
-            cdf += distribution[distPos]
-    return samples
-
-def sample(distribution, values = None):
-    if type(distribution) == Counter:
-        items = sorted(distribution.items())
-        distribution = [i[1] for i in items]
-        values = [i[0] for i in items]
-    if sum(distribution) != 1:
-        distribution = normalize(distribution)
-    choice = random.random()
-    i, total= 0, distribution[0]
-    while choice > total:
-        i += 1
-        total += distribution[i]
-    return values[i]
-
-def sampleFromCounter(ctr):
-    items = sorted(ctr.items())
-    return sample([v for k,v in items], [k for k,v in items])
+def nSample(distribution, values, n, rng = None):
+    "Returns n independent samples from a list of probabilities over values."
+    return sampling.getTable(distribution, values).sampleMany(n, rng)
+
+def sample(distribution, values = None, rng = None):
+    """
+    Samples a value from a distribution (a Counter, or a list of
+    probabilities with a matching list of values).  Randomness is drawn from
+    rng, a random.Random stream, or from the random module if rng is None;
+    the same holds for the other sampling functions below.  Samples come
+    from alias tables, which are cached by distribution (see sampling.py).
+    """
+    return sampling.tableFor(distribution, values).sample(rng)
+
+def sampleFromCounter(ctr, rng = None):
+    return sampling.tableFor(ctr).sample(rng)
 
 def getProbability(value, distribution, values):
     """
@@ -517,19 +501,27 @@ def getProbability(value, distribution, values):
             total += prob
     return total
 
-def flipCoin( p ):
-    r = random.random()
+def flipCoin( p, rng = None ):
+    if rng == None: rng = random
+    r = rng.random()
     return r < p
 
-def chooseFromDistribution( distribution ):
+def chooseFromDistribution( distribution, rng = None ):
     "Takes either a counter or a list of (prob, key) pairs and samples"
     if type(distribution) == dict or type(distribution) == Counter:
-        return sample(distribution)
-    r = random.random()
-    base = 0.0
-    for prob, element in distribution:
-        base += prob
-        if r <= base: return element
+        return sample(distribution, rng = rng)
+    return sampling.getTable([prob for prob, element in distribution],
+                             [element for prob, element in distribution]).sample(rng)
+
+def randomStream( masterSeed, index, name = '' ):
+    """
+    Returns a random.Random seeded from (masterSeed, index, name).  Streams
+    for different indices or names are independent of each other, and the
+    same triple gives the same stream in any process, so game i of a run
+    draws the same numbers whether the games are played one after another,
+    interleaved or in parallel.
+    """
+    return random.Random('%s-%s-%s' % (masterSeed, index, name))
 
 def nearestPoint( pos ):
     """
@@ -599,46 +591,241 @@ def pause():
 
 # code to handle timeouts
 #
-# FIXME
-# NOTE: TimeoutFuncton is NOT reentrant.  Later timeouts will silently
-# disable earlier timeouts.  Could be solved by maintaining a global list
-# of active time outs.  Currently, questions which have test cases calling
-# this have all student code so wrapped.
+# Deadlines nest: every thread keeps a stack of the deadlines it is inside
+# and only the earliest of them is armed.  On the main thread the armed
+# deadline is enforced with a real-time interval timer (SIGALRM, with
+# sub-millisecond resolution).  Other threads are interrupted by a watchdog
+# thread that raises TimeoutFunctionException in them.  Where neither is
+# available, a deadline is checked when the code it guards returns.
 #
 import signal
 import time
+import threading
+try:
+    import ctypes
+except ImportError:
+    ctypes = None
+
 class TimeoutFunctionException(Exception):
     """Exception to raise on a timeout"""
     pass
 
+NO_DEADLINE = float('inf')
+# An expired deadline fires again this often until its block is left, so
+# code that swallows the exception cannot outlive the deadline
+EXPIRED_RETRY = 0.01
+_THREAD_DEADLINES = threading.local()
+
+def _deadlineStack():
+    """
+    Returns the calling thread's stack of active Deadlines, choosing on
+    first use how the thread's deadlines are enforced.
+    """
+    try:
+        return _THREAD_DEADLINES.stack
+    except AttributeError:
+        _THREAD_DEADLINES.stack = []
+        if hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread():
+            _THREAD_DEADLINES.timer = _SignalTimer()
+        elif ctypes != None and hasattr(ctypes, 'pythonapi'):
+            _THREAD_DEADLINES.timer = _WATCHDOG
+        else:
+            _THREAD_DEADLINES.timer = None
+        return _THREAD_DEADLINES.stack
+
+class Deadline:
+    """
+    A context manager that raises TimeoutFunctionException inside the block
+    it guards once seconds (a float; None, zero or less for no limit, as with
+    signal.alarm) have passed:
+
+      with Deadline(0.25):
+          action = agent.getAction(state)
+
+    Deadlines nest, and an inner deadline never extends an outer one.  An
+    outer deadline that expires inside an inner block propagates out of it
+    like any other exception; if the inner code swallows it, it is raised
+    again every EXPIRED_RETRY seconds until the outer block is left.  After
+    the block, timedOut tells whether this deadline is the one that expired.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expiresAt = NO_DEADLINE
+        self.ownExpiry = NO_DEADLINE
+        self.timedOut = False
+
+    def remaining(self):
+        "Seconds left before this deadline (or an enclosing one) expires."
+        return self.expiresAt - time.perf_counter()
+
+    def __enter__(self):
+        stack = _deadlineStack()
+        outer = NO_DEADLINE
+        if stack: outer = stack[-1].expiresAt
+        if self.seconds != None and self.seconds > 0:
+            self.ownExpiry = time.perf_counter() + self.seconds
+        self.expiresAt = min(outer, self.ownExpiry)
+        self.timedOut = False
+        stack.append(self)
+        timer = _THREAD_DEADLINES.timer
+        if timer != None and (len(stack) == 1 or self.expiresAt < outer):
+            timer.arm(self.expiresAt)
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        stack = _deadlineStack()
+        stack.pop()
+        now = time.perf_counter()
+        timer = _THREAD_DEADLINES.timer
+        if timer != None:
+            if not stack:
+                timer.disarm()
+            elif stack[-1].expiresAt != self.expiresAt:
+                timer.arm(stack[-1].expiresAt)
+        if excType == None:
+            if now >= self.expiresAt and timer == None:
+                self.timedOut = now >= self.ownExpiry
+                raise TimeoutFunctionException()
+        elif issubclass(excType, TimeoutFunctionException):
+            self.timedOut = now >= self.ownExpiry
+        return False
+
+class _SignalTimer:
+    """
+    Enforces the main thread's deadlines with ITIMER_REAL.  The previous
+    SIGALRM handler is put back whenever no deadline is active.
+    """
+    def __init__(self):
+        self.oldHandler = None
+        self.installed = False
+
+    def arm(self, when):
+        if not self.installed:
+            self.oldHandler = signal.signal(signal.SIGALRM, self.handleAlarm)
+            self.installed = True
+        if when == NO_DEADLINE:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        else:
+            delay = when - time.perf_counter()
+            if delay <= 0: delay = EXPIRED_RETRY
+            signal.setitimer(signal.ITIMER_REAL, delay)
+
+    def disarm(self):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        if self.installed:
+            signal.signal(signal.SIGALRM, self.oldHandler)
+            self.installed = False
+
+    def handleAlarm(self, signum, frame):
+        stack = _THREAD_DEADLINES.stack
+        if not stack: return
+        self.arm(stack[-1].expiresAt)
+        if time.perf_counter() >= stack[-1].expiresAt:
+            raise TimeoutFunctionException()
+
+class _Watchdog:
+    """
+    Enforces the deadlines of threads other than the main one: a daemon
+    thread sleeps until the earliest armed deadline and then raises
+    TimeoutFunctionException in the thread that owns it.  The exception is
+    delivered between bytecodes, so a thread blocked in a C call only sees
+    it once the call returns.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.deadlines = {} # thread ident -> expiry time
+        self.thread = None
+
+    def arm(self, when):
+        with self.condition:
+            ident = threading.get_ident()
+            if when == NO_DEADLINE:
+                self.deadlines.pop(ident, None)
+            else:
+                self.deadlines[ident] = when
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.run, name='deadline-watchdog')
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    def disarm(self):
+        with self.condition:
+            ident = threading.get_ident()
+            self.deadlines.pop(ident, None)
+            # Cancel an exception raised just before the deadline was left
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident), None)
+
+    def run(self):
+        with self.condition:
+            while True:
+                now = time.perf_counter()
+                for ident, when in list(self.deadlines.items()):
+                    if when <= now:
+                        self.deadlines[ident] = now + EXPIRED_RETRY
+                        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident),
+                                                                   ctypes.py_object(TimeoutFunctionException))
+                if self.deadlines:
+                    self.condition.wait(min(self.deadlines.values()) - now)
+                else:
+                    self.condition.wait()
+
+_WATCHDOG = _Watchdog()
+
+def forgetDeadlines():
+    """
+    Drops the calling thread's deadlines without enforcing them.  A process
+    forked inside a Deadline block calls this first: the interval timer is
+    not inherited across fork, so the copied deadlines would never fire.
+    """
+    stack = _deadlineStack()
+    del stack[:]
+    if _THREAD_DEADLINES.timer != None: _THREAD_DEADLINES.timer.disarm()
 
 class TimeoutFunction:
+    """
+    Wraps function so that calls raise TimeoutFunctionException after
+    timeout seconds.  The timeout may be fractional and calls may nest;
+    see Deadline.
+    """
     def __init__(self, function, timeout):
         self.timeout = timeout
         self.function = function
 
-    def handle_timeout(self, signum, frame):
-        raise TimeoutFunctionException()
-
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
-            old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
-            try:
-                result = self.function(*args, **keyArgs)
-            finally:
-                signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
-        else:
-            startTime = time.time()
-            result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
-                self.handle_timeout(None, None)
-        return result
+        with Deadline(self.timeout):
+            return self.function(*args, **keyArgs)
+
+def timeoutOverhead(trials=100000):
+    """
+    Microbenchmark of the timeout machinery.  Returns a dict mapping each
+    case to the seconds it adds per call, over an untimed call.
+    """
+    def noop(): pass
+    def perCall(run):
+        start = time.perf_counter()
+        run()
+        return (time.perf_counter() - start) / trials
+    def plain():
+        for i in range(trials): noop()
+    def timed():
+        timedNoop = TimeoutFunction(noop, 60)
+        for i in range(trials): timedNoop()
+    def nested():
+        timedNoop = TimeoutFunction(noop, 60)
+        with Deadline(120):
+            for i in range(trials): timedNoop()
+    def inThread(run):
+        result = []
+        worker = threading.Thread(target=lambda: result.append(perCall(run)))
+        worker.start()
+        worker.join()
+        return result[0]
+    base = perCall(plain)
+    return {'main thread': perCall(timed) - base,
+            'main thread, nested': perCall(nested) - base,
+            'worker thread': inThread(timed) - inThread(plain),
+            'worker thread, nested': inThread(nested) - inThread(plain)}
 
 
 
@@ -670,3 +857,6 @@ def unmutePrint():
     sys.stdout = _ORIGINAL_STDOUT
     #sys.stderr = _ORIGINAL_STDERR
 
+if __name__ == '__main__':
+    for case, overhead in sorted(timeoutOverhead().items()):
+        print('%-22s %6.2f us per call' % (case, overhead * 1e6))